@@ -17,4 +17,9 @@ export function setupWebSocket(server) {
   //     // 文字起こし結果をリアルタイムで返す
   //   });
   // });
+  //
+  // ジョブの進捗・完了通知: Worker がユーザーごとのチャンネル events:user:{userId} に
+  // JSON イベント（stage.started / stage.finished / entry.done / entry.failed /
+  // summary.ready / summary.failed）を publish する（worker/app/events.py）
+  // 接続ユーザーのチャンネルを SUBSCRIBE してそのまま ws.send すればポーリングは不要になる
 }
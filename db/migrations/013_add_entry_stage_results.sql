@@ -0,0 +1,14 @@
+-- 再処理用: ステージ別の解析結果と入力フィンガープリント
+-- 入力（マスク済みテキスト・辞書バージョン・プロンプト・モデル）が変わっていないステージは再実行をスキップする
+
+CREATE TABLE IF NOT EXISTS entry_stage_results (
+  id INT PRIMARY KEY AUTO_INCREMENT,
+  entry_id INT NOT NULL,
+  stage VARCHAR(32) NOT NULL COMMENT 'tags / ng / speech / emotion / keywords / summary / actions',
+  fingerprint CHAR(64) NOT NULL COMMENT '入力フィンガープリント（SHA-256）',
+  output JSON COMMENT 'ステージ出力',
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  FOREIGN KEY (entry_id) REFERENCES entries(id) ON DELETE CASCADE,
+  UNIQUE KEY unique_entry_stage (entry_id, stage),
+  INDEX idx_stage (stage)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
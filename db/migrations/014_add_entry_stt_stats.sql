@@ -0,0 +1,8 @@
+-- STT前処理（16kHz モノラル化・無音短縮）の効果測定用
+-- 送信サイズと削減バイト数、文字起こしにかかった時間をエントリごとに記録する
+
+ALTER TABLE entries
+  ADD COLUMN stt_upload_bytes INT NULL COMMENT 'STTに送信した音声のバイト数',
+  ADD COLUMN stt_bytes_saved INT NULL COMMENT '前処理で削減したバイト数（前処理なしは NULL）',
+  ADD COLUMN stt_trimmed_ms INT NULL COMMENT '無音除去で短縮した長さ（ミリ秒）',
+  ADD COLUMN stt_latency_ms INT NULL COMMENT '文字起こしの所要時間（ミリ秒）';
@@ -0,0 +1,21 @@
+-- OpenAI の使用量アカウンティング
+-- プロバイダ呼び出しごとのトークン数・所要時間・推定コストをジョブ種別・ユーザー・ステージ別に記録する
+
+CREATE TABLE IF NOT EXISTS openai_usage (
+  id BIGINT PRIMARY KEY AUTO_INCREMENT,
+  job_type VARCHAR(64) NULL COMMENT 'process_entry / process_range_summary など',
+  job_id VARCHAR(64) NULL COMMENT 'entryId / summaryId など',
+  user_id INT NULL,
+  stage VARCHAR(32) NOT NULL COMMENT 'stt / summary / emotion / custom_summary など',
+  operation VARCHAR(16) NOT NULL COMMENT 'chat / stt',
+  model VARCHAR(64) NOT NULL,
+  prompt_tokens INT NOT NULL DEFAULT 0,
+  completion_tokens INT NOT NULL DEFAULT 0,
+  request_bytes INT NULL COMMENT 'STTで送信した音声のバイト数',
+  duration_ms INT NOT NULL,
+  cost_usd DECIMAL(12, 6) NULL COMMENT '推定コスト（単価不明のモデルは NULL）',
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_user_created (user_id, created_at),
+  INDEX idx_stage_created (stage, created_at),
+  INDEX idx_job_type_created (job_type, created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,6 @@
+-- エントリ処理ロックのフェンシングトークン
+-- リースを失った Worker の遅れた書き込みで新しい結果を上書きしないよう、
+-- 最終書き込み時にトークンを記録し、それより古いトークンの書き込みは無視する
+
+ALTER TABLE entries
+  ADD COLUMN lock_token BIGINT NULL COMMENT '最後に結果を書き込んだ処理のフェンシングトークン';
@@ -0,0 +1,5 @@
+-- OpenAI 使用量の推定値フラグ
+-- ストリーミング応答は使用量を返さないため、トークン数を手元で数えた行を区別する
+
+ALTER TABLE openai_usage
+  ADD COLUMN tokens_estimated TINYINT(1) NOT NULL DEFAULT 0 COMMENT 'トークン数が推定値か（ストリーミング応答）';
@@ -2,6 +2,8 @@
 from typing import List, Dict, Any
 import openai
 from .config import get_openai_api_key
+from .usage import track_call
+from .circuit import CircuitOpenError, get_breaker
 
 
 class ActionExtractor:
@@ -24,24 +26,28 @@ class ActionExtractor:
             return []
 
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Extract action items from the text. Return JSON array with: description, priority (high/medium/low), deadline (if mentioned)."
-                    },
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.3,
-                max_tokens=500
-            )
+            with get_breaker("chat").guard(), track_call("chat", "gpt-3.5-turbo") as call:
+                response = openai.ChatCompletion.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Extract action items from the text. Return JSON array with: description, priority (high/medium/low), deadline (if mentioned)."
+                        },
+                        {"role": "user", "content": text}
+                    ],
+                    temperature=0.3,
+                    max_tokens=500
+                )
+                call.response = response
             
             # Parse response
             content = response.choices[0].message.content
             # Basic parsing - in real implementation, use proper JSON parsing
             return self._parse_actions(content)
             
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"Error extracting actions: {e}")
             return []
@@ -0,0 +1,205 @@
+"""
+音声エンハンス用のプロセスプール
+
+AUDIO_ENHANCEMENT の変換処理（デコード・フィルタ・エンコード）をメインループから切り離し、
+専用の子プロセスで実行する。メインループは投入だけ行い、他のジョブ種別を処理し続ける。
+
+- キューは上限付き（満杯なら submit が None を返し、呼び出し側で再キューする）
+- submit は Future を返し、タスクの例外は Future に入る（呼び出し側でリトライ・退避を判断する）
+- タスクは投入時のコンテキスト（キャンセル・使用量のジョブID など）で実行し、
+  tracker（BusyTracker）を渡すと実行時間を稼働時間に含める
+- ディスパッチャスレッドが1タスクずつ子プロセス（spawn）を起動する
+- 子プロセスとのデータ受け渡しは一時ファイル経由（大きな音声をパイプで pickle しない）
+- タスクごとにメモリ上限（RLIMIT_AS）と実行時間上限を適用し、超過したら強制終了する
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextvars import copy_context
+
+from app.config import get_audio_pool_settings
+
+_INFO_FILE = 'info.json'
+_ERROR_FILE = 'error.txt'
+_INPUT_FILE = 'input'
+
+
+class AudioTaskError(Exception):
+    """子プロセスでのエンハンス処理の失敗（メモリ・時間超過を含む）"""
+
+
+def _enhance_in_child(workdir, enhancement_types, source_format, export_format, memory_limit):
+    """子プロセス側: 一時ファイルから読み込み、バリアントを一時ファイルに書き出す"""
+    try:
+        from app.audio_processor import process_variants, DEFAULT_EXPORT_FORMAT
+
+        # ライブラリの読み込み後に上限を設定（処理中の確保だけを制限する）
+        if memory_limit:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+        with open(os.path.join(workdir, _INPUT_FILE), 'rb') as f:
+            audio_bytes = f.read()
+        variants, info = process_variants(audio_bytes, enhancement_types, source_format,
+                                         export_format or DEFAULT_EXPORT_FORMAT)
+        del audio_bytes
+
+        for enhancement_type, data in variants.items():
+            with open(os.path.join(workdir, f'{enhancement_type}.out'), 'wb') as f:
+                f.write(data)
+        with open(os.path.join(workdir, _INFO_FILE), 'w') as f:
+            json.dump(info, f)
+    except MemoryError:
+        _write_error(workdir, f"memory limit exceeded ({memory_limit} bytes)")
+        os._exit(1)
+    except Exception as e:
+        _write_error(workdir, f"{type(e).__name__}: {e}")
+        os._exit(1)
+
+
+def _write_error(workdir, message):
+    try:
+        with open(os.path.join(workdir, _ERROR_FILE), 'w') as f:
+            f.write(message)
+    except OSError:
+        pass
+
+
+class AudioPool:
+    """
+    子プロセスで音声エンハンスを実行するプール
+
+    Args:
+        workers: 同時に実行する子プロセス数（ディスパッチャスレッド数）
+        max_queue: 待機できるタスク数の上限
+        memory_limit_mb: 子プロセスのアドレス空間上限（MB、0 で無制限）
+        timeout_sec: 子プロセスの実行時間上限（秒）
+        tmp_dir: 一時ファイルの置き場所（省略時はシステムの一時ディレクトリ）
+        tracker: 実行時間を数える BusyTracker（件数は投入したジョブの側で数える）
+    """
+
+    def __init__(self, workers=2, max_queue=4, memory_limit_mb=1024, timeout_sec=300, tmp_dir=None,
+                 tracker=None):
+        self.workers = workers
+        self.tracker = tracker
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else 0
+        self.timeout_sec = timeout_sec
+        self.tmp_dir = tmp_dir
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._threads = []
+
+    @classmethod
+    def from_env(cls, tracker=None):
+        """環境変数から作成（AUDIO_POOL_WORKERS=0 なら None = インライン実行）"""
+        settings = get_audio_pool_settings()
+        if settings['workers'] <= 0:
+            return None
+        return cls(tracker=tracker, **settings).start()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._dispatch_loop, name=f'audio-pool-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, fn, *args, wait=1.0):
+        """
+        タスクを投入（fn(*args) は投入時のコンテキストでディスパッチャスレッドが実行する）
+
+        Args:
+            wait: キューが満杯のときに待つ秒数
+
+        Returns:
+            結果・例外が入る Future、キューが満杯なら None
+        """
+        future = Future()
+        try:
+            self._queue.put((future, copy_context(), fn, args), timeout=wait)
+        except queue.Full:
+            return None
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def shutdown(self, wait=True):
+        """投入済みタスクの完了後にディスパッチャを停止"""
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def _dispatch_loop(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, ctx, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.tracker is None:
+                    result = ctx.run(fn, *args)
+                else:
+                    with self.tracker.busy(count=False):
+                        result = ctx.run(fn, *args)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def process(self, audio_bytes, enhancement_types, source_format=None, export_format=None):
+        """
+        子プロセスで process_variants を実行（メモリ・時間上限付き）
+
+        Returns:
+            (エンハンス種別 -> エンコード済みデータ, 元音声の情報)
+
+        Raises:
+            AudioTaskError: 子プロセスが失敗・タイムアウト・強制終了した場合
+        """
+        workdir = tempfile.mkdtemp(prefix='audio-task-', dir=self.tmp_dir)
+        try:
+            with open(os.path.join(workdir, _INPUT_FILE), 'wb') as f:
+                f.write(audio_bytes)
+
+            proc = self._ctx.Process(
+                target=_enhance_in_child,
+                args=(workdir, list(enhancement_types), source_format, export_format, self.memory_limit),
+            )
+            proc.start()
+            proc.join(self.timeout_sec)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join(5)
+                if proc.is_alive():
+                    proc.kill()
+                    proc.join()
+                raise AudioTaskError(f"timed out after {self.timeout_sec}s")
+
+            if proc.exitcode != 0:
+                error_path = os.path.join(workdir, _ERROR_FILE)
+                if os.path.exists(error_path):
+                    with open(error_path) as f:
+                        raise AudioTaskError(f.read())
+                raise AudioTaskError(f"worker process exited with code {proc.exitcode}")
+
+            with open(os.path.join(workdir, _INFO_FILE)) as f:
+                info = json.load(f)
+            variants = {}
+            for enhancement_type in enhancement_types:
+                with open(os.path.join(workdir, f'{enhancement_type}.out'), 'rb') as f:
+                    variants[enhancement_type] = f.read()
+            return variants, info
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
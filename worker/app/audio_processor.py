@@ -1,68 +1,88 @@
 """
 Phase 4.3: 音声品質向上処理
 FFmpeg + pydub を使用したノイズ除去・正規化・エンハンス
+
+音声は1回だけデコードして PCM バッファ（AudioSegment）として保持し、
+エンハンス種別ごとのフィルタチェーンを適用して複数のバリアントを1ジョブで出力する。
+共通する前段のフィルタ結果（例: denoise と enhance のハイパス/ローパス）は使い回す。
+
+フィルタのバックエンドは "numpy"（app.dsp のベクトル化実装、デフォルト）と
+"pydub"（pydub.effects）から選択できる（引数 backend または環境変数 AUDIO_DSP_BACKEND）。
 """
 
 from pydub import AudioSegment
 from pydub.effects import normalize, compress_dynamic_range
 import io
+import math
+
+from app import dsp
+from app.config import get_audio_dsp_backend
+
+# フィルタ定義: (フィルタ名, パラメータ)
+HIGH_PASS = ('high_pass', 100)
+LOW_PASS = ('low_pass', 8000)
+COMPRESS = ('compress', (-20.0, 4.0))
+NORMALIZE = ('normalize', None)
+GAIN = ('gain', 2)
+
+# エンハンス種別 -> フィルタチェーン
+ENHANCEMENT_CHAINS = {
+    'denoise': (HIGH_PASS, LOW_PASS),
+    'normalize': (NORMALIZE,),
+    'enhance': (HIGH_PASS, LOW_PASS, COMPRESS, NORMALIZE, GAIN),
+}
+
+# エンハンス種別 -> 出力ビットレート
+EXPORT_BITRATES = {
+    'denoise': '128k',
+    'normalize': '128k',
+    'enhance': '192k',
+}
 
-def denoise_audio(audio_bytes: bytes) -> bytes:
+DEFAULT_EXPORT_FORMAT = 'mp3'
+
+DSP_BACKENDS = ('numpy', 'pydub')
+
+
+def _apply_filter(audio, spec):
+    name, param = spec
+    if name == 'high_pass':
+        return audio.high_pass_filter(param)
+    if name == 'low_pass':
+        return audio.low_pass_filter(param)
+    if name == 'compress':
+        threshold, ratio = param
+        return compress_dynamic_range(audio, threshold=threshold, ratio=ratio)
+    if name == 'normalize':
+        return normalize(audio)
+    if name == 'gain':
+        return audio + param
+    raise ValueError(f"unknown filter: {name}")
+
+
+def decode_audio(audio_bytes: bytes, format: str = None) -> AudioSegment:
     """
-    ノイズ除去（高周波ノイズリダクション）
-    
+    音声データをデコードしてPCMバッファ（AudioSegment）にする
+
     Args:
         audio_bytes: 元の音声データ
-    
-    Returns:
-        ノイズ除去後の音声データ
+        format: コンテナ形式のヒント（拡張子、省略時は自動判定）
     """
-    audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    audio = audio.high_pass_filter(100)
-    audio = audio.low_pass_filter(8000)
-    
-    output = io.BytesIO()
-    audio.export(output, format='mp3', bitrate='128k')
-    return output.getvalue()
+    return AudioSegment.from_file(io.BytesIO(audio_bytes), format=format)
 
-def normalize_audio(audio_bytes: bytes) -> bytes:
-    """
-    音量正規化（最大音量を0dBに調整）
-    """
-    audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    normalized = normalize(audio)
-    
-    output = io.BytesIO()
-    normalized.export(output, format='mp3', bitrate='128k')
-    return output.getvalue()
 
-def enhance_audio(audio_bytes: bytes) -> bytes:
-    """
-    音声エンハンス（ノイズ除去 + 正規化 + ダイナミックレンジ圧縮）
-    """
-    audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    
-    # ノイズ除去
-    audio = audio.high_pass_filter(100)
-    audio = audio.low_pass_filter(8000)
-    
-    # ダイナミックレンジ圧縮
-    audio = compress_dynamic_range(audio, threshold=-20.0, ratio=4.0)
-    
-    # 正規化
-    audio = normalize(audio)
-    
-    # ゲイン追加
-    audio = audio + 2  # +2dB
-    
+def encode_audio(audio: AudioSegment, format: str = DEFAULT_EXPORT_FORMAT, bitrate: str = None) -> bytes:
+    """PCMバッファをエンコード"""
     output = io.BytesIO()
-    audio.export(output, format='mp3', bitrate='192k')
+    if bitrate:
+        audio.export(output, format=format, bitrate=bitrate)
+    else:
+        audio.export(output, format=format)
     return output.getvalue()
 
-def get_audio_info(audio_bytes: bytes) -> dict:
-    """音声ファイルの情報を取得"""
-    audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    
+
+def audio_info(audio: AudioSegment) -> dict:
+    """デコード済みバッファから音声情報を取得"""
     return {
         'duration_ms': len(audio),
         'duration_seconds': len(audio) / 1000.0,
@@ -72,3 +92,175 @@ def get_audio_info(audio_bytes: bytes) -> dict:
         'dBFS': audio.dBFS,
         'max_dBFS': audio.max_dBFS
     }
+
+
+def _run_chains(initial, enhancement_types, apply):
+    """チェーン接頭辞ごとの結果をメモ化しながら各種別のフィルタチェーンを適用"""
+    stages = {(): initial}
+    results = {}
+    for enhancement_type in enhancement_types:
+        chain = ENHANCEMENT_CHAINS[enhancement_type]
+        current = initial
+        for i, spec in enumerate(chain):
+            prefix = chain[:i + 1]
+            if prefix not in stages:
+                stages[prefix] = apply(current, spec)
+            current = stages[prefix]
+        results[enhancement_type] = current
+    return results
+
+
+def _resolve_backend(backend):
+    backend = backend or get_audio_dsp_backend()
+    if backend not in DSP_BACKENDS:
+        raise ValueError(f"unknown DSP backend: {backend}")
+    return backend
+
+
+def apply_enhancements(audio: AudioSegment, enhancement_types, backend: str = None) -> dict:
+    """
+    デコード済みバッファに種別ごとのフィルタチェーンを適用
+
+    共通の前段（チェーンの接頭辞）は1回だけ計算する
+
+    Args:
+        audio: デコード済みバッファ
+        enhancement_types: エンハンス種別のリスト
+        backend: "numpy" / "pydub"（省略時は AUDIO_DSP_BACKEND）
+
+    Returns:
+        エンハンス種別 -> 処理後の AudioSegment
+    """
+    for enhancement_type in enhancement_types:
+        if enhancement_type not in ENHANCEMENT_CHAINS:
+            raise ValueError(f"unknown enhancement type: {enhancement_type}")
+
+    if _resolve_backend(backend) == 'pydub':
+        return _run_chains(audio, enhancement_types, _apply_filter)
+
+    # numpy: float 配列への変換は1回だけ行い、最後に AudioSegment へ戻す
+    samples, rate = dsp.segment_to_array(audio)
+    results = _run_chains(samples, enhancement_types, lambda x, spec: dsp.apply_filter(x, spec, rate))
+    return {
+        enhancement_type: dsp.array_to_segment(result, audio)
+        for enhancement_type, result in results.items()
+    }
+
+
+def process_variants(audio_bytes: bytes, enhancement_types, source_format: str = None,
+                     export_format: str = DEFAULT_EXPORT_FORMAT, backend: str = None):
+    """
+    1回のデコードで複数のエンハンスバリアントと音声情報を生成
+
+    Args:
+        audio_bytes: 元の音声データ
+        enhancement_types: エンハンス種別のリスト（denoise / normalize / enhance）
+        source_format: 入力形式のヒント
+        export_format: 出力形式
+        backend: DSPバックエンド（"numpy" / "pydub"）
+
+    Returns:
+        (エンハンス種別 -> エンコード済みデータ, 元音声の情報)
+    """
+    audio = decode_audio(audio_bytes, source_format)
+    info = audio_info(audio)
+    variants = apply_enhancements(audio, enhancement_types, backend)
+    encoded = {
+        enhancement_type: encode_audio(segment, export_format, EXPORT_BITRATES.get(enhancement_type))
+        for enhancement_type, segment in variants.items()
+    }
+    return encoded, info
+
+
+def denoise_audio(audio_bytes: bytes, backend: str = None) -> bytes:
+    """
+    ノイズ除去（高周波ノイズリダクション）
+
+    Args:
+        audio_bytes: 元の音声データ
+        backend: DSPバックエンド（"numpy" / "pydub"）
+
+    Returns:
+        ノイズ除去後の音声データ
+    """
+    return enhance_audio(audio_bytes, 'denoise', backend)
+
+def normalize_audio(audio_bytes: bytes, backend: str = None) -> bytes:
+    """
+    音量正規化（最大音量を0dBに調整）
+    """
+    return enhance_audio(audio_bytes, 'normalize', backend)
+
+def enhance_audio(audio_bytes: bytes, enhancement_type: str = 'enhance', backend: str = None) -> bytes:
+    """
+    音声エンハンス
+
+    Args:
+        audio_bytes: 元の音声データ
+        enhancement_type: denoise（ノイズ除去）/ normalize（正規化）/
+                          enhance（ノイズ除去 + ダイナミックレンジ圧縮 + 正規化 + ゲイン）
+        backend: DSPバックエンド（"numpy" / "pydub"、省略時は AUDIO_DSP_BACKEND）
+    """
+    encoded, _ = process_variants(audio_bytes, [enhancement_type], backend=backend)
+    return encoded[enhancement_type]
+
+def get_audio_info(audio_bytes: bytes) -> dict:
+    """音声ファイルの情報を取得"""
+    return audio_info(decode_audio(audio_bytes))
+
+# STT前処理の出力形式 -> (pydub の format, export 引数, 拡張子)
+STT_EXPORT_FORMATS = {
+    'flac': ('flac', {}, 'flac'),
+    'opus': ('ogg', {'codec': 'libopus', 'bitrate': '24k'}, 'ogg'),
+    'wav': ('wav', {}, 'wav'),
+}
+
+STT_SAMPLE_RATE = 16000
+
+
+def prepare_for_stt(audio_bytes: bytes, source_format: str = None, export_format: str = 'flac',
+                    max_pause_ms: int = 1000, keep_silence_ms: int = 200, silence_offset_db: float = 16.0):
+    """
+    STT向けの前処理（16kHz モノラル化・無音の除去と短縮・FLAC/Opus 再エンコード）
+
+    無音のしきい値は音声全体の平均レベル - silence_offset_db（録音レベルの差を吸収する）
+
+    Args:
+        audio_bytes: 元の音声データ
+        source_format: 入力形式のヒント
+        export_format: "flac" / "opus" / "wav"（非圧縮、ffmpeg 不要）
+        max_pause_ms: 途中の無音の最大長
+        keep_silence_ms: 発話の前後に残す無音
+
+    Returns:
+        (送信用の音声データ, 拡張子, 統計)
+        前処理で小さくならない場合は元のデータと元の拡張子を返す
+    """
+    if export_format not in STT_EXPORT_FORMATS:
+        raise ValueError(f"unknown STT export format: {export_format}")
+    pydub_format, export_args, extension = STT_EXPORT_FORMATS[export_format]
+
+    audio = decode_audio(audio_bytes, source_format)
+    original_ms = len(audio)
+    audio = audio.set_channels(1).set_frame_rate(STT_SAMPLE_RATE).set_sample_width(2)
+
+    samples, rate = dsp.segment_to_array(audio)
+    if len(samples):
+        thresh_db = 20 * math.log10(max(math.sqrt(float((samples ** 2).mean())), 1e-10)) - silence_offset_db
+        samples = dsp.shorten_silence(samples, rate, thresh_db, max_pause_ms, keep_silence_ms)
+    trimmed = dsp.array_to_segment(samples, audio)
+
+    output = io.BytesIO()
+    trimmed.export(output, format=pydub_format, **export_args)
+    prepared = output.getvalue()
+
+    stats = {
+        'original_bytes': len(audio_bytes),
+        'original_ms': original_ms,
+        'prepared_ms': len(trimmed),
+    }
+    if len(prepared) >= len(audio_bytes):
+        stats.update(prepared_ms=original_ms, upload_bytes=len(audio_bytes), bytes_saved=0)
+        return audio_bytes, source_format, stats
+    stats.update(upload_bytes=len(prepared), bytes_saved=len(audio_bytes) - len(prepared))
+    return prepared, extension, stats
@@ -0,0 +1,323 @@
+"""
+キュー遅延・ワーカー稼働率のエクスポーター（水平オートスケール用）
+
+- Worker はジョブの処理時間を BusyTracker で数え、稼働率と処理件数を
+  {queue}:workers（ハッシュ、ワーカーID -> JSON）にデーモンスレッドから定期的に報告する
+  実行中のジョブの経過時間もその時点までの処理時間に含める（長いジョブの間も報告が途切れず、稼働率が 0 にならない）
+- エクスポーター（WORKER_MODE=exporter）は Redis だけに接続し、interval_sec ごとに以下を集計して
+  /metrics のゲージとして公開する
+  - キュー長（LLEN）、遅延キュー・集約待ちの件数
+  - 最古のジョブの待ち時間（キュー末尾のペイロードの enqueuedAt / createdAt）
+  - 種別ごとの滞留数（末尾から sample_size 件を数えて全体に按分）
+  - ワーカー数・平均稼働率・処理レート
+  - 推奨レプリカ数: (到着レート + 滞留を target_drain_sec で捌くレート) / (1台の処理レート × 目標稼働率)
+- 報告が stale_sec より古いワーカーは停止したものとみなして除外する
+"""
+
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from app.dispatch import QUEUE_KEY, pending_key
+from app.metrics import REGISTRY
+from app.retry import delayed_key
+
+REPORT_INTERVAL_SEC = 15
+STALE_SEC = 90
+
+
+def workers_key(queue=QUEUE_KEY):
+    return f"{queue}:workers"
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def job_timestamp(job):
+    """キューに入った時刻（UNIX 秒、enqueuedAt / API の createdAt、なければ None）"""
+    if job.get("enqueuedAt") is not None:
+        return float(job["enqueuedAt"])
+    created = job.get("createdAt")
+    if created:
+        try:
+            return datetime.fromisoformat(created.replace("Z", "+00:00")).timestamp()
+        except (AttributeError, ValueError):
+            return None
+    return None
+
+
+class BusyTracker:
+    """
+    ジョブの処理時間を数え、報告間隔ごとの稼働率・処理件数を求める
+
+    with tracker.busy():
+        worker.handle_job(job)
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._busy_sec = 0.0
+        self._jobs = 0
+        self._since = clock()
+        # 実行中の span（take() で経過分を数えたら start を進める）
+        self._active = set()
+
+    def busy(self, count=True):
+        """処理時間を数える範囲（count=False なら件数には数えない: 別スレッドで続きを処理するジョブなど）"""
+        return _BusySpan(self, count)
+
+    def _enter(self, span):
+        with self._lock:
+            span.start = self._clock()
+            self._active.add(span)
+
+    def _exit(self, span):
+        with self._lock:
+            seconds = self._clock() - span.start
+            self._active.discard(span)
+            self._busy_sec += seconds
+            self._jobs += 1 if span.count else 0
+        REGISTRY.inc("worker_busy_seconds_total", seconds, help_text="Seconds spent processing jobs")
+
+    def take(self):
+        """前回から今回までの (経過秒数, 処理秒数, 処理件数) を返してリセット（実行中のジョブは経過分を含める）"""
+        with self._lock:
+            now = self._clock()
+            in_flight = 0.0
+            for span in self._active:
+                in_flight += now - span.start
+                span.start = now
+            window = (now - self._since, self._busy_sec + in_flight, self._jobs)
+            self._since, self._busy_sec, self._jobs = now, 0.0, 0
+        if in_flight:
+            REGISTRY.inc("worker_busy_seconds_total", in_flight, help_text="Seconds spent processing jobs")
+        return window
+
+
+class _BusySpan:
+    def __init__(self, tracker, count=True):
+        self.tracker = tracker
+        self.count = count
+        self.start = None
+
+    def __enter__(self):
+        self.tracker._enter(self)
+
+    def __exit__(self, *exc):
+        self.tracker._exit(self)
+        return False
+
+
+class WorkerReporter:
+    """
+    BusyTracker の集計を {queue}:workers に定期的に報告
+
+    start() でデーモンスレッドから interval_sec ごとに報告する（ジョブの実行中も止まらない）
+    """
+
+    def __init__(self, r, tracker, queue=QUEUE_KEY, interval_sec=REPORT_INTERVAL_SEC, worker=None,
+                 clock=time.monotonic):
+        self.r = r
+        self.tracker = tracker
+        self.queue = queue
+        self.interval_sec = interval_sec
+        self.worker = worker or worker_id()
+        self._clock = clock
+        self._last = clock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="worker-reporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            self.report()
+
+    def maybe_report(self, now=None):
+        if self._clock() - self._last < self.interval_sec:
+            return False
+        return self.report(now)
+
+    def report(self, now=None):
+        self._last = self._clock()
+        window, busy_sec, jobs = self.tracker.take()
+        report = {
+            "busySec": round(busy_sec, 3), "windowSec": round(window, 3), "jobs": jobs,
+            "ts": time.time() if now is None else now,
+        }
+        try:
+            self.r.hset(workers_key(self.queue), self.worker, json.dumps(report))
+        except Exception as e:
+            print(f"[AUTOSCALE] Failed to report worker stats: {e}")
+            return False
+        return True
+
+    def remove(self):
+        try:
+            self.r.hdel(workers_key(self.queue), self.worker)
+        except Exception as e:
+            print(f"[AUTOSCALE] Failed to remove worker stats: {e}")
+
+
+def sample_queue(r, queue=QUEUE_KEY, sample_size=500, now=None):
+    """
+    キューの状態を取得（LLEN + 末尾 sample_size 件の LRANGE）
+
+    Returns:
+        depth, delayed, pending, oldest_age_sec（不明なら None）, backlog（種別 -> 推定件数）
+    """
+    now = time.time() if now is None else now
+    pipe = r.pipeline(transaction=False)
+    pipe.llen(queue)
+    pipe.zcard(delayed_key(queue))
+    pipe.hlen(pending_key(queue))
+    pipe.lrange(queue, -sample_size, -1)
+    depth, delayed, pending, tail = pipe.execute()
+
+    jobs = []
+    for raw in tail:
+        try:
+            jobs.append(json.loads(raw))
+        except (TypeError, ValueError):
+            continue
+
+    # LPUSH / BRPOP なので末尾ほど古い
+    oldest_age = None
+    for job in reversed(jobs):
+        ts = job_timestamp(job)
+        if ts is not None:
+            oldest_age = max(0.0, now - ts)
+            break
+
+    counts = Counter(job.get("type") or "unknown" for job in jobs)
+    scale = depth / len(jobs) if jobs else 0
+    backlog = {job_type: round(n * scale) for job_type, n in counts.items()}
+    return {
+        "depth": int(depth), "delayed": int(delayed), "pending": int(pending),
+        "oldest_age_sec": oldest_age, "backlog": backlog,
+    }
+
+
+def read_workers(r, queue=QUEUE_KEY, now=None, stale_sec=STALE_SEC):
+    """報告が新しいワーカーの集計を返す（古い報告は削除）"""
+    now = time.time() if now is None else now
+    live, stale = [], []
+    for worker, raw in (r.hgetall(workers_key(queue)) or {}).items():
+        report = json.loads(raw)
+        if now - report["ts"] > stale_sec:
+            stale.append(worker)
+        else:
+            live.append(report)
+    if stale:
+        r.hdel(workers_key(queue), *stale)
+    return live
+
+
+def recommend_replicas(arrival_rate, depth, service_rate, target_utilization=0.7, target_drain_sec=300,
+                       min_replicas=1, max_replicas=20, current=None):
+    """
+    推奨レプリカ数
+
+    Args:
+        arrival_rate: ジョブの到着レート（件/秒）
+        depth: 滞留件数
+        service_rate: 1台が稼働中に捌くレート（件/稼働秒、不明なら None）
+        current: 現在のワーカー数（処理レートが不明なときはこれを維持）
+    """
+    if not service_rate:
+        wanted = current if current else (min_replicas if depth == 0 else min_replicas + 1)
+    else:
+        demand = arrival_rate + depth / target_drain_sec
+        wanted = math.ceil(demand / (service_rate * target_utilization))
+    return max(min_replicas, min(max_replicas, wanted))
+
+
+class Exporter:
+    """
+    キュー・ワーカーの状態を定期的に集計してゲージに設定
+
+    Args:
+        r: Redis クライアント
+        interval_sec: 集計間隔
+        sample_size: 種別ごとの滞留数を数えるキュー末尾の件数
+    """
+
+    def __init__(self, r, queue=QUEUE_KEY, interval_sec=15, sample_size=500, target_utilization=0.7,
+                 target_drain_sec=300, min_replicas=1, max_replicas=20, registry=None):
+        self.r = r
+        self.queue = queue
+        self.interval_sec = interval_sec
+        self.sample_size = sample_size
+        self.target_utilization = target_utilization
+        self.target_drain_sec = target_drain_sec
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.registry = registry or REGISTRY
+        self._previous = None
+        self._backlog_types = set()
+
+    def collect(self, now=None):
+        now = time.time() if now is None else now
+        queue = sample_queue(self.r, self.queue, self.sample_size, now)
+        workers = read_workers(self.r, self.queue, now)
+
+        busy_sec = sum(w["busySec"] for w in workers)
+        window_sec = sum(w["windowSec"] for w in workers)
+        jobs = sum(w["jobs"] for w in workers)
+        throughput = sum(w["jobs"] / w["windowSec"] for w in workers if w["windowSec"] > 0)
+        service_rate = jobs / busy_sec if busy_sec > 0 else None
+        busy_ratio = busy_sec / window_sec if window_sec > 0 else 0.0
+
+        # 到着レート = 処理レート + 滞留の増加分
+        arrival_rate = throughput
+        if self._previous is not None and now > self._previous[0]:
+            arrival_rate += (queue["depth"] - self._previous[1]) / (now - self._previous[0])
+        arrival_rate = max(0.0, arrival_rate)
+        self._previous = (now, queue["depth"])
+
+        replicas = recommend_replicas(
+            arrival_rate, queue["depth"], service_rate, self.target_utilization, self.target_drain_sec,
+            self.min_replicas, self.max_replicas, current=len(workers),
+        )
+
+        g = self.registry.set_gauge
+        g("worker_queue_depth", queue["depth"], help_text="Jobs waiting in the queue", queue=self.queue)
+        g("worker_queue_delayed", queue["delayed"], help_text="Jobs waiting for a delayed retry", queue=self.queue)
+        g("worker_queue_pending", queue["pending"], help_text="Coalesced job payloads waiting", queue=self.queue)
+        g("worker_queue_oldest_age_seconds", queue["oldest_age_sec"] or 0.0,
+          help_text="Age of the oldest queued job", queue=self.queue)
+        for job_type in self._backlog_types - set(queue["backlog"]):
+            g("worker_queue_backlog", 0, queue=self.queue, type=job_type)
+        for job_type, count in queue["backlog"].items():
+            g("worker_queue_backlog", count, help_text="Estimated queued jobs by type",
+              queue=self.queue, type=job_type)
+        self._backlog_types |= set(queue["backlog"])
+        g("worker_replicas_live", len(workers), help_text="Workers with a recent report", queue=self.queue)
+        g("worker_busy_ratio", busy_ratio, help_text="Share of wall time workers spent on jobs", queue=self.queue)
+        g("worker_throughput_jobs_per_second", throughput, help_text="Jobs completed per second", queue=self.queue)
+        g("worker_arrival_jobs_per_second", arrival_rate, help_text="Estimated job arrival rate", queue=self.queue)
+        g("worker_recommended_replicas", replicas, help_text="Recommended worker replicas", queue=self.queue)
+        return dict(queue, workers=len(workers), busy_ratio=busy_ratio, throughput=throughput,
+                    service_rate=service_rate, arrival_rate=arrival_rate, recommended_replicas=replicas)
+
+    def run(self, should_stop=lambda: False):
+        while not should_stop():
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"[AUTOSCALE] Collect failed: {e}")
+            time.sleep(self.interval_sec)
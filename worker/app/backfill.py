@@ -0,0 +1,359 @@
+"""
+バックフィル（再処理）エンジン
+entries を主キー範囲でバッチ走査し、選択したステージを再実行する
+
+- チェックポイントは Redis に保存し、中断しても続きから再開できる
+- スループット上限（件/秒）を指定可能
+- mode=execute: このWorkerでバッチごとに実行
+- mode=enqueue: バッチごとに BACKFILL_BATCH ジョブを投入し、複数Workerで分散実行
+- LLM_MICROBATCH=1 なら LLM ステージは複数エントリをまとめて1リクエストで分析（app.microbatch）
+- ng ステージはパイプラインの NgStep と同じ判定（辞書 + リソースの正規表現、app.ng_detector.entry_flags）
+- ng 以外のステージはフラグ付きのエントリ（NG・PII・non_save）を対象外にする（パイプラインの _analyzable と同じ）
+  ng ステージを含む場合は先に実行し、更新後のフラグで判定する
+"""
+
+import json
+import time
+
+from app.dispatch import enqueue_job
+from app.locks import LeaseLostError, LockManager
+from app.stage_versions import split_stale, stage_result_row
+from app.text_resources import default_resources
+
+# ルールベース（辞書依存）ステージ + LLMステージ
+RULE_STAGES = ("tags", "ng", "speech")
+LLM_STAGES = ("emotion", "keywords")
+BACKFILL_STAGES = RULE_STAGES + LLM_STAGES
+# フラグ付きのエントリでも実行するステージ（他は分析対象のエントリだけ）
+FLAG_STAGES = ("ng",)
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+LOCK_TTL_SEC = 600
+CHECKPOINT_TTL_SEC = 7 * 24 * 3600
+
+
+def checkpoint_key(backfill_id):
+    return f"backfill:{backfill_id}:checkpoint"
+
+
+def control_key(backfill_id):
+    return f"backfill:{backfill_id}:control"
+
+
+def load_checkpoint(r, backfill_id):
+    """
+    チェックポイントを読み込み
+
+    Returns:
+        {'last_id': int, 'processed': int, 'status': str}（未保存なら初期値）
+    """
+    data = r.hgetall(checkpoint_key(backfill_id)) or {}
+    return {
+        "last_id": int(data.get("last_id", 0)),
+        "processed": int(data.get("processed", 0)),
+        "status": data.get("status", "new"),
+    }
+
+
+def save_checkpoint(r, backfill_id, last_id, processed, status):
+    """チェックポイントを保存"""
+    key = checkpoint_key(backfill_id)
+    r.hset(key, mapping={
+        "last_id": last_id,
+        "processed": processed,
+        "status": status,
+        "updated_at": int(time.time()),
+    })
+    r.expire(key, CHECKPOINT_TTL_SEC)
+
+
+def parse_stages(stages):
+    """ステージ指定を検証（不明なステージは ValueError）"""
+    if not stages:
+        return list(RULE_STAGES)
+    unknown = [s for s in stages if s not in BACKFILL_STAGES]
+    if unknown:
+        raise ValueError(f"unknown backfill stages: {unknown}")
+    # 重複排除しつつ定義順に並べる
+    return [s for s in BACKFILL_STAGES if s in stages]
+
+
+class RateLimiter:
+    """件/秒 のスループット上限（バッチ単位で待機）"""
+
+    def __init__(self, max_per_sec, clock=time.monotonic, sleep=time.sleep):
+        self.max_per_sec = max_per_sec
+        self.clock = clock
+        self.sleep = sleep
+        self.started = clock()
+        self.count = 0
+
+    def wait(self, n):
+        """n件処理したことを記録し、上限を超えていれば待機"""
+        self.count += n
+        if not self.max_per_sec or self.max_per_sec <= 0:
+            return
+        expected = self.count / self.max_per_sec
+        elapsed = self.clock() - self.started
+        if expected > elapsed:
+            self.sleep(expected - elapsed)
+
+
+# ---------------------------------------------------------------------------
+# ステージ実行（バッチ単位でまとめて書き込み）
+# ---------------------------------------------------------------------------
+
+def _run_tags(db, rows, openai_client, resources):
+    from app.db import replace_entry_tags_bulk
+    from app.tagger import extract_tags
+
+    outputs = {row["id"]: extract_tags(row["transcript_text"]) for row in rows}
+    pairs = [(entry_id, tag) for entry_id, tags in outputs.items() for tag in tags]
+    replace_entry_tags_bulk(db, list(outputs), pairs)
+    return outputs
+
+
+def _run_ng(db, rows, openai_client, resources):
+    from app.db import update_entry_flags_bulk
+    from app.ng_detector import entry_flags
+
+    outputs = {}
+    updates = []
+    for row in rows:
+        ng_flags, flag_types = entry_flags(
+            row["transcript_text"], row.get("pii_detected"),
+            resources.ng_topic_patterns, resources.non_save_patterns,
+        )
+        flag_json = json.dumps(flag_types, ensure_ascii=False) if flag_types else None
+        updates.append((1 if flag_types else 0, flag_json, row["id"]))
+        outputs[row["id"]] = ng_flags
+        # 同じバッチの後続ステージは更新後のフラグで対象を判定する
+        row["content_flagged"] = 1 if flag_types else 0
+    update_entry_flags_bulk(db, updates)
+    return outputs
+
+
+def _run_speech(db, rows, openai_client, resources):
+    from app.db import save_speech_analysis_bulk
+    from app.speech_analyzer import analyze_speech_batch, iter_speech_batch
+
+    analysis = analyze_speech_batch([row["transcript_text"] for row in rows])
+    outputs = {row["id"]: a for row, a in zip(rows, iter_speech_batch(analysis))}
+    save_speech_analysis_bulk(db, [
+        (entry_id, a["speech_rate"], a["filler_word_rate"], a["avg_sentence_length"], a["vocabulary_diversity"])
+        for entry_id, a in outputs.items()
+    ])
+    return outputs
+
+
+def _llm_results(rows, task):
+    """
+    LLM ステージの結果を entry_id -> 結果 で返す
+
+    マイクロバッチが有効なら複数エントリを1リクエストで分析し、
+    応答に含まれなかったエントリだけ analyze_one で個別に分析する（同じプロンプト・出力形式）
+    """
+    from app.config import get_microbatch_settings
+    from app.microbatch import analyze_batch, analyze_one, chunk_items
+
+    results = {}
+    settings = get_microbatch_settings()
+    if settings["enabled"]:
+        items = [(row["id"], row["transcript_text"]) for row in rows]
+        for chunk in chunk_items(items, settings["max_batch"]):
+            for entry_id, analysis in analyze_batch(chunk, (task,)).items():
+                results[entry_id] = analysis[task]
+    for row in rows:
+        if row["id"] not in results:
+            results[row["id"]] = analyze_one(row["transcript_text"], task)
+    return results
+
+
+def _run_emotion(db, rows, openai_client, resources):
+    from app.db import save_emotion_analysis
+
+    outputs = {}
+    results = _llm_results(rows, "emotion")
+    for row in rows:
+        result = results.get(row["id"])
+        if result:
+            save_emotion_analysis(
+                db, row["id"],
+                result["primary_emotion"],
+                result["emotions"],
+                result["valence"],
+                result["arousal"],
+                result["dominance"]
+            )
+            outputs[row["id"]] = result
+    return outputs
+
+
+def _run_keywords(db, rows, openai_client, resources):
+    from app.db import save_keywords
+
+    outputs = {}
+    results = _llm_results(rows, "keywords")
+    for row in rows:
+        result = results.get(row["id"])
+        if result:
+            save_keywords(db, row["id"], result["keywords"], result["topics"])
+            outputs[row["id"]] = result
+    return outputs
+
+
+def _analyzable(row):
+    """分析ステージの対象か（パイプラインの _analyzable と同じ: フラグ付きのエントリは分析・外部送信しない）"""
+    return bool(row.get("transcript_text")) and row.get("content_flagged") == 0
+
+
+# 各ランナーは entry_id -> ステージ出力 を返す（結果が得られなかったエントリは含めない）
+STAGE_RUNNERS = {
+    "tags": _run_tags,
+    "ng": _run_ng,
+    "speech": _run_speech,
+    "emotion": _run_emotion,
+    "keywords": _run_keywords,
+}
+
+
+def run_backfill_stages(db, rows, stages, openai_client=None, force=False, resources=None):
+    """
+    バッチに対して選択ステージを実行
+
+    入力フィンガープリントが保存済みのものと一致するエントリはスキップし、
+    実行した分の出力とフィンガープリントをまとめて保存する
+    ng 以外のステージはフラグ付きのエントリ（content_flagged != 0）を実行しない
+
+    Args:
+        db: MySQL接続
+        rows: fetch_entry_batch / fetch_entries_by_ids の結果
+        stages: 実行するステージ名のリスト
+        openai_client: LLMステージ用クライアント
+        force: フィンガープリントに関係なく全件再実行
+        resources: TextResources（ng ステージの正規表現、省略時は worker/resources）
+
+    Returns:
+        ステージ名 -> 処理件数
+    """
+    from app.db import save_stage_results_bulk
+
+    resources = resources or default_resources()
+    rows = [row for row in rows if row.get("transcript_text")]
+    counts = {}
+    if not rows:
+        return counts
+    # ng を先に実行して、後続ステージの対象判定に更新後のフラグを使う
+    for stage in sorted(stages, key=lambda stage: stage not in FLAG_STAGES):
+        targets = rows if stage in FLAG_STAGES else [row for row in rows if _analyzable(row)]
+        if not targets:
+            counts[stage] = 0
+            continue
+        stale, fingerprints = split_stale(db, targets, stage, force=force)
+        outputs = STAGE_RUNNERS[stage](db, stale, openai_client, resources) if stale else {}
+        save_stage_results_bulk(db, [
+            stage_result_row(entry_id, stage, fingerprints[entry_id], output)
+            for entry_id, output in outputs.items()
+        ])
+        counts[stage] = len(outputs)
+    return counts
+
+
+# ---------------------------------------------------------------------------
+# ジョブハンドラ
+# ---------------------------------------------------------------------------
+
+def process_backfill(job, r, db, openai_client=None, resources=None):
+    """
+    BACKFILL ジョブ（コーディネータ）
+
+    job:
+        backfillId: バックフィル識別子（チェックポイントのキー）
+        stages: ["tags", "ng", ...]（省略時はルールベースステージ）
+        mode: "execute" | "enqueue"
+        startId / endId: 主キー範囲（省略可）
+        batchSize: 1バッチの件数
+        maxPerSecond: スループット上限（件/秒、0で無制限）
+        force: 入力フィンガープリントが一致するステージも再実行
+
+    ロックはハートビートで延長されるリース（app.locks.LockManager）で、
+    延長に失敗したらチェックポイントを書かずに終了する
+    """
+    backfill_id = job["backfillId"]
+    with LockManager(r, ttl_sec=LOCK_TTL_SEC).lease(f"lock:backfill:{backfill_id}") as lease:
+        if lease is None:
+            print(f"[BACKFILL] {backfill_id} already running")
+            return
+        try:
+            _coordinate(job, r, db, openai_client, resources, lease)
+        except LeaseLostError as e:
+            # ロックの延長に失敗した: 他のコーディネータが続きを処理する
+            print(f"[BACKFILL] {backfill_id} abandoned: {e}")
+
+
+def _coordinate(job, r, db, openai_client, resources, lease):
+    from app.db import fetch_entry_batch
+
+    backfill_id = job["backfillId"]
+    stages = parse_stages(job.get("stages"))
+    mode = job.get("mode", "execute")
+    if mode not in ("execute", "enqueue"):
+        raise ValueError(f"unknown backfill mode: {mode}")
+    batch_size = min(int(job.get("batchSize", DEFAULT_BATCH_SIZE)), MAX_BATCH_SIZE)
+    end_id = job.get("endId")
+    limiter = RateLimiter(float(job.get("maxPerSecond", 0)))
+    force = bool(job.get("force", False))
+
+    cp = load_checkpoint(r, backfill_id)
+    if cp["status"] == "done":
+        print(f"[BACKFILL] {backfill_id} already done")
+        return
+
+    last_id = max(cp["last_id"], int(job.get("startId", 1)) - 1)
+    processed = cp["processed"]
+    print(f"[BACKFILL] {backfill_id} start mode={mode} stages={stages} from id>{last_id}")
+
+    while True:
+        if r.get(control_key(backfill_id)) == "pause":
+            lease.check()
+            save_checkpoint(r, backfill_id, last_id, processed, "paused")
+            print(f"[BACKFILL] {backfill_id} paused at id={last_id}")
+            return
+
+        rows = fetch_entry_batch(db, last_id, end_id, batch_size, with_text=(mode == "execute"))
+        if not rows:
+            break
+
+        lease.check()
+        if mode == "execute":
+            run_backfill_stages(db, rows, stages, openai_client, force, resources)
+        else:
+            enqueue_job(r, {
+                "type": "BACKFILL_BATCH",
+                "backfillId": backfill_id,
+                "stages": stages,
+                "entryIds": [row["id"] for row in rows],
+                "force": force,
+            })
+
+        last_id = rows[-1]["id"]
+        processed += len(rows)
+        # バッチの実行中にリースを失っていたらチェックポイントを書かない（他のコーディネータが進めている）
+        lease.check()
+        save_checkpoint(r, backfill_id, last_id, processed, "running")
+        limiter.wait(len(rows))
+
+    lease.check()
+    save_checkpoint(r, backfill_id, last_id, processed, "done")
+    print(f"[BACKFILL] {backfill_id} done ({processed} entries)")
+
+
+def process_backfill_batch(job, db, openai_client=None, resources=None):
+    """BACKFILL_BATCH ジョブ（enqueueモードで投入された1バッチ分）"""
+    from app.db import fetch_entries_by_ids
+
+    stages = parse_stages(job.get("stages"))
+    rows = fetch_entries_by_ids(db, job.get("entryIds", []))
+    counts = run_backfill_stages(db, rows, stages, openai_client, bool(job.get("force", False)), resources)
+    print(f"[BACKFILL_BATCH] {job.get('backfillId')} {len(rows)} entries {counts}")
@@ -0,0 +1,156 @@
+"""
+ジョブの期限と協調的キャンセル
+
+- ジョブごとに CancelToken を作り、実行中はコンテキスト変数に置く
+- キャンセルは Redis の job:cancel:{ジョブキー} に要求時刻（UNIX 秒）を書き込んで通知する
+  （要求より後に開始したジョブは対象外なので、再投入された同じキーのジョブは止まらない）
+- 期限はペイロードの deadline（UNIX 秒）と、1回の実行時間の上限 timeoutSec（省略時は種別ごとの既定値）
+- パイプラインはステップの間で check_cancelled() を呼ぶ
+- プロバイダ呼び出しは run_cancellable でスレッドに逃がし、待機中にキャンセルされたら結果を待たずに中断する
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from app.metrics import REGISTRY
+
+CANCEL_TTL_SEC = 24 * 3600
+# Redis のキャンセルキーを確認する間隔（秒）
+POLL_INTERVAL_SEC = 1.0
+
+# 1回の実行時間の上限（秒）
+DEFAULT_TIMEOUTS = {
+    "PROCESS_ENTRY": 900,
+    "PROCESS_RANGE_SUMMARY": 600,
+    "CUSTOM_SUMMARY": 300,
+    "AUDIO_ENHANCEMENT": 900,
+}
+
+current_token = ContextVar("cancel_token", default=None)
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされた / 期限を過ぎた（reason: cancelled / deadline）"""
+
+    def __init__(self, job_key, reason):
+        super().__init__(f"job {job_key} {reason}")
+        self.job_key = job_key
+        self.reason = reason
+
+
+def cancel_key(job_key):
+    return f"job:cancel:{job_key}"
+
+
+def cancel_job(r, job_key, now=None):
+    """ジョブのキャンセルを要求（この時点までに開始したジョブが止まる）"""
+    r.set(cancel_key(job_key), f"{time.time() if now is None else now:.6f}", ex=CANCEL_TTL_SEC)
+
+
+class CancelToken:
+    """
+    Args:
+        r: Redis クライアント（None ならキャンセルキーは確認しない）
+        job_key: ジョブキー（冪等キー）
+        deadline: 期限（UNIX 秒）
+    """
+
+    def __init__(self, r, job_key, deadline=None, poll_interval=POLL_INTERVAL_SEC, clock=time.time):
+        self.r = r
+        self.job_key = job_key
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self.started_at = clock()
+        self.reason = None
+        self._last_poll = None
+        self._lock = threading.Lock()
+
+    def cancel(self, reason="cancelled"):
+        self.reason = self.reason or reason
+
+    def remaining(self):
+        """期限までの秒数（期限なしは None）"""
+        return None if self.deadline is None else self.deadline - self._clock()
+
+    def cancelled(self):
+        if self.reason:
+            return True
+        now = self._clock()
+        if self.deadline is not None and now >= self.deadline:
+            self.cancel("deadline")
+            return True
+        if self.r is None or self.job_key is None:
+            return False
+        with self._lock:
+            if self._last_poll is not None and now - self._last_poll < self.poll_interval:
+                return False
+            self._last_poll = now
+        try:
+            requested = self.r.get(cancel_key(self.job_key))
+        except Exception as e:
+            print(f"[CANCEL] Failed to check {self.job_key}: {e}")
+            return False
+        if requested is not None and float(requested) >= self.started_at:
+            self.cancel("cancelled")
+            return True
+        return False
+
+    def check(self):
+        """キャンセル・期限切れなら JobCancelled"""
+        if self.cancelled():
+            REGISTRY.inc("worker_jobs_cancelled_total", help_text="Jobs stopped by cancellation or deadline",
+                         reason=self.reason)
+            raise JobCancelled(self.job_key, self.reason)
+
+
+def job_deadline(job, now=None):
+    """ペイロードの deadline と timeoutSec（既定値）のうち早い方"""
+    now = time.time() if now is None else now
+    timeout = job.get("timeoutSec", DEFAULT_TIMEOUTS.get(job.get("type")))
+    candidates = [float(job["deadline"])] if job.get("deadline") else []
+    if timeout:
+        candidates.append(now + float(timeout))
+    return min(candidates) if candidates else None
+
+
+@contextmanager
+def job_scope(r, job_key, deadline=None):
+    """ジョブの実行範囲で CancelToken をコンテキスト変数に置く"""
+    token = CancelToken(r, job_key, deadline)
+    reset = current_token.set(token)
+    try:
+        yield token
+    finally:
+        current_token.reset(reset)
+
+
+def check_cancelled():
+    """実行中のジョブがキャンセル・期限切れなら JobCancelled（ジョブ外では何もしない）"""
+    token = current_token.get()
+    if token is not None:
+        token.check()
+
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cancellable")
+
+
+def run_cancellable(fn, *args, wait_interval=0.2, **kwargs):
+    """
+    fn を別スレッドで実行し、完了を待つ間もキャンセル・期限を確認する
+
+    キャンセルされたら結果を待たずに JobCancelled（実行中の HTTP 呼び出しは裏で完了し、結果は捨てる）
+    """
+    token = current_token.get()
+    if token is None:
+        return fn(*args, **kwargs)
+    token.check()
+    future = _pool.submit(copy_context().run, fn, *args, **kwargs)
+    while True:
+        try:
+            return future.result(timeout=wait_interval)
+        except FutureTimeout:
+            token.check()
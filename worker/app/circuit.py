@@ -0,0 +1,194 @@
+"""
+外部依存ごとのサーキットブレーカー
+
+障害中の依存先（OpenAI の STT / chat、MinIO、MySQL）にタイムアウトまで待つ呼び出しを
+繰り返さないよう、連続失敗が続いたら一定時間呼び出しを止める
+
+- closed: 通常。連続失敗が failure_threshold に達したら open
+- open: 呼び出しは即座に CircuitOpenError。reset_timeout_sec 経過で half_open
+- half_open: half_open_max 件だけ試行を通し、成功なら closed、失敗なら再び open
+- 失敗として数えるのは依存先の障害（タイムアウト・接続エラー・429・5xx）だけで、
+  応答の解析失敗などは数えない
+- ブレーカーはプロセス単位。メインループは依存先が open のジョブ種別だけを遅延キューに退避し、
+  それ以外のジョブは通常どおり処理する
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from app.metrics import REGISTRY
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEPENDENCIES = ("stt", "chat", "storage", "mysql")
+
+# ジョブ種別 -> 依存先
+JOB_DEPENDENCIES = {
+    "PROCESS_ENTRY": ("mysql", "storage", "stt", "chat"),
+    "PROCESS_RANGE_SUMMARY": ("mysql", "chat"),
+    "CUSTOM_SUMMARY": ("mysql", "chat"),
+    "AUDIO_ENHANCEMENT": ("mysql", "storage"),
+    "BACKFILL": ("mysql",),
+    "BACKFILL_BATCH": ("mysql", "chat"),
+}
+
+
+class CircuitOpenError(Exception):
+    """依存先のブレーカーが open（retry_after 秒後に half_open になる）"""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f"circuit open: {dependency} (retry after {retry_after:.0f}s)")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def is_dependency_failure(error):
+    """依存先の障害とみなす例外か（app.retry の分類で rate_limit / transient）"""
+    from app.retry import classify_error
+
+    return classify_error(error) in ("rate_limit", "transient")
+
+
+class CircuitBreaker:
+    """
+    Args:
+        name: 依存先の名前（メトリクスのラベル）
+        failure_threshold: open にする連続失敗数
+        reset_timeout_sec: open から half_open までの秒数
+        half_open_max: half_open で同時に通す試行数
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout_sec=30.0, half_open_max=1,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.half_open_max = half_open_max
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout_sec:
+            self._transition(HALF_OPEN)
+            self._probes = 0
+        return self._state
+
+    def _transition(self, state):
+        if state != self._state:
+            self._state = state
+            REGISTRY.inc("worker_circuit_transitions_total", help_text="Circuit breaker state changes",
+                         dependency=self.name, state=state)
+            print(f"[CIRCUIT] {self.name} -> {state}")
+
+    def retry_after(self):
+        """open の残り秒数（open でなければ 0）"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout_sec - (self._clock() - self._opened_at))
+
+    def available(self):
+        """呼び出しを通せる状態か（試行枠は消費しない）"""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and self._probes < self.half_open_max)
+
+    def before_call(self):
+        """呼び出し前に確認（open なら CircuitOpenError）"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_max:
+                self._probes += 1
+                return
+            retry_after = max(0.0, self.reset_timeout_sec - (self._clock() - self._opened_at))
+        REGISTRY.inc("worker_circuit_rejected_total", help_text="Calls rejected by an open circuit",
+                     dependency=self.name)
+        raise CircuitOpenError(self.name, retry_after or self.reset_timeout_sec)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(OPEN)
+                self._opened_at = self._clock()
+                self._probes = 0
+
+    @contextmanager
+    def guard(self):
+        """
+        with breaker.guard():
+            呼び出し  # 依存先の障害なら失敗として数える
+        """
+        self.before_call()
+        try:
+            yield
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if is_dependency_failure(e):
+                self.record_failure()
+            else:
+                # 依存先は応答している
+                self.record_success()
+            raise
+        self.record_success()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """プロセス共有のブレーカー（CIRCUIT_* の設定で作成）"""
+    from app.config import get_circuit_settings
+
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **get_circuit_settings())
+        return breaker
+
+
+def reset_breakers():
+    """全ブレーカーを破棄（テスト用）"""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def blocked_dependency(job_type):
+    """
+    ジョブ種別の依存先で open のものを返す
+
+    Returns:
+        (依存先, open の残り秒数) / すべて利用可能なら None
+    """
+    for name in JOB_DEPENDENCIES.get(job_type, ()):
+        breaker = get_breaker(name)
+        if not breaker.available():
+            return name, breaker.retry_after()
+    return None
+
+
+def is_mysql_error(error):
+    """mysql.connector の接続系エラーか（MySQL はジョブ単位で成否を記録する）"""
+    return type(error).__module__.startswith("mysql") and is_dependency_failure(error)
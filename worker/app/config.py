@@ -35,3 +35,177 @@ def get_redis_url() -> str:
         Redis connection URL
     """
     return os.getenv('REDIS_URL', 'redis://localhost:6379')
+
+
+def get_openai_model() -> str:
+    """Get chat model name from environment.
+    
+    Returns:
+        Chat model name
+    """
+    return os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+
+def get_audio_dsp_backend() -> str:
+    """Get audio DSP backend from environment.
+    
+    Returns:
+        "numpy" (vectorized filters) or "pydub" (pydub.effects)
+    """
+    return os.getenv('AUDIO_DSP_BACKEND', 'numpy')
+
+
+def get_audio_pool_settings() -> dict:
+    """Get audio enhancement process pool settings from environment.
+    
+    Returns:
+        AudioPool keyword arguments (workers=0 disables the pool)
+    """
+    return {
+        'workers': int(os.getenv('AUDIO_POOL_WORKERS', '2')),
+        'max_queue': int(os.getenv('AUDIO_POOL_QUEUE_SIZE', '4')),
+        'memory_limit_mb': int(os.getenv('AUDIO_TASK_MEMORY_MB', '1024')),
+        'timeout_sec': int(os.getenv('AUDIO_TASK_TIMEOUT_SEC', '300')),
+        'tmp_dir': os.getenv('AUDIO_TASK_TMP_DIR') or None,
+    }
+
+
+def get_stt_preprocess_settings() -> dict:
+    """Get pre-STT audio preprocessing settings from environment.
+    
+    Returns:
+        enabled flag and prepare_for_stt keyword arguments
+    """
+    return {
+        'enabled': os.getenv('STT_PREPROCESS', '0').lower() in ('1', 'true', 'yes'),
+        'export_format': os.getenv('STT_PREPROCESS_FORMAT', 'flac'),
+        'max_pause_ms': int(os.getenv('STT_MAX_PAUSE_MS', '1000')),
+    }
+
+
+def get_object_cache_settings() -> dict:
+    """Get local disk cache settings for MinIO objects from environment.
+    
+    Returns:
+        cache directory (empty disables the cache), size limit in bytes and
+        seconds a known ETag is trusted before the object is stat'ed again
+    """
+    return {
+        'dir': os.getenv('OBJECT_CACHE_DIR', ''),
+        'max_bytes': int(os.getenv('OBJECT_CACHE_MAX_MB', '2048')) * 1024 * 1024,
+        'etag_ttl_sec': float(os.getenv('OBJECT_CACHE_ETAG_TTL_SEC', '300')),
+    }
+
+
+def get_metrics_port() -> Optional[int]:
+    """Get port for the Prometheus metrics endpoint from environment.
+    
+    Returns:
+        Port number, or None when METRICS_PORT is not set
+    """
+    port = os.getenv('METRICS_PORT')
+    return int(port) if port else None
+
+
+def get_pipeline_settings() -> dict:
+    """Get job pipeline runner settings from environment.
+    
+    Returns:
+        runner ('sequential' or 'async') and step concurrency for the async runner
+    """
+    return {
+        'runner': os.getenv('PIPELINE_RUNNER', 'sequential'),
+        'max_concurrency': int(os.getenv('PIPELINE_MAX_CONCURRENCY', '8')),
+    }
+
+
+def get_microbatch_settings() -> dict:
+    """Get LLM analysis micro-batching settings from environment.
+    
+    Returns:
+        enabled flag (LLM_MICROBATCH, default off) and entries per batched request
+    """
+    return {
+        'enabled': os.getenv('LLM_MICROBATCH', '0').lower() in ('1', 'true', 'yes'),
+        'max_batch': int(os.getenv('LLM_MICROBATCH_MAX', '8')),
+    }
+
+
+def get_circuit_settings() -> dict:
+    """Get circuit breaker settings for external dependencies from environment.
+    
+    Returns:
+        CircuitBreaker keyword arguments
+    """
+    return {
+        'failure_threshold': int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+        'reset_timeout_sec': float(os.getenv('CIRCUIT_RESET_SEC', '30')),
+        'half_open_max': int(os.getenv('CIRCUIT_HALF_OPEN_MAX', '1')),
+    }
+
+
+def get_hedging_settings() -> dict:
+    """Get hedged provider request settings from environment.
+    
+    Returns:
+        enabled flag (HEDGE_ENABLED, default off) and Hedger keyword arguments
+    """
+    return {
+        'enabled': os.getenv('HEDGE_ENABLED', '0').lower() in ('1', 'true', 'yes'),
+        'quantile': float(os.getenv('HEDGE_QUANTILE', '0.95')),
+        'max_ratio': float(os.getenv('HEDGE_MAX_RATIO', '0.05')),
+        'min_delay_sec': int(os.getenv('HEDGE_MIN_DELAY_MS', '1000')) / 1000.0,
+    }
+
+
+def get_streaming_settings() -> dict:
+    """Get summary token streaming settings from environment.
+    
+    Returns:
+        enabled flag (SUMMARY_STREAMING, default off) and SummaryStream keyword arguments
+    """
+    return {
+        'enabled': os.getenv('SUMMARY_STREAMING', '0').lower() in ('1', 'true', 'yes'),
+        'flush_interval_sec': int(os.getenv('SUMMARY_STREAM_FLUSH_MS', '100')) / 1000.0,
+        'ttl_sec': int(os.getenv('SUMMARY_STREAM_TTL_SEC', '3600')),
+    }
+
+
+def get_worker_mode() -> str:
+    """Get worker entry point mode from environment.
+    
+    Returns:
+        "worker" (process jobs) or "exporter" (queue and saturation metrics only)
+    """
+    return os.getenv('WORKER_MODE', 'worker')
+
+
+def get_autoscale_settings() -> dict:
+    """Get queue-lag exporter and replica recommendation settings from environment.
+    
+    Returns:
+        Exporter keyword arguments
+    """
+    return {
+        'interval_sec': float(os.getenv('AUTOSCALE_INTERVAL_SEC', '15')),
+        'sample_size': int(os.getenv('AUTOSCALE_SAMPLE_SIZE', '500')),
+        'target_utilization': float(os.getenv('AUTOSCALE_TARGET_UTILIZATION', '0.7')),
+        'target_drain_sec': float(os.getenv('AUTOSCALE_TARGET_DRAIN_SEC', '300')),
+        'min_replicas': int(os.getenv('AUTOSCALE_MIN_REPLICAS', '1')),
+        'max_replicas': int(os.getenv('AUTOSCALE_MAX_REPLICAS', '20')),
+    }
+
+
+def get_profiler_settings() -> dict:
+    """Get on-demand profiler settings from environment.
+    
+    Returns:
+        Profiler keyword arguments (PROFILE_BUCKET uploads to MinIO instead of PROFILE_DIR)
+    """
+    return {
+        'output_dir': os.getenv('PROFILE_DIR', '/tmp/worker-profiles'),
+        'bucket': os.getenv('PROFILE_BUCKET') or None,
+        'interval_ms': int(os.getenv('PROFILE_INTERVAL_MS', '10')),
+        'default_sec': float(os.getenv('PROFILE_DEFAULT_SEC', '30')),
+        'max_sec': float(os.getenv('PROFILE_MAX_SEC', '300')),
+    }
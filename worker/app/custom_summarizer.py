@@ -3,7 +3,8 @@ Phase 4.1: カスタム要約生成
 スタイル・長さ・フォーカスに応じてプロンプトをカスタマイズ
 """
 
-from chat import generate_summary
+from app.config import get_openai_model
+from app.providers_openai import chat_completion
 
 # スタイル別プロンプトテンプレート
 STYLE_TEMPLATES = {
@@ -99,8 +100,8 @@ def generate_custom_summary(transcript_text, style='narrative', length='medium',
         要約テキスト
     """
     prompt = build_custom_prompt(transcript_text, style, length, focus, custom_prompt)
-    summary = generate_summary(prompt)
-    return summary
+    # ストリーミング中（app.streaming）は途中のテキストも書き出される
+    return chat_completion([{"role": "user", "content": prompt}], model=get_openai_model())
 
 # 使用例
 if __name__ == "__main__":
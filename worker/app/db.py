@@ -28,9 +28,28 @@ def get_entry(db, entry_id):
     cursor.close()
     return row
 
-def update_entry(db, entry_id, transcript, summary, pii_detected, pii_types_json, content_flagged, flag_types_json):
+def update_entry(db, entry_id, transcript, summary, pii_detected, pii_types_json, content_flagged, flag_types_json,
+                 fence_token=None):
+    """
+    処理結果を書き込み
+
+    fence_token を指定すると、それより新しいトークンで書き込み済みの場合は更新しない
+
+    Returns:
+        更新したか（fence_token 指定時に False ならより新しい処理が書き込み済み）
+    """
     cursor = db.cursor()
-    cursor.execute("""
+    params = [transcript, summary, pii_detected, pii_types_json, content_flagged, flag_types_json]
+    fence_set = ""
+    fence_where = ""
+    if fence_token is not None:
+        fence_set = ",\n            lock_token = %s"
+        fence_where = " AND (lock_token IS NULL OR lock_token <= %s)"
+        params.append(fence_token)
+    params.append(entry_id)
+    if fence_token is not None:
+        params.append(fence_token)
+    cursor.execute(f"""
         UPDATE entries
         SET transcript_text = %s,
             summary_text = %s,
@@ -39,11 +58,13 @@ def update_entry(db, entry_id, transcript, summary, pii_detected, pii_types_json
             content_flagged = %s,
             flag_types = %s,
             status = 'done',
-            processed_at = NOW()
-        WHERE id = %s
-    """, (transcript, summary, pii_detected, pii_types_json, content_flagged, flag_types_json, entry_id))
+            processed_at = NOW(){fence_set}
+        WHERE id = %s{fence_where}
+    """, params)
+    updated = fence_token is None or cursor.rowcount > 0
     db.commit()
     cursor.close()
+    return updated
 
 def update_entry_summary(db, entry_id, summary_text):
     """
@@ -93,6 +114,17 @@ def claim_summary_processing(db, summary_id):
     cursor.close()
     return affected > 0
 
+def release_summary_processing(db, summary_id):
+    """処理中の要約を queued に戻す（リトライ・退避後に claim し直せるように）"""
+    cursor = db.cursor()
+    cursor.execute("""
+        UPDATE summaries
+        SET status = 'queued', started_at = NULL
+        WHERE id = %s AND status = 'processing'
+    """, (summary_id,))
+    db.commit()
+    cursor.close()
+
 def set_summary_done(db, summary_id, summary_text):
     cursor = db.cursor()
     cursor.execute("""
@@ -186,3 +218,170 @@ def save_speech_metrics(db, entry_id, wpm, pause_rate, filler_words, clarity_sco
     """, (entry_id, wpm, pause_rate, filler_json, clarity_score, confidence_level))
     db.commit()
     cursor.close()
+
+def fetch_entry_batch(db, after_id, end_id, limit, with_text=True):
+    """
+    主キー範囲でエントリをバッチ取得（バックフィル用、キーセットページング）
+    transcript_text が未設定のエントリは対象外
+    """
+    columns = "id, user_id, transcript_text, pii_detected, content_flagged" if with_text else "id"
+    sql = f"SELECT {columns} FROM entries WHERE id > %s AND transcript_text IS NOT NULL"
+    params = [after_id]
+    if end_id is not None:
+        sql += " AND id <= %s"
+        params.append(end_id)
+    sql += " ORDER BY id ASC LIMIT %s"
+    params.append(limit)
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+def fetch_entries_by_ids(db, entry_ids):
+    """指定IDのエントリをまとめて取得（バックフィル用）"""
+    if not entry_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(entry_ids))
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(f"""
+        SELECT id, user_id, transcript_text, pii_detected, content_flagged
+        FROM entries
+        WHERE id IN ({placeholders}) AND transcript_text IS NOT NULL
+        ORDER BY id ASC
+    """, tuple(entry_ids))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+def replace_entry_tags_bulk(db, entry_ids, pairs):
+    """
+    複数エントリのタグを置き換え（バックフィル用）
+    pairs: [(entry_id, tag), ...]
+    """
+    if not entry_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(entry_ids))
+    cursor = db.cursor()
+    cursor.execute(f"DELETE FROM entry_tags WHERE entry_id IN ({placeholders})", tuple(entry_ids))
+    if pairs:
+        cursor.executemany(
+            "INSERT IGNORE INTO entry_tags (entry_id, tag) VALUES (%s, %s)",
+            pairs
+        )
+    db.commit()
+    cursor.close()
+
+def update_entry_flags_bulk(db, rows):
+    """
+    複数エントリのフラグを更新（バックフィル用）
+    rows: [(content_flagged, flag_types_json, entry_id), ...]
+    """
+    if not rows:
+        return
+    cursor = db.cursor()
+    cursor.executemany("""
+        UPDATE entries
+        SET content_flagged = %s,
+            flag_types = %s
+        WHERE id = %s
+    """, rows)
+    db.commit()
+    cursor.close()
+
+def save_speech_analysis_bulk(db, rows):
+    """
+    話し方分析結果をまとめて保存（entry_speech_analysis）
+    rows: [(entry_id, speech_rate, filler_word_rate, avg_sentence_length, vocabulary_diversity), ...]
+    """
+    if not rows:
+        return
+    cursor = db.cursor()
+    cursor.executemany("""
+        INSERT INTO entry_speech_analysis
+        (entry_id, speech_rate, filler_word_rate, avg_sentence_length, vocabulary_diversity)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        speech_rate = VALUES(speech_rate),
+        filler_word_rate = VALUES(filler_word_rate),
+        avg_sentence_length = VALUES(avg_sentence_length),
+        vocabulary_diversity = VALUES(vocabulary_diversity),
+        analyzed_at = CURRENT_TIMESTAMP
+    """, rows)
+    db.commit()
+    cursor.close()
+
+def get_stage_fingerprints(db, entry_ids, stage):
+    """
+    ステージの保存済みフィンガープリントをまとめて取得
+
+    Returns:
+        entry_id -> fingerprint
+    """
+    if not entry_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(entry_ids))
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(f"""
+        SELECT entry_id, fingerprint
+        FROM entry_stage_results
+        WHERE stage = %s AND entry_id IN ({placeholders})
+    """, (stage, *entry_ids))
+    rows = cursor.fetchall()
+    cursor.close()
+    return {r['entry_id']: r['fingerprint'] for r in rows}
+
+def save_stage_results_bulk(db, rows):
+    """
+    ステージ結果とフィンガープリントをまとめて保存
+    rows: [(entry_id, stage, fingerprint, output_json), ...]
+    """
+    if not rows:
+        return
+    cursor = db.cursor()
+    cursor.executemany("""
+        INSERT INTO entry_stage_results
+        (entry_id, stage, fingerprint, output)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        fingerprint = VALUES(fingerprint),
+        output = VALUES(output)
+    """, rows)
+    db.commit()
+    cursor.close()
+
+def update_entry_stt_stats(db, entry_id, upload_bytes, bytes_saved, trimmed_ms, latency_ms):
+    """
+    STTの送信サイズ・前処理による削減量・所要時間を記録
+    前処理を行わなかった場合は bytes_saved / trimmed_ms に None を渡す
+    """
+    cursor = db.cursor()
+    cursor.execute("""
+        UPDATE entries
+        SET stt_upload_bytes = %s,
+            stt_bytes_saved = %s,
+            stt_trimmed_ms = %s,
+            stt_latency_ms = %s
+        WHERE id = %s
+    """, (upload_bytes, bytes_saved, trimmed_ms, latency_ms, entry_id))
+    db.commit()
+    cursor.close()
+
+def save_openai_usage_bulk(db, rows):
+    """
+    OpenAI の使用量をまとめて保存
+    rows: [(job_type, job_id, user_id, stage, operation, model,
+            prompt_tokens, completion_tokens, request_bytes, duration_ms, cost_usd, tokens_estimated), ...]
+    """
+    if not rows:
+        return
+    cursor = db.cursor()
+    cursor.executemany("""
+        INSERT INTO openai_usage
+        (job_type, job_id, user_id, stage, operation, model,
+         prompt_tokens, completion_tokens, request_bytes, duration_ms, cost_usd, tokens_estimated)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+    db.commit()
+    cursor.close()
@@ -0,0 +1,136 @@
+"""
+ジョブの投入と取り出し（冪等キーによる集約）
+
+同じ対象へのジョブ（同じエントリの PROCESS_ENTRY など）がキューに複数積まれないよう、
+投入時に冪等キーで1件に集約する
+
+- 投入: ペイロード本体は {queue}:pending（ハッシュ、冪等キー -> 最新のペイロード）に置き、
+  キューには参照 {"type": ..., "idempotencyKey": ...} だけを積む
+  既に同じキーが待機中ならペイロードを上書きするだけで、キューには積まない（最新のオプションが勝つ）
+- 取り出し: 参照を取り出したらペイロードをハッシュから取得と同時に削除して実行する
+  取得後に届いた同じキーのジョブは新しいジョブとして積まれる
+- 冪等キーは payload の idempotencyKey、なければジョブ種別と対象IDから作る
+  キーを作れないジョブ（BACKFILL_BATCH など）は従来どおりそのまま積む
+- ワーカー（main.py / worker.py）は pop_job で取り出す（参照の解決を漏らさないため）
+- 冪等キーを持たない生のペイロード（API から直接積まれたもの）もそのまま実行する
+- CUSTOM_SUMMARY は同じキーで再投入されたら実行中の古いジョブをキャンセルする（app.cancellation）
+"""
+
+import json
+import time
+
+from app.cancellation import cancel_job
+from app.metrics import REGISTRY
+
+QUEUE_KEY = "jobs:default"
+
+# ジョブ種別 -> 対象を表すフィールド
+COALESCE_FIELDS = {
+    "PROCESS_ENTRY": ("entryId",),
+    "PROCESS_RANGE_SUMMARY": ("summaryId",),
+    "CUSTOM_SUMMARY": ("entryId",),
+    "AUDIO_ENHANCEMENT": ("entryId", "enhancementTypes", "enhancementType"),
+    "BACKFILL": ("backfillId",),
+}
+
+# 再投入されたら実行中の同じキーのジョブをキャンセルする種別（最新の要求だけに意味がある）
+SUPERSEDING_TYPES = ("CUSTOM_SUMMARY",)
+
+# 待機中でなければ登録して参照を積む / 待機中ならペイロードだけ上書き
+ENQUEUE_SCRIPT = """
+local added = redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+if added == 1 then
+  redis.call('lpush', KEYS[2], ARGV[3])
+end
+return added
+"""
+
+# ペイロードを取得して削除
+CLAIM_SCRIPT = """
+local payload = redis.call('hget', KEYS[1], ARGV[1])
+if payload then
+  redis.call('hdel', KEYS[1], ARGV[1])
+end
+return payload
+"""
+
+
+def pending_key(queue=QUEUE_KEY):
+    return f"{queue}:pending"
+
+
+def idempotency_key(job):
+    """
+    ジョブの冪等キー（集約しないジョブは None）
+
+    payload の idempotencyKey を優先し、なければ種別と対象IDから作る
+    """
+    if job.get("idempotencyKey"):
+        return str(job["idempotencyKey"])
+    fields = COALESCE_FIELDS.get(job.get("type"))
+    if not fields or job.get(fields[0]) is None:
+        return None
+    parts = [job["type"]]
+    for field in fields:
+        value = job.get(field)
+        if isinstance(value, list):
+            value = ",".join(sorted(str(v) for v in value))
+        if value is not None:
+            parts.append(str(value))
+    return ":".join(parts)
+
+
+def enqueue_job(r, job, queue=QUEUE_KEY):
+    """
+    ジョブを投入
+
+    Returns:
+        新たにキューに積んだか（False なら待機中のジョブに集約された）
+    """
+    key = idempotency_key(job)
+    if key is None:
+        r.lpush(queue, json.dumps(job, ensure_ascii=False))
+        return True
+
+    if job.get("type") in SUPERSEDING_TYPES:
+        cancel_job(r, key)
+
+    payload = dict(job, idempotencyKey=key)
+    # 参照には最初に積んだ時刻を入れる（キューの待ち時間の計測用、app.autoscale）
+    ref = {"type": job.get("type"), "idempotencyKey": key, "coalesced": True, "enqueuedAt": round(time.time(), 3)}
+    added = bool(r.eval(
+        ENQUEUE_SCRIPT, 2, pending_key(queue), queue,
+        key, json.dumps(payload, ensure_ascii=False), json.dumps(ref, ensure_ascii=False),
+    ))
+    if not added:
+        REGISTRY.inc("worker_jobs_coalesced_total", help_text="Jobs merged into an already queued job",
+                     type=job.get("type"))
+    return added
+
+
+def claim_job(r, job, queue=QUEUE_KEY):
+    """
+    取り出したジョブを実行するペイロードに解決
+
+    参照なら最新のペイロードを取得（既に取得済みなら None）、それ以外はそのまま返す
+    """
+    if not job.get("coalesced"):
+        return job
+    raw = r.eval(CLAIM_SCRIPT, 1, pending_key(queue), job["idempotencyKey"])
+    if raw is None:
+        return None
+    return json.loads(raw)
+
+
+def pop_job(r, timeout, queue=QUEUE_KEY):
+    """
+    キューから1件取り出して実行するペイロードに解決（BRPOP + claim_job）
+
+    Returns:
+        ペイロード（タイムアウト・集約済みの参照なら None）
+    """
+    popped = r.brpop(queue, timeout=timeout)
+    if not popped:
+        return None
+    _, raw = popped
+    return claim_job(r, json.loads(raw), queue)
@@ -0,0 +1,235 @@
+"""
+NumPy ベースの音声DSP
+pydub の effects（サンプル単位の Python ループ）を置き換えるベクトル化実装
+
+- バイクアッド（RBJ cookbook）ハイパス/ローパス: 周波数応答から求めたインパルス応答を
+  FFT の overlap-add で畳み込む（IIR の出力と数値誤差の範囲で一致）
+- RMS ベースのダイナミックレンジ圧縮
+- ピーク正規化・ゲイン
+
+サンプルは float64 の (frames, channels) 配列、値域 [-1, 1] で扱う
+"""
+
+import math
+
+import numpy as np
+
+# インパルス応答の打ち切り（残差がこの値を下回るまで）
+_IR_TOLERANCE = 1e-9
+_IR_MAX_LEN = 1 << 16
+_BLOCK_SIZE = 1 << 16
+
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def segment_to_array(audio):
+    """
+    AudioSegment を (frames, channels) の float 配列に変換
+
+    Returns:
+        (samples, frame_rate)
+    """
+    if audio.sample_width not in _DTYPES:
+        audio = audio.set_sample_width(2)
+    dtype = _DTYPES[audio.sample_width]
+    raw = np.frombuffer(audio.raw_data, dtype=dtype)
+    scale = float(2 ** (8 * audio.sample_width - 1))
+    samples = raw.reshape(-1, audio.channels).astype(np.float64) / scale
+    return samples, audio.frame_rate
+
+
+def array_to_segment(samples, template):
+    """float 配列を template と同じ形式の AudioSegment に戻す（クリップあり）"""
+    sample_width = template.sample_width if template.sample_width in _DTYPES else 2
+    dtype = _DTYPES[sample_width]
+    scale = float(2 ** (8 * sample_width - 1))
+    clipped = np.clip(samples, -1.0, (scale - 1) / scale)
+    data = np.round(clipped * scale).astype(dtype).tobytes()
+    return template._spawn(data, overrides={
+        'sample_width': sample_width,
+        'frame_rate': template.frame_rate,
+        'channels': template.channels,
+    })
+
+
+def biquad_coefficients(kind, cutoff, rate, q=1 / math.sqrt(2)):
+    """
+    RBJ cookbook のバイクアッド係数
+
+    Returns:
+        (b, a) 正規化済み（a[0] == 1）
+    """
+    cutoff = min(cutoff, rate / 2 * 0.999)
+    w0 = 2 * math.pi * cutoff / rate
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    if kind == 'low_pass':
+        b = [(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2]
+    elif kind == 'high_pass':
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+    else:
+        raise ValueError(f"unknown biquad kind: {kind}")
+    a = [1 + alpha, -2 * cos_w0, 1 - alpha]
+    return np.array(b) / a[0], np.array(a) / a[0]
+
+
+def _impulse_response(b, a):
+    """バイクアッドのインパルス応答（極の半径から減衰長を決め、周波数応答の逆FFTで求める）"""
+    radius = float(np.max(np.abs(np.roots(a))))
+    if radius >= 1.0:
+        raise ValueError("unstable filter")
+    if radius == 0.0:
+        length = 3
+    else:
+        length = int(math.ceil(math.log(_IR_TOLERANCE) / math.log(radius))) + 3
+    length = min(max(length, 3), _IR_MAX_LEN)
+    # 時間領域のエイリアスを避けるため十分長いFFTで評価してから切り詰める
+    n_fft = 1 << int(math.ceil(math.log2(length * 4)))
+    z = np.exp(-1j * np.linspace(0, math.pi, n_fft // 2 + 1))
+    response = (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+    return np.fft.irfft(response, n_fft)[:length]
+
+
+def fft_convolve(x, h, block_size=_BLOCK_SIZE):
+    """
+    overlap-add による FFT 畳み込み（出力長は入力と同じ）
+
+    Args:
+        x: (frames, channels) 配列
+        h: インパルス応答（1次元）
+    """
+    frames = x.shape[0]
+    if frames == 0:
+        return x.copy()
+    n_fft = 1 << int(math.ceil(math.log2(block_size + len(h) - 1)))
+    H = np.fft.rfft(h, n_fft)[:, None]
+    y = np.zeros((frames + n_fft, x.shape[1]))
+    for start in range(0, frames, block_size):
+        block = x[start:start + block_size]
+        Y = np.fft.rfft(block, n_fft, axis=0) * H
+        y[start:start + n_fft] += np.fft.irfft(Y, n_fft, axis=0)
+    return y[:frames]
+
+
+def biquad_filter(x, kind, cutoff, rate, q=1 / math.sqrt(2)):
+    """バイクアッドフィルタ（high_pass / low_pass）"""
+    b, a = biquad_coefficients(kind, cutoff, rate, q)
+    return fft_convolve(x, _impulse_response(b, a))
+
+
+def high_pass(x, cutoff, rate):
+    return biquad_filter(x, 'high_pass', cutoff, rate)
+
+
+def low_pass(x, cutoff, rate):
+    return biquad_filter(x, 'low_pass', cutoff, rate)
+
+
+def _moving_average(x, window):
+    """1次元配列の中心移動平均（累積和で計算）"""
+    window = max(int(window), 1)
+    if window == 1 or len(x) == 0:
+        return x
+    padded = np.concatenate([np.full(window // 2, x[0]), x, np.full(window - window // 2 - 1, x[-1])])
+    cumsum = np.cumsum(np.concatenate([[0.0], padded]))
+    return (cumsum[window:] - cumsum[:-window]) / window
+
+
+def compress_rms(x, rate, threshold=-20.0, ratio=4.0, attack=5.0, release=50.0):
+    """
+    RMSベースのダイナミックレンジ圧縮（pydub.effects.compress_dynamic_range 相当）
+
+    Args:
+        threshold: しきい値（dBFS）
+        ratio: 圧縮比
+        attack / release: ゲイン平滑化の窓（ミリ秒）
+    """
+    if len(x) == 0:
+        return x.copy()
+    power = np.mean(x ** 2, axis=1)
+    rms = np.sqrt(_moving_average(power, rate * attack / 1000.0))
+    level_db = 20 * np.log10(np.maximum(rms, 1e-10))
+    reduction_db = np.where(level_db > threshold, (level_db - threshold) * (1 - 1.0 / ratio), 0.0)
+    reduction_db = _moving_average(reduction_db, rate * release / 1000.0)
+    return x * (10 ** (-reduction_db / 20))[:, None]
+
+
+def normalize_peak(x, headroom=0.1):
+    """ピークが -headroom dBFS になるよう正規化（pydub.effects.normalize 相当）"""
+    peak = float(np.max(np.abs(x))) if x.size else 0.0
+    if peak == 0.0:
+        return x.copy()
+    target = 10 ** (-headroom / 20)
+    return x * (target / peak)
+
+
+def apply_gain(x, db):
+    return x * (10 ** (db / 20))
+
+
+def apply_filter(x, spec, rate):
+    """audio_processor のフィルタ定義 (名前, パラメータ) を配列に適用"""
+    name, param = spec
+    if name == 'high_pass':
+        return high_pass(x, param, rate)
+    if name == 'low_pass':
+        return low_pass(x, param, rate)
+    if name == 'compress':
+        threshold, ratio = param
+        return compress_rms(x, rate, threshold=threshold, ratio=ratio)
+    if name == 'normalize':
+        return normalize_peak(x)
+    if name == 'gain':
+        return apply_gain(x, param)
+    raise ValueError(f"unknown filter: {name}")
+
+
+def frame_levels(x, rate, frame_ms=10):
+    """フレームごとの RMS レベル（dBFS）"""
+    frame = max(int(rate * frame_ms / 1000), 1)
+    n_frames = len(x) // frame
+    if n_frames == 0:
+        return np.array([])
+    power = np.mean(x[:n_frames * frame] ** 2, axis=1).reshape(n_frames, frame).mean(axis=1)
+    return 10 * np.log10(np.maximum(power, 1e-20))
+
+
+def shorten_silence(x, rate, thresh_db, max_pause_ms=1000, keep_ms=200, frame_ms=10):
+    """
+    前後の無音を除去し、途中の長い無音を max_pause_ms に縮める
+
+    Args:
+        thresh_db: これ未満のフレームを無音とみなす（dBFS）
+        max_pause_ms: 途中の無音の最大長
+        keep_ms: 発話の前後に残す無音
+
+    Returns:
+        無音を詰めた配列（全体が無音なら空配列）
+    """
+    frame = max(int(rate * frame_ms / 1000), 1)
+    voiced = frame_levels(x, rate, frame_ms) >= thresh_db
+    if not voiced.any():
+        return x[:0]
+
+    # 発話フレームの前後 keep_ms を残す
+    keep = max(int(keep_ms / frame_ms), 0)
+    if keep:
+        voiced = np.convolve(voiced.astype(np.int32), np.ones(2 * keep + 1, dtype=np.int32), mode='same') > 0
+
+    # 途中の無音区間は先頭から max_pause_ms 分だけ残す
+    max_pause = max(int(max_pause_ms / frame_ms), 0)
+    idx = np.flatnonzero(voiced)
+    first, last = idx[0], idx[-1]
+    inner = voiced[first:last + 1]
+    silent = ~inner
+    starts = silent & np.concatenate([[True], inner[:-1]])
+    keep_frames = inner.copy()
+    if starts.any():
+        start_pos = np.flatnonzero(starts)
+        run_index = np.maximum(np.cumsum(starts) - 1, 0)
+        position = np.arange(len(inner)) - start_pos[run_index]
+        keep_frames |= position < max_pause
+
+    frames = np.flatnonzero(keep_frames) + first
+    sample_idx = (frames[:, None] * frame + np.arange(frame)[None, :]).ravel()
+    return x[sample_idx]
@@ -0,0 +1,88 @@
+"""
+ジョブの進捗・完了イベント（Redis pub/sub）
+
+クライアントがステータスをポーリングしなくて済むよう、ユーザーごとのチャンネルに
+小さな JSON イベントを publish し、API のリアルタイム層（api/websocket/realtime.js）が中継する
+
+- チャンネル: events:user:{user_id}
+- イベント: {"type": ..., "ts": UNIX 秒, 対象ID（entryId / summaryId）, ...}
+  - stage.started / stage.finished（ms: 所要ミリ秒、failed: 失敗したか）
+  - entry.done / entry.failed
+  - summary.ready / summary.failed
+- 対象とユーザーは event_context / bind_event_user で設定する（ユーザー確定前のイベントは送らない）
+- publish の失敗はジョブを止めない（イベントは補助的な通知で、状態の正は DB）
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.metrics import REGISTRY
+
+CHANNEL_PREFIX = "events:user:"
+
+# Redis クライアント・対象・ユーザー（ジョブ内で bind_event_user により後から設定できるよう dict で持つ）
+_event_scope = ContextVar("event_scope", default=None)
+
+
+def user_channel(user_id):
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+
+def publish_event(r, user_id, event_type, **fields):
+    """ユーザーのチャンネルにイベントを送る（失敗しても例外は送出しない）"""
+    event = {"type": event_type, "ts": round(time.time(), 3), **fields}
+    try:
+        r.publish(user_channel(user_id), json.dumps(event, ensure_ascii=False, separators=(",", ":")))
+    except Exception as e:
+        print(f"[EVENTS] Failed to publish {event_type}: {e}")
+        return
+    REGISTRY.inc("worker_events_published_total", help_text="Realtime events published", type=event_type)
+
+
+@contextmanager
+def event_context(r, user_id=None, **subject):
+    """
+    ジョブの実行範囲でイベントの送り先を設定
+
+    Args:
+        r: Redis クライアント（None なら送らない）
+        user_id: ユーザーID（ジョブ開始時に不明なら bind_event_user で後から設定）
+        subject: イベントに付ける対象ID（entryId=... / summaryId=...）
+    """
+    token = _event_scope.set({"r": r, "user_id": user_id, "subject": subject})
+    try:
+        yield
+    finally:
+        _event_scope.reset(token)
+
+
+def bind_event_user(user_id):
+    """実行中のジョブにイベントの送り先ユーザーを設定（エントリ取得後に呼ぶ）"""
+    scope = _event_scope.get()
+    if scope is not None:
+        scope["user_id"] = user_id
+
+
+def emit(event_type, **fields):
+    """実行中のジョブの対象・ユーザーでイベントを送る（ジョブ外・ユーザー未確定なら何もしない）"""
+    scope = _event_scope.get()
+    if scope is None or scope["r"] is None or scope["user_id"] is None:
+        return
+    publish_event(scope["r"], scope["user_id"], event_type, **scope["subject"], **fields)
+
+
+@contextmanager
+def stage_events(stage):
+    """ステージの開始・終了イベントを送る"""
+    emit("stage.started", stage=stage)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        emit("stage.finished", stage=stage, ms=round((time.perf_counter() - start) * 1000), failed=failed)
@@ -0,0 +1,145 @@
+"""
+ヘッジリクエスト（テールレイテンシ対策）
+
+プロバイダ呼び出しが直近の p95 を超えても返らない場合に同じリクエストをもう1本送り、
+先に返った方の結果を使う
+
+- 待ち時間（ヘッジ遅延）は操作ごとに直近の所要時間から求める（min_samples 件に満たない間はヘッジしない）
+- ヘッジ率は直近の呼び出しに対する割合 max_ratio までに制限する（障害時に負荷を倍にしない）
+- ヘッジ側の呼び出しはステージ名に ":hedge" を付けて実行し、
+  使用量（openai_usage・メトリクス）で追加コストを区別できるようにする
+- HEDGE_ENABLED=1 で有効（既定は無効）
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app.metrics import REGISTRY, current_stage
+
+# 所要時間の保持件数 / ヘッジ率を計算する直近の呼び出し数
+LATENCY_WINDOW = 200
+RATE_WINDOW = 200
+
+
+class Hedger:
+    """
+    Args:
+        name: 操作名（stt / chat）
+        quantile: ヘッジ遅延に使う分位点
+        max_ratio: ヘッジしてよい呼び出しの割合
+        min_delay_sec: ヘッジ遅延の下限
+        min_samples: ヘッジを始めるのに必要な観測数
+    """
+
+    def __init__(self, name, quantile=0.95, max_ratio=0.05, min_delay_sec=1.0, min_samples=20,
+                 max_workers=8, clock=time.perf_counter):
+        self.name = name
+        self.quantile = quantile
+        self.max_ratio = max_ratio
+        self.min_delay_sec = min_delay_sec
+        self.min_samples = min_samples
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._hedged = deque(maxlen=RATE_WINDOW)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{name}")
+
+    def observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """ヘッジを送るまでの待ち時間（観測数が足りなければ None）"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            values = sorted(self._latencies)
+        index = min(int(self.quantile * len(values)), len(values) - 1)
+        return max(self.min_delay_sec, values[index])
+
+    def _record(self, hedge_wanted):
+        """呼び出しを記録し、ヘッジしてよいか（ヘッジ率の上限内か）を返す"""
+        with self._lock:
+            allowed = False
+            if hedge_wanted:
+                window = max(len(self._hedged) + 1, self.min_samples)
+                allowed = sum(self._hedged) + 1 <= self.max_ratio * window
+            self._hedged.append(allowed)
+            return allowed
+
+    def _timed(self, fn, args, kwargs, stage):
+        if stage is not None:
+            current_stage.set(stage)
+        start = self._clock()
+        result = fn(*args, **kwargs)
+        self.observe(self._clock() - start)
+        return result
+
+    def _submit(self, fn, args, kwargs, stage=None):
+        ctx = contextvars.copy_context()
+        return self._pool.submit(ctx.run, self._timed, fn, args, kwargs, stage)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        fn を実行し、遅ければ同じ呼び出しをもう1本送って先に成功した結果を返す
+        両方失敗した場合は先に失敗した方の例外を送出する
+        """
+        delay = self.hedge_delay()
+        primary = self._submit(fn, args, kwargs)
+        if delay is None:
+            self._record(False)
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if not self._record(not done):
+            return primary.result()
+
+        hedge_stage = f"{current_stage.get() or self.name}:hedge"
+        hedge = self._submit(fn, args, kwargs, stage=hedge_stage)
+        REGISTRY.inc("worker_hedges_total", help_text="Hedged duplicate provider requests", operation=self.name)
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = "primary" if future is primary else "hedge"
+                    REGISTRY.inc("worker_hedge_wins_total", help_text="Which request answered first when hedged",
+                                 operation=self.name, winner=winner)
+                    # 遅い方は結果を捨てる（実行中の HTTP 呼び出しは止められない）
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name):
+    """操作ごとのプロセス共有 Hedger（HEDGE_ENABLED が無効なら None）"""
+    from app.config import get_hedging_settings
+
+    settings = get_hedging_settings()
+    if not settings.pop("enabled"):
+        return None
+    with _hedgers_lock:
+        hedger = _hedgers.get(name)
+        if hedger is None:
+            hedger = _hedgers[name] = Hedger(name, **settings)
+        return hedger
+
+
+def hedged_call(name, fn, *args, **kwargs):
+    """ヘッジが有効なら Hedger 経由、無効ならそのまま fn を呼ぶ"""
+    hedger = get_hedger(name)
+    if hedger is None:
+        return fn(*args, **kwargs)
+    return hedger.call(fn, *args, **kwargs)
@@ -4,24 +4,25 @@ Phase4対応のジョブ処理モジュール
 """
 
 import re
-import json
 from datetime import datetime
 
-# 既存モジュール
-from app.providers_openai import stt_openai
-from app.cleaner import clean_transcript
-from app.summarizer import chat_summary
-from app.pii_detector import detect_and_mask
-from app.ng_detector import detect_ng_patterns
-from app.tagger import extract_tags
-
+# process_entry の各段階は app.pipelines.entry
 # Phase4新規モジュール
-from app.emotion_analyzer import analyze_emotion
-from app.keyword_extractor import extract_keywords_and_topics
-from app.speech_analyzer import analyze_speech_patterns
-from app.action_extractor import extract_action_items, save_action_items
 from app.custom_summarizer import generate_custom_summary
-from app.audio_processor import enhance_audio
+from app.audio_processor import process_variants, prepare_for_stt, DEFAULT_EXPORT_FORMAT
+from app.storage import derive_variant_key, put_stream, fetch_object, release_object
+from app.metrics import timed_job, stage_timer, add_bytes, add_tokens
+from app.tokenizer import tokenize
+from app.usage import bind_user
+from app.events import emit, event_context, stage_events
+from app.streaming import stream_key, summary_stream
+from app.locks import LockManager, LeaseLostError
+from app.cancellation import JobCancelled
+from app.circuit import CircuitOpenError
+from app.retry import is_retryable
+from app.config import get_openai_model, get_pipeline_settings, get_stt_preprocess_settings
+from app.providers_openai import chat_completion
+from app.text_resources import default_resources
 
 _BULLET_RE = re.compile(r'^[・•‣-]', re.MULTILINE)
 
@@ -30,6 +31,14 @@ def is_bullet_format_ok(text):
         return False
     return bool(_BULLET_RE.search(text))
 
+def _propagates(error):
+    """
+    ジョブ内の汎用フォールバックで握りつぶさず Worker に返す例外か
+
+    依存先の障害（CircuitOpenError）・キャンセル・一時的なエラーは Worker が退避・リトライを判断する
+    """
+    return isinstance(error, (CircuitOpenError, JobCancelled)) or is_retryable(error)
+
 def parse_audio_key(audio_url, bucket):
     prefix = f"s3://{bucket}/"
     if audio_url.startswith(prefix):
@@ -38,157 +47,114 @@ def parse_audio_key(audio_url, bucket):
         return audio_url[1:]
     return audio_url
 
-def detect_flags(text, ng_patterns, nonsave_patterns):
-    flagged = 0
-    flag_list = []
-    if not text:
-        return (flagged, flag_list)
+def preprocess_for_stt(entry_id, audio_data, audio_key):
+    """
+    STT前処理（STT_PREPROCESS=1 のときのみ）
     
-    for pat in ng_patterns:
-        if re.search(pat, text, re.IGNORECASE):
-            flagged = 1
-            if "ng_pattern" not in flag_list:
-                flag_list.append("ng_pattern")
-            break
+    Returns:
+        (STTに送る音声データ, その形式（拡張子、不明なら None）, 統計)
+        失敗時・無効時は元データと元の形式、空の統計
+    """
+    source_format = audio_key.rsplit(".", 1)[-1].lower() if "." in audio_key else None
+    settings = get_stt_preprocess_settings()
+    if not settings["enabled"]:
+        return audio_data, source_format, {}
     
-    for pat in nonsave_patterns:
-        if re.search(pat, text, re.IGNORECASE):
-            flagged = 1
-            if "non_save" not in flag_list:
-                flag_list.append("non_save")
-            break
+    try:
+        prepared, stt_format, stats = prepare_for_stt(
+            audio_data, source_format,
+            export_format=settings["export_format"],
+            max_pause_ms=settings["max_pause_ms"]
+        )
+    except Exception as e:
+        print(f"[PROCESS_ENTRY] STT preprocess failed for {entry_id}, using original: {e}")
+        return audio_data, source_format, {}
     
-    return (flagged, flag_list)
+    stats["trimmed_ms"] = stats["original_ms"] - stats["prepared_ms"]
+    print(f"[PROCESS_ENTRY] STT preprocess {entry_id}: {stats['original_bytes']} -> "
+          f"{stats['upload_bytes']} bytes, trimmed {stats['trimmed_ms']}ms")
+    return prepared, stt_format, stats
 
+@timed_job("process_entry")
 def process_entry(
     entry_id, r, db, minio, bucket, openai_client,
     resources, ng_patterns, nonsave_patterns
 ):
     """
     Phase4対応: 感情分析、キーワード抽出、話し方分析、アクションアイテム抽出を追加
-    """
-    from app.db import get_entry, update_entry, save_entry_tags, save_emotion_analysis, save_keywords, save_speech_metrics
     
-    lock_key = f"lock:entry:{entry_id}"
-    if not r.set(lock_key, "1", nx=True, ex=300):
-        print(f"[PROCESS_ENTRY] Entry {entry_id} locked")
-        return
+    各段階は app.pipelines.entry の PipelineStep として実装されている
+    PIPELINE_RUNNER=async なら依存グラフに従って並行実行する（AsyncPipeline）
+    ロックはハートビートで延長されるリースで、エントリ更新はフェンシングトークン付きで行う
+    ステージの開始・終了と完了はユーザーのチャンネルにイベントとして送る（app.events）
+    """
+    from app.pipelines.async_pipeline import AsyncPipeline
+    from app.pipelines.base import RedisStepCache
+    from app.pipelines.entry import build_entry_pipeline
     
-    try:
-        entry = get_entry(db, entry_id)
-        if not entry:
-            print(f"[PROCESS_ENTRY] Entry {entry_id} not found")
-            return
-        
-        if entry.get("transcript_text"):
-            print(f"[PROCESS_ENTRY] Entry {entry_id} already processed")
+    with LockManager(r).lease(f"lock:entry:{entry_id}") as lease:
+        if lease is None:
+            print(f"[PROCESS_ENTRY] Entry {entry_id} locked")
             return
         
-        audio_url = entry["audio_url"]
-        user_id = entry["user_id"]
-        audio_key = parse_audio_key(audio_url, bucket)
-        
-        # 音声データ取得
-        print(f"[PROCESS_ENTRY] Downloading {audio_key}")
-        obj = minio.get_object(bucket, audio_key)
-        audio_data = obj.read()
-        obj.close()
-        
-        # STT
-        print(f"[PROCESS_ENTRY] Transcribing {entry_id}")
-        raw = stt_openai(openai_client, audio_data)
-        cleaned = clean_transcript(raw, resources)
-        
-        # PII検出とマスク
-        pii_detected, pii_types, masked = detect_and_mask(cleaned)
-        pii_json = json.dumps(pii_types, ensure_ascii=False) if pii_types else None
-        
-        # NG検出
-        ng_result = detect_ng_patterns(masked)
-        old_flagged, old_flags = detect_flags(masked, ng_patterns, nonsave_patterns)
-        
-        content_flagged = 0
-        flag_types = []
-        
-        # PIIがあれば先頭に挿入
-        if pii_detected:
-            content_flagged = 1
-            flag_types.append("pii")
-        
-        # NGパターン
-        if ng_result["flagged"]:
-            content_flagged = 1
-            flag_types.extend(ng_result["reasons"])
-        
-        if old_flagged:
-            content_flagged = 1
-            flag_types.extend(old_flags)
-        
-        flag_types = list(set(flag_types))
-        flag_json = json.dumps(flag_types, ensure_ascii=False) if flag_types else None
-        
-        # 要約生成（content_flagged = 0 のみ）
-        summ = None
-        if masked and content_flagged == 0:
-            print(f"[PROCESS_ENTRY] Summarizing {entry_id}")
-            summ = chat_summary(openai_client, masked)
-            if summ and not is_bullet_format_ok(summ):
-                print(f"[PROCESS_ENTRY] Summary format invalid, retrying")
-                summ = chat_summary(openai_client, masked)
-        
-        # DB更新
-        update_entry(db, entry_id, masked, summ, pii_detected, pii_json, content_flagged, flag_json)
-        
-        # Phase4追加処理（content_flagged = 0 のみ）
-        if masked and content_flagged == 0:
-            # タグ抽出
-            tags = extract_tags(openai_client, masked)
-            if tags:
-                save_entry_tags(db, entry_id, tags)
-            
-            # 感情分析
-            emotion_result = analyze_emotion(openai_client, masked)
-            if emotion_result:
-                save_emotion_analysis(
-                    db, entry_id,
-                    emotion_result["primary_emotion"],
-                    emotion_result["emotions"],
-                    emotion_result["valence"],
-                    emotion_result["arousal"],
-                    emotion_result["dominance"]
-                )
-            
-            # キーワード・トピック抽出
-            keyword_result = extract_keywords_and_topics(openai_client, masked)
-            if keyword_result:
-                save_keywords(db, entry_id, keyword_result["keywords"], keyword_result["topics"])
+        pipeline = build_entry_pipeline(
+            db, minio, bucket, openai_client, resources, ng_patterns, nonsave_patterns,
+            cache=RedisStepCache(r)
+        )
+        settings = get_pipeline_settings()
+        if settings["runner"] == "async":
+            pipeline = AsyncPipeline.from_pipeline(pipeline, max_concurrency=settings["max_concurrency"])
+        with event_context(r, entryId=entry_id):
+            context = pipeline.run({"entry_id": entry_id, "lease": lease})
+            # キャッシュ経由でダウンロードした音声の mmap を閉じる
+            release_object(context.get("audio_data"))
             
-            # 話し方分析
-            speech_result = analyze_speech_patterns(masked)
-            if speech_result:
-                save_speech_metrics(
-                    db, entry_id,
-                    speech_result["words_per_minute"],
-                    speech_result["pause_rate"],
-                    speech_result["filler_words"],
-                    speech_result["clarity_score"],
-                    speech_result["confidence_level"]
-                )
+            if "error" in context:
+                error = context["error"]
+                if isinstance(error["exception"], LeaseLostError):
+                    # 他のWorkerが処理を引き継いでいるので、このWorkerの結果は捨てる
+                    print(f"[PROCESS_ENTRY] Entry {entry_id} abandoned at {error['step']}: {error['message']}")
+                    return
+                print(f"[PROCESS_ENTRY] Entry {entry_id} failed at {error['step']}: {error['message']}")
+                emit("entry.failed", stage=error["step"])
+                raise error["exception"]
             
-            # アクションアイテム抽出
-            action_items = extract_action_items(openai_client, masked)
-            if action_items:
-                save_action_items(db, entry_id, user_id, action_items)
+            if context.get("halt"):
+                return
+            emit("entry.done")
         
-        print(f"[PROCESS_ENTRY] Entry {entry_id} done")
-        
-    finally:
-        r.delete(lock_key)
+        timings = " ".join(
+            f"{name}={sec * 1000:.0f}ms" for name, sec in context["step_timings"].items() if sec is not None
+        )
+        print(f"[PROCESS_ENTRY] Entry {entry_id} done ({timings})")
+
+
+def range_summary(text, template_id=None, resources=None):
+    """
+    期間要約を生成（プロンプトはリソースの range_summary_user テンプレート、template_id がなければ default）
+    
+    Returns:
+        要約テキスト（生成できなければ None）
+    """
+    resources = resources or default_resources()
+    templates = resources.range_summary_user_templates
+    template = templates.get(template_id) or templates["default"]
+    return chat_completion([
+        {"role": "system", "content": resources.entry_summary_system},
+        {"role": "user", "content": template.replace("{TEXT}", text)},
+    ], model=get_openai_model())
 
-def process_range_summary(summary_id, db, openai_client):
-    """期間要約処理"""
+@timed_job("process_range_summary")
+def process_range_summary(summary_id, db, openai_client, r=None, resources=None):
+    """
+    期間要約処理
+    
+    r を渡すと完了・失敗をユーザーのチャンネルにイベントとして送り（app.events）、
+    SUMMARY_STREAMING=1 なら生成中のテキストを Redis Stream に書き出す（app.streaming）
+    依存先の障害・一時的なエラーは failed にせず queued に戻して Worker に返す（退避・リトライ）
+    """
     from app.db import (
-        get_summary, claim_summary_processing, set_summary_done,
+        get_summary, claim_summary_processing, release_summary_processing, set_summary_done,
         set_summary_failed, collect_transcripts
     )
     
@@ -201,86 +167,162 @@ def process_range_summary(summary_id, db, openai_client):
         print(f"[PROCESS_RANGE_SUMMARY] Summary {summary_id} already processing")
         return
     
-    try:
-        user_id = summ["user_id"]
-        start = summ["range_start"]
-        end = summ["range_end"]
-        
-        transcripts = collect_transcripts(db, user_id, start, end)
-        
-        if not transcripts:
-            set_summary_failed(db, summary_id, "NO_DATA", "No entries in range")
-            return
-        
-        combined = "\n\n".join(transcripts)
-        summary_text = chat_summary(openai_client, combined)
-        
-        set_summary_done(db, summary_id, summary_text)
-        print(f"[PROCESS_RANGE_SUMMARY] Summary {summary_id} done")
+    with event_context(r, summ["user_id"], summaryId=summary_id):
+        try:
+            user_id = summ["user_id"]
+            bind_user(user_id)
+            start = summ["range_start"]
+            end = summ["range_end"]
+            
+            with stage_timer("db_read"):
+                transcripts = collect_transcripts(db, user_id, start, end)
+            
+            if not transcripts:
+                set_summary_failed(db, summary_id, "NO_DATA", "No entries in range")
+                emit("summary.failed", reason="NO_DATA")
+                return
+            
+            combined = "\n\n".join(transcripts)
+            add_tokens("summary", len(tokenize(combined)))
+            with stage_timer("summary"), stage_events("summary"), \
+                    summary_stream(r, stream_key("range_summary", summary_id)):
+                summary_text = range_summary(combined, summ.get("template_id"), resources)
+            if not summary_text:
+                raise RuntimeError("summary generation returned no text")
+            
+            with stage_timer("db_update"):
+                set_summary_done(db, summary_id, summary_text)
+            emit("summary.ready")
+            print(f"[PROCESS_RANGE_SUMMARY] Summary {summary_id} done")
+            
+        except JobCancelled as e:
+            set_summary_failed(db, summary_id, "CANCELLED", str(e))
+            emit("summary.failed", reason="CANCELLED")
+            raise
         
-    except Exception as e:
-        set_summary_failed(db, summary_id, "PROCESSING_ERROR", str(e))
-        print(f"[PROCESS_RANGE_SUMMARY] Summary {summary_id} failed: {e}")
+        except Exception as e:
+            if _propagates(e):
+                # Worker が退避・リトライするので、再実行時に claim できるよう queued に戻す
+                release_summary_processing(db, summary_id)
+                raise
+            set_summary_failed(db, summary_id, "PROCESSING_ERROR", str(e))
+            emit("summary.failed", reason="PROCESSING_ERROR")
+            print(f"[PROCESS_RANGE_SUMMARY] Summary {summary_id} failed: {e}")
 
-def process_custom_summary(entry_id, custom_options, db, openai_client):
-    """カスタム要約再生成"""
+@timed_job("process_custom_summary")
+def process_custom_summary(entry_id, custom_options, db, openai_client, r=None):
+    """
+    カスタム要約再生成
+    
+    r を渡すと SUMMARY_STREAMING=1 のとき生成中のテキストを Redis Stream に書き出す（app.streaming）
+    """
     from app.db import get_entry, update_entry_summary
     
-    entry = get_entry(db, entry_id)
+    with stage_timer("db_read"):
+        entry = get_entry(db, entry_id)
     if not entry or not entry.get("transcript_text"):
         print(f"[CUSTOM_SUMMARY] Entry {entry_id} not found or no transcript")
         return
     
     transcript = entry["transcript_text"]
+    bind_user(entry["user_id"])
+    
+    add_tokens("custom_summary", len(tokenize(transcript)))
     
     try:
-        custom_summary = generate_custom_summary(
-            openai_client,
-            transcript,
-            custom_options.get("style", "bullet_points"),
-            custom_options.get("length", "medium"),
-            custom_options.get("focus"),
-            custom_options.get("custom_prompt")
-        )
+        with stage_timer("custom_summary"), summary_stream(r, stream_key("custom_summary", entry_id)):
+            custom_summary = generate_custom_summary(
+                transcript,
+                custom_options.get("style", "bullet_points"),
+                custom_options.get("length", "medium"),
+                custom_options.get("focus"),
+                custom_options.get("custom_prompt")
+            )
         
-        update_entry_summary(db, entry_id, custom_summary)
+        with stage_timer("db_update"):
+            update_entry_summary(db, entry_id, custom_summary)
         print(f"[CUSTOM_SUMMARY] Entry {entry_id} custom summary done")
         
     except Exception as e:
+        if _propagates(e):
+            raise
         print(f"[CUSTOM_SUMMARY] Entry {entry_id} failed: {e}")
 
-def process_audio_enhancement(entry_id, enhancement_type, db, minio, bucket):
-    """音声品質向上処理"""
+@timed_job("process_audio_enhancement")
+def process_audio_enhancement(entry_id, enhancement_types, db, minio, bucket, pool=None):
+    """
+    音声品質向上処理
+    
+    音声は1回だけダウンロード・デコードし、指定された全種別のバリアントを生成する
+    
+    Args:
+        enhancement_types: エンハンス種別（文字列または文字列のリスト）
+        pool: AudioPool（指定時は変換を子プロセスで実行し、ここでは投入だけ行う）
+    
+    Returns:
+        pool 指定時は変換の Future（失敗・キャンセルは例外として入る）、
+        キューが満杯で投入できなかった場合は False、インライン実行時は True
+    """
     from app.db import get_entry
     
-    entry = get_entry(db, entry_id)
+    if isinstance(enhancement_types, str):
+        enhancement_types = [enhancement_types]
+    
+    # DB接続はスレッド間で共有できないため、エントリ取得は呼び出し元スレッドで行う
+    with stage_timer("db_read"):
+        entry = get_entry(db, entry_id)
     if not entry:
         print(f"[AUDIO_ENHANCEMENT] Entry {entry_id} not found")
-        return
+        return True
     
-    audio_url = entry["audio_url"]
-    audio_key = parse_audio_key(audio_url, bucket)
+    audio_key = parse_audio_key(entry["audio_url"], bucket)
+    
+    if pool is None:
+        run_audio_enhancement(entry_id, audio_key, enhancement_types, minio, bucket)
+        return True
+    
+    future = pool.submit(run_audio_enhancement, entry_id, audio_key, enhancement_types,
+                         minio, bucket, pool.process)
+    if future is None:
+        return False
+    print(f"[AUDIO_ENHANCEMENT] Entry {entry_id} queued ({pool.pending()} pending)")
+    return future
+
+@timed_job("run_audio_enhancement")
+def run_audio_enhancement(entry_id, audio_key, enhancement_types, minio, bucket, processor=process_variants):
+    """
+    ダウンロード → バリアント生成 → アップロード（DBには触れない）
+    
+    Args:
+        processor: (音声データ, 種別リスト, 入力形式) -> (バリアント, 音声情報)
+                   AudioPool.process を渡すと子プロセスで変換する
+    """
+    source_format = audio_key.rsplit(".", 1)[-1].lower() if "." in audio_key else None
+    audio_data = None
     
     try:
         # 音声ダウンロード
-        obj = minio.get_object(bucket, audio_key)
-        audio_data = obj.read()
-        obj.close()
+        with stage_timer("download"):
+            audio_data = fetch_object(minio, bucket, audio_key)
+        add_bytes("download", len(audio_data))
         
-        # 音声処理
-        enhanced_data = enhance_audio(audio_data, enhancement_type)
+        # 音声処理（1回のデコードで全バリアント + 音声情報）
+        with stage_timer("enhance"):
+            variants, info = processor(audio_data, enhancement_types, source_format)
+        print(f"[AUDIO_ENHANCEMENT] Entry {entry_id} decoded: {info['duration_seconds']:.1f}s "
+              f"{info['frame_rate']}Hz ch={info['channels']}")
         
-        # 新しいキーでアップロード
-        enhanced_key = audio_key.replace(".m4a", f"_{enhancement_type}.m4a")
-        minio.put_object(
-            bucket,
-            enhanced_key,
-            enhanced_data,
-            len(enhanced_data),
-            content_type="audio/m4a"
-        )
-        
-        print(f"[AUDIO_ENHANCEMENT] Entry {entry_id} enhanced: {enhanced_key}")
+        for enhancement_type, enhanced_data in variants.items():
+            # 出力形式の拡張子で新しいキーにアップロード（元のキーは上書きしない）
+            enhanced_key = derive_variant_key(audio_key, enhancement_type, DEFAULT_EXPORT_FORMAT)
+            with stage_timer("upload"):
+                put_stream(minio, bucket, enhanced_key, enhanced_data, fmt=DEFAULT_EXPORT_FORMAT)
+            add_bytes("upload", len(enhanced_data), "out")
+            print(f"[AUDIO_ENHANCEMENT] Entry {entry_id} enhanced: {enhanced_key}")
         
     except Exception as e:
+        if _propagates(e):
+            raise
         print(f"[AUDIO_ENHANCEMENT] Entry {entry_id} failed: {e}")
+    finally:
+        release_object(audio_data)
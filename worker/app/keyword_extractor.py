@@ -1,10 +1,21 @@
 """Keyword extractor processor"""
+from collections import Counter
+
 from .base_processor import BaseProcessor
+from .tokenizer import tokenize, is_function_word, is_hiragana
+
 
 class KeywordExtractor(BaseProcessor):
+    max_keywords = 10
+
     def process(self, entry):
-        """Extract keywords from entry content"""
-        # Placeholder implementation
+        """Extract keywords from entry content (token frequency, function words removed)"""
+        text = entry.get('content') or entry.get('transcript_text') or ''
+        tokens = tokenize(text)
+        candidates = [
+            t for t in tokens
+            if len(t) >= 2 and not t.isdigit() and not is_function_word(t) and not is_hiragana(t)
+        ]
         return {
-            'keywords': []
+            'keywords': [word for word, _ in Counter(candidates).most_common(self.max_keywords)]
         }
@@ -1,2 +1,147 @@
+"""
+Redis ロック
+
+- acquire_lock: 単純な SET NX（処理が TTL より確実に短いもの用）
+- LockManager / Lease: リース方式のロック
+  - 取得時にキーごとに単調増加するフェンシングトークンを払い出す
+  - 保持中はバックグラウンドスレッドが TTL を延長し続ける（ハートビート）
+  - 延長・解放は値を比較してから行う（他のWorkerが取り直したロックを消さない）
+  - 延長に失敗したらリースを失ったものとして扱い、書き込み前の check() で LeaseLostError
+  - 最終的な DB 書き込みはトークン付きで行い、古いトークンの書き込みは DB 側で拒否する
+"""
+
+import threading
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_LEASE_TTL_SEC = 60
+
+# 値が一致するときだけ TTL を延長 / 削除
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
 def acquire_lock(r, key: str, ttl_sec: int) -> bool:
     return bool(r.set(key, "1", nx=True, ex=ttl_sec))
+
+
+def fence_key(key):
+    """フェンシングトークンのカウンタ（単調増加を保つため TTL は付けない）"""
+    return f"{key}:fence"
+
+
+class LeaseLostError(Exception):
+    """リースの延長に失敗した（他のWorkerがロックを取得している可能性がある）"""
+
+
+class Lease:
+    """取得済みのリース（token はフェンシングトークン）"""
+
+    def __init__(self, r, key, token, ttl_sec, renew_interval):
+        self.r = r
+        self.key = key
+        self.token = token
+        self.value = f"{uuid.uuid4().hex}:{token}"
+        self.ttl_sec = ttl_sec
+        self.renew_interval = renew_interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def renew(self):
+        """TTL を延長（自分のリースでなくなっていれば False）"""
+        if self.lost:
+            return False
+        try:
+            ok = bool(self.r.eval(RENEW_SCRIPT, 1, self.key, self.value, int(self.ttl_sec * 1000)))
+        except Exception as e:
+            # 一時的な接続エラーは次回のハートビートで再試行（TTL 内に回復すればリースは有効）
+            print(f"[LOCK] Renew failed for {self.key}: {e}")
+            return True
+        if not ok:
+            self.lost = True
+            print(f"[LOCK] Lease lost: {self.key} (token={self.token})")
+        return ok
+
+    def check(self):
+        """リースを失っていれば LeaseLostError（DB 書き込みの前に呼ぶ）"""
+        if self.lost:
+            raise LeaseLostError(f"lease lost: {self.key} (token={self.token})")
+
+    def start_heartbeat(self):
+        self._thread = threading.Thread(target=self._heartbeat, name=f"lease-{self.key}", daemon=True)
+        self._thread.start()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.renew_interval):
+            if not self.renew():
+                return
+
+    def release(self):
+        """ハートビートを止め、自分のリースの場合だけ削除"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self.lost:
+            return False
+        try:
+            return bool(self.r.eval(RELEASE_SCRIPT, 1, self.key, self.value))
+        except Exception as e:
+            # 削除できなくても TTL で自然に解放される
+            print(f"[LOCK] Release failed for {self.key}: {e}")
+            return False
+
+
+class LockManager:
+    """
+    リース方式のロック
+
+    Args:
+        r: Redis クライアント
+        ttl_sec: リースの TTL（Worker が落ちた場合はこの時間で解放される）
+        renew_interval: ハートビート間隔（省略時は TTL の 1/3）
+    """
+
+    def __init__(self, r, ttl_sec=DEFAULT_LEASE_TTL_SEC, renew_interval=None):
+        self.r = r
+        self.ttl_sec = ttl_sec
+        self.renew_interval = renew_interval or ttl_sec / 3.0
+
+    def acquire(self, key, heartbeat=True):
+        """
+        リースを取得
+
+        Returns:
+            Lease（他のWorkerが保持中なら None）
+        """
+        token = int(self.r.incr(fence_key(key)))
+        lease = Lease(self.r, key, token, self.ttl_sec, self.renew_interval)
+        if not self.r.set(key, lease.value, nx=True, px=int(self.ttl_sec * 1000)):
+            return None
+        if heartbeat:
+            lease.start_heartbeat()
+        return lease
+
+    @contextmanager
+    def lease(self, key):
+        """
+        with locks.lease("lock:entry:1") as lease:
+            if lease is None: ...  # 他のWorkerが処理中
+        """
+        lease = self.acquire(key)
+        try:
+            yield lease
+        finally:
+            if lease is not None:
+                lease.release()
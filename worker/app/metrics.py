@@ -0,0 +1,277 @@
+"""
+ワーカーのメトリクス
+ジョブ・ステージ単位の処理時間ヒストグラム、処理バイト数・トークン数のカウンタ、
+キューの状態などのゲージを集計し、Prometheus のテキスト形式で公開する
+
+- 記録は bisect + 加算のみ（ロック1回）で、パーセンタイルは公開時に計算する
+- パーセンタイル（p50/p95/p99）は直近 RESERVOIR_SIZE 件の観測値から求める
+- METRICS_PORT を設定すると main.py が /metrics を HTTP で公開する
+"""
+
+import bisect
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 処理時間ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 1024
+
+# 実行中のジョブ種別・ステージ（プロバイダ呼び出しなどの集計に使う）
+current_job = ContextVar("current_job", default=None)
+current_stage = ContextVar("current_stage", default=None)
+
+
+class Histogram:
+    """累積バケット + 直近の観測値（パーセンタイル用）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self, qs=QUANTILES):
+        values = sorted(self.recent)
+        if not values:
+            return {q: 0.0 for q in qs}
+        return {q: values[min(int(q * len(values)), len(values) - 1)] for q in qs}
+
+
+class Registry:
+    """メトリクスの登録・集計（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    def observe(self, name, value, help_text=None, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+                if help_text:
+                    self._help.setdefault(name, help_text)
+            hist.observe(value)
+
+    def inc(self, name, amount=1, help_text=None, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def set_gauge(self, name, value, help_text=None, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def gauge_value(self, name, **labels):
+        with self._lock:
+            return self._gauges.get((name, _label_key(labels)))
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def histogram(self, name, **labels):
+        with self._lock:
+            return self._histograms.get((name, _label_key(labels)))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render(self):
+        """Prometheus テキスト形式で出力"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            snapshot = [(key, hist.buckets, list(hist.counts), hist.sum, hist.count, hist.quantiles())
+                        for key, hist in histograms]
+            help_texts = dict(self._help)
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.extend(_header(name, "counter", help_texts))
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), value in gauges:
+            if name not in seen:
+                seen.add(name)
+                lines.extend(_header(name, "gauge", help_texts))
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), buckets, counts, total, count, _ in snapshot:
+            if name not in seen:
+                seen.add(name)
+                lines.extend(_header(name, "histogram", help_texts))
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for (name, labels), _, _, _, _, quantiles in snapshot:
+            family = f"{name}_quantile"
+            if family not in seen:
+                seen.add(family)
+                lines.append(f"# TYPE {family} gauge")
+            for q, value in quantiles.items():
+                lines.append(f"{family}{_format_labels(labels + (('quantile', str(q)),))} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + body + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _header(name, kind, help_texts):
+    lines = []
+    if name in help_texts:
+        lines.append(f"# HELP {name} {help_texts[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+    return lines
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def stage_timer(stage, job=None, registry=None):
+    """
+    ステージの処理時間を計測（例外時はエラー数も加算）
+
+    Args:
+        stage: ステージ名（download / stt / summary など）
+        job: ジョブ種別（省略時は実行中のジョブ）
+    """
+    registry = registry or REGISTRY
+    job = job or current_job.get()
+    token = current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.inc("worker_stage_errors_total", help_text="Stage failures",
+                     job=job, stage=stage)
+        raise
+    finally:
+        registry.observe("worker_stage_seconds", time.perf_counter() - start,
+                         help_text="Stage latency in seconds", job=job, stage=stage)
+        current_stage.reset(token)
+
+
+@contextmanager
+def job_timer(job, registry=None):
+    """ジョブ全体の処理時間と成否を記録し、実行中のジョブ種別を設定"""
+    registry = registry or REGISTRY
+    token = current_job.set(job)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        registry.observe("worker_job_seconds", time.perf_counter() - start,
+                         help_text="Job latency in seconds", job=job)
+        registry.inc("worker_jobs_total", help_text="Jobs processed", job=job, status=status)
+        current_job.reset(token)
+
+
+def add_bytes(stage, amount, direction="in", registry=None):
+    """処理したバイト数を加算（direction: in = 読み込み / out = 書き出し）"""
+    (registry or REGISTRY).inc("worker_bytes_total", amount, help_text="Bytes processed",
+                               job=current_job.get(), stage=stage, direction=direction)
+
+
+def add_tokens(stage, amount, kind="text", registry=None):
+    """処理したトークン数を加算（kind: text = 分かち書きトークン / prompt / completion など）"""
+    (registry or REGISTRY).inc("worker_tokens_total", amount, help_text="Tokens processed",
+                               job=current_job.get(), stage=stage, kind=kind)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, addr="0.0.0.0", registry=None):
+    """/metrics をバックグラウンドスレッドで公開"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or REGISTRY})
+    server = ThreadingHTTPServer((addr, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    print(f"[METRICS] Serving /metrics on {addr}:{port}")
+    return server
+
+
+def timed_job(job):
+    """job_timer を関数全体に適用するデコレータ"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with job_timer(job):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,203 @@
+"""
+LLM 分析のマイクロバッチ
+短いエントリを複数まとめて1回のチャットリクエストで分析し、結果をエントリごとに振り分ける
+
+- システムプロンプト（タスクの説明と出力形式）はバッチで1回だけ送る
+- 応答は {"results": [{"id": ..., "emotion": ..., "keywords": ...}]} の JSON
+- 形式が不正なタスク・応答に含まれないエントリは結果に含めない（呼び出し元が analyze_one で個別呼び出しにフォールバック）
+- タグは app.tagger.extract_tags（ローカル処理）で抽出するため LLM には送らない
+- まとめる単位は1ジョブの中だけ（ワーカーはジョブを1件ずつ処理するので、ジョブをまたいで待っても相乗りは起きない）
+  PROCESS_ENTRY は1エントリの感情・キーワードを1リクエストに、バックフィルはバッチ内の複数エントリを1リクエストにまとめる
+- build_batch_api_requests / parse_batch_api_output: 急がないバックフィル用の OpenAI Batch API 入出力（JSONL）
+"""
+
+import json
+
+from app.config import get_openai_model
+from app.metrics import REGISTRY
+
+BATCH_TASKS = ("emotion", "keywords")
+
+# タスク名 -> 出力形式の説明（システムプロンプトに入れる）
+TASK_SCHEMAS = {
+    "emotion": '"emotion": {"primary_emotion": string, "emotions": {感情名: 0..1}, '
+               '"valence": -1..1, "arousal": 0..1, "dominance": 0..1}',
+    "keywords": '"keywords": {"keywords": [string], "topics": [string]}',
+}
+
+DEFAULT_MAX_BATCH = 8
+# 1リクエストに入れる本文の合計文字数の上限（長いエントリは単独で送る）
+DEFAULT_MAX_CHARS = 6000
+
+
+def build_batch_messages(items, tasks=BATCH_TASKS):
+    """
+    バッチ分析のチャットメッセージを作成
+
+    Args:
+        items: [(id, text)] のリスト（id は文字列化して応答との突き合わせに使う）
+        tasks: 実行するタスク（BATCH_TASKS の部分集合）
+    """
+    fields = ",\n".join(f"  {TASK_SCHEMAS[t]}" for t in tasks)
+    system = (
+        "あなたは日記の分析アシスタントです。複数の日記エントリを個別に分析してください。\n"
+        "エントリ同士の内容を混ぜないこと。次の形式の JSON だけを返してください。\n"
+        '{"results": [{\n  "id": 入力の id,\n' + fields + "\n}]}"
+    )
+    user = json.dumps(
+        {"entries": [{"id": str(item_id), "text": text} for item_id, text in items]},
+        ensure_ascii=False,
+    )
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def _valid(task, value):
+    if task == "emotion":
+        return (
+            isinstance(value, dict)
+            and isinstance(value.get("primary_emotion"), str)
+            and isinstance(value.get("emotions"), dict)
+            and all(isinstance(value.get(k), (int, float)) for k in ("valence", "arousal", "dominance"))
+        )
+    if task == "keywords":
+        return (
+            isinstance(value, dict)
+            and isinstance(value.get("keywords"), list)
+            and isinstance(value.get("topics"), list)
+        )
+    return False
+
+
+def parse_batch_response(content, ids, tasks=BATCH_TASKS):
+    """
+    バッチ応答をエントリごとに振り分ける
+
+    Returns:
+        id -> {タスク名: 結果}（ids に含まれない id・形式が不正なタスクは除外）
+    """
+    if not content:
+        return {}
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    results = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(results, list):
+        return {}
+
+    by_key = {str(item_id): item_id for item_id in ids}
+    outputs = {}
+    for result in results:
+        if not isinstance(result, dict) or str(result.get("id")) not in by_key:
+            continue
+        analysis = {t: result[t] for t in tasks if _valid(t, result.get(t))}
+        if analysis:
+            outputs[by_key[str(result["id"])]] = analysis
+    return outputs
+
+
+def analyze_batch(items, tasks=BATCH_TASKS, model=None, complete=None):
+    """
+    エントリのバッチを1回のリクエストで分析
+
+    Args:
+        items: [(id, text)] のリスト
+        complete: チャット呼び出し（省略時は providers_openai.chat_completion）
+
+    Returns:
+        id -> {タスク名: 結果}
+    """
+    if not items:
+        return {}
+    if complete is None:
+        from app.providers_openai import chat_completion as complete
+
+    content = complete(
+        build_batch_messages(items, tasks),
+        model=model or get_openai_model(),
+        temperature=0.2,
+        response_format={"type": "json_object"},
+    )
+    outputs = parse_batch_response(content, [item_id for item_id, _ in items], tasks)
+    REGISTRY.observe("worker_llm_batch_size", len(items), help_text="Entries per batched LLM request")
+    REGISTRY.inc("worker_llm_batch_misses_total", len(items) - len(outputs),
+                 help_text="Entries missing from batched LLM responses")
+    return outputs
+
+
+def analyze_one(text, task, model=None, complete=None):
+    """
+    1件のエントリを1タスクだけ分析（バッチと同じプロンプト・出力形式、応答が不正なら None）
+
+    マイクロバッチ無効時やバッチ応答に含まれなかったエントリの個別呼び出しに使う
+    """
+    return analyze_batch([(0, text)], (task,), model, complete).get(0, {}).get(task)
+
+
+def chunk_items(items, max_batch=DEFAULT_MAX_BATCH, max_chars=DEFAULT_MAX_CHARS):
+    """件数・文字数の上限でバッチに分割"""
+    chunk, chars = [], 0
+    for item in items:
+        size = len(item[1] or "")
+        if chunk and (len(chunk) >= max_batch or chars + size > max_chars):
+            yield chunk
+            chunk, chars = [], 0
+        chunk.append(item)
+        chars += size
+    if chunk:
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# OpenAI Batch API（急がないバックフィル用）
+# ---------------------------------------------------------------------------
+
+BATCH_API_CUSTOM_ID_PREFIX = "entries:"
+
+
+def build_batch_api_requests(items, tasks=BATCH_TASKS, model=None,
+                             max_batch=DEFAULT_MAX_BATCH, max_chars=DEFAULT_MAX_CHARS):
+    """
+    Batch API の入力ファイル（JSONL）の行を作成
+    1行 = 複数エントリをまとめたチャットリクエスト、custom_id にエントリIDを入れる
+    """
+    lines = []
+    for chunk in chunk_items(items, max_batch, max_chars):
+        custom_id = BATCH_API_CUSTOM_ID_PREFIX + ",".join(str(item_id) for item_id, _ in chunk)
+        lines.append(json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model or get_openai_model(),
+                "messages": build_batch_messages(chunk, tasks),
+                "temperature": 0.2,
+                "response_format": {"type": "json_object"},
+            },
+        }, ensure_ascii=False))
+    return lines
+
+
+def parse_batch_api_output(lines, tasks=BATCH_TASKS):
+    """
+    Batch API の出力ファイル（JSONL）を振り分ける
+
+    Returns:
+        エントリID（文字列）-> {タスク名: 結果}
+    """
+    outputs = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id", "")
+        if not custom_id.startswith(BATCH_API_CUSTOM_ID_PREFIX):
+            continue
+        ids = custom_id[len(BATCH_API_CUSTOM_ID_PREFIX):].split(",")
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        choices = (response.get("body") or {}).get("choices") or []
+        if choices:
+            outputs.update(parse_batch_response(choices[0]["message"]["content"], ids, tasks))
+    return outputs
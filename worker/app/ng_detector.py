@@ -125,6 +125,70 @@ def detect_ng(text):
     return detector.detect(text)
 
 
+def detect_pattern_flags(text, ng_patterns, nonsave_patterns):
+    """
+    追加の正規表現パターン（リソースの ng_topic_patterns / non_save_patterns）でフラグを判定
+    
+    パターンは文字列でもコンパイル済みでもよい（どちらも大文字小文字を区別しない）
+    
+    Returns:
+        (flagged, flag_list)  flag_list は 'ng_pattern' / 'non_save'
+    """
+    flagged = 0
+    flag_list = []
+    if not text:
+        return (flagged, flag_list)
+    
+    for pat in ng_patterns:
+        if re.search(getattr(pat, 'pattern', pat), text, re.IGNORECASE):
+            flagged = 1
+            flag_list.append("ng_pattern")
+            break
+    
+    for pat in nonsave_patterns:
+        if re.search(getattr(pat, 'pattern', pat), text, re.IGNORECASE):
+            flagged = 1
+            flag_list.append("non_save")
+            break
+    
+    return (flagged, flag_list)
+
+
+def content_flags(text, pii_detected):
+    """
+    ng ステージの結果（パイプラインの NgStep とバックフィルで同じ判定・同じ形で保存する）
+    
+    Args:
+        text: マスク済みのテキスト（entries.transcript_text）
+        pii_detected: PII を検出したか
+    
+    Returns:
+        list: フラグ（'pii' → detect_ng の ng_types の順、重複なし）
+    """
+    flag_types = ['pii'] if pii_detected else []
+    for ng_type in detect_ng(text)['ng_types']:
+        if ng_type not in flag_types:
+            flag_types.append(ng_type)
+    return flag_types
+
+
+def entry_flags(text, pii_detected, ng_patterns, nonsave_patterns):
+    """
+    エントリのフラグ（NgStep とバックフィルの ng ステージで共通）
+    
+    Args:
+        ng_patterns, nonsave_patterns: リソースの正規表現（TextResources の ng_topic_patterns / non_save_patterns）
+    
+    Returns:
+        (ng_flags, flag_types)  ng_flags は ng ステージの結果として保存する content_flags の値、
+        flag_types はそれに追加パターンのフラグを加えた entries.flag_types の値
+    """
+    ng_flags = content_flags(text, pii_detected)
+    _, pattern_flags = detect_pattern_flags(text, ng_patterns, nonsave_patterns)
+    flag_types = ng_flags + [flag for flag in pattern_flags if flag not in ng_flags]
+    return ng_flags, flag_types
+
+
 if __name__ == '__main__':
     # テスト
     test_texts = [
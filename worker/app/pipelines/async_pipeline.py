@@ -0,0 +1,230 @@
+"""
+非同期パイプライン（依存グラフ + 並列度制限）
+
+ステップが宣言する inputs / outputs から依存グラフを作り、
+依存が満たされたステップから順に並行実行する。
+
+- 同時に実行するステップ数はセマフォで制限する（複数パイプラインで共有可能）
+- 同期ステップ（execute）は asyncio.to_thread、非同期ステップ（execute_async）はそのまま await
+- locks を宣言したステップ（例: "db"）は同じ資源を使う他のステップと同時に実行しない
+- エラー時は on_error の結果を context['error'] に入れ、未実行のステップは実行しない
+  （ステップ開始前のキャンセル確認による JobCancelled も同様）
+- context['halt'] が立った場合も以降のステップは実行しない
+- 実行トレース（開始・終了時刻、状態）を context['trace'] に残す
+"""
+
+import asyncio
+import time
+from abc import abstractmethod
+from typing import Any, Dict, Optional
+
+from app.cancellation import check_cancelled
+from app.events import stage_events
+from app.metrics import stage_timer
+from app.pipelines.base import ParallelSteps, PipelineStep, StepCache
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class AsyncPipelineStep(PipelineStep):
+    """非同期ステップ（execute_async を実装する）"""
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        return asyncio.run(self.execute_async(context))
+
+    @abstractmethod
+    async def execute_async(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        pass
+
+
+def build_graph(steps, initial_keys):
+    """
+    ステップ間の依存を求める
+
+    Returns:
+        ステップの添字 -> 依存するステップの添字の集合
+
+    Raises:
+        ValueError: 出力キーの重複、どこからも供給されない入力、循環依存
+    """
+    producers = {}
+    for i, step in enumerate(steps):
+        for key in step.outputs:
+            if key in producers:
+                raise ValueError(f"output '{key}' is produced by both "
+                                 f"{steps[producers[key]].step_name} and {step.step_name}")
+            producers[key] = i
+
+    deps = {}
+    for i, step in enumerate(steps):
+        deps[i] = set()
+        for key in step.inputs:
+            if key in producers:
+                if producers[key] != i:
+                    deps[i].add(producers[key])
+            elif key not in initial_keys:
+                raise ValueError(f"input '{key}' of {step.step_name} is not produced by any step")
+
+    # 循環依存の検出（Kahn 法）
+    remaining = {i: set(d) for i, d in deps.items()}
+    ready = [i for i, d in remaining.items() if not d]
+    visited = 0
+    while ready:
+        done = ready.pop()
+        visited += 1
+        for i, d in remaining.items():
+            if done in d:
+                d.discard(done)
+                if not d:
+                    ready.append(i)
+    if visited != len(steps):
+        raise ValueError("pipeline has a dependency cycle")
+    return deps
+
+
+class AsyncPipeline:
+    """
+    依存グラフに従ってステップを並行実行するパイプライン
+
+    Args:
+        steps: ステップのリスト（順序は問わない）
+        cache: キャッシュフック（Pipeline と同じ StepCache）
+        max_concurrency: 同時実行ステップ数（semaphore 指定時は無視）
+        semaphore: 複数パイプラインで共有するセマフォ
+    """
+
+    def __init__(self, steps: list, cache: Optional[StepCache] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 semaphore: Optional[asyncio.Semaphore] = None):
+        self.steps = steps
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.semaphore = semaphore
+
+    @classmethod
+    def from_pipeline(cls, pipeline, **kwargs):
+        """Pipeline のステップ（ParallelSteps は展開）から作成"""
+        steps = []
+        for step in pipeline.steps:
+            steps.extend(step.steps if isinstance(step, ParallelSteps) else [step])
+        kwargs.setdefault("cache", pipeline.cache)
+        return cls(steps, **kwargs)
+
+    def run(self, initial_context: Dict[str, Any]) -> Dict[str, Any]:
+        """同期コードから実行"""
+        return asyncio.run(self.run_async(initial_context))
+
+    async def run_async(self, initial_context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        パイプラインを実行
+
+        Returns:
+            最終コンテキスト
+            step_timings: ステップ名 -> 秒（スキップは None）
+            trace: [{step, status, start, end}]（start / end は実行開始からの秒）
+        """
+        context = dict(initial_context)
+        deps = build_graph(self.steps, set(context))
+        semaphore = self.semaphore or asyncio.Semaphore(self.max_concurrency)
+        resource_locks = {}
+        origin = time.perf_counter()
+        context["step_timings"] = {}
+        context["trace"] = []
+
+        pending = set(range(len(self.steps)))
+        finished = set()
+        running = {}
+        stop = False
+
+        while pending or running:
+            if not stop:
+                for i in sorted(pending):
+                    if deps[i] <= finished:
+                        pending.discard(i)
+                        running[asyncio.create_task(
+                            self._run_step(self.steps[i], dict(context), semaphore, resource_locks, origin)
+                        )] = i
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = running.pop(task)
+                step = self.steps[i]
+                result, trace = task.result()
+                context["trace"].append(trace)
+                context["step_timings"][step.step_name] = (
+                    None if trace["status"] == "skipped" else trace["end"] - trace["start"]
+                )
+                finished.add(i)
+                if "error" in result:
+                    context["error"] = result["error"]
+                    stop = True
+                    continue
+                context.update({k: result[k] for k in step.outputs if k in result})
+                if result.get("halt"):
+                    context["halt"] = result["halt"]
+                    stop = True
+
+            if stop and running:
+                # 実行中のステップは完了を待たずに打ち切る（スレッド内の処理は結果を破棄）
+                for task, i in running.items():
+                    task.cancel()
+                    context["trace"].append({"step": self.steps[i].step_name, "status": "cancelled",
+                                             "start": None, "end": time.perf_counter() - origin})
+                await asyncio.gather(*running, return_exceptions=True)
+                running.clear()
+
+        for i in sorted(pending):
+            context["trace"].append({"step": self.steps[i].step_name, "status": "not_run",
+                                     "start": None, "end": None})
+        return context
+
+    async def _run_step(self, step, context, semaphore, resource_locks, origin):
+        name = step.step_name
+        trace = {"step": name, "status": "ok", "start": time.perf_counter() - origin, "end": None}
+        try:
+            check_cancelled()
+            if not step.should_run(context):
+                trace["status"] = "skipped"
+                return context, trace
+
+            key = step.cache_key(context) if self.cache is not None else None
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    context.update(cached)
+                    trace["status"] = "cached"
+                    return context, trace
+
+            locks = [resource_locks.setdefault(r, asyncio.Lock()) for r in sorted(step.locks)]
+            async with semaphore:
+                for lock in locks:
+                    await lock.acquire()
+                try:
+                    trace["start"] = time.perf_counter() - origin
+                    if isinstance(step, AsyncPipelineStep):
+                        with stage_timer(name), stage_events(name):
+                            context = await step.execute_async(context)
+                    else:
+                        context = await asyncio.to_thread(_execute_timed, step, context)
+                finally:
+                    for lock in reversed(locks):
+                        lock.release()
+
+            if key is not None and "error" not in context and \
+                    all(context.get(k) is not None for k in step.outputs):
+                self.cache.set(key, {k: context[k] for k in step.outputs})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            context = step.on_error(context, e)
+            trace["status"] = "error"
+        finally:
+            trace["end"] = time.perf_counter() - origin
+        return context, trace
+
+
+def _execute_timed(step, context):
+    with stage_timer(step.step_name), stage_events(step.step_name):
+        return step.execute(context)
@@ -1,74 +1,227 @@
 """
 Pipeline基底クラス
 各処理ステップを連鎖させるパターン
+
+- ステップごとの処理時間を計測（app.metrics の stage_timer + context['step_timings']）
+- should_run でステップを条件付きでスキップ（例: content_flagged のエントリは分析しない）
+- cache_key を返すステップは出力（outputs のキー）をキャッシュから復元できる
+- ParallelSteps で互いに依存しないステップをスレッドで並行実行
+- context['halt'] が立つとエラーなしで以降のステップを打ち切る
+- 各ステップの実行前にジョブのキャンセル・期限を確認する（app.cancellation、JobCancelled はエラーとして扱う）
+- 依存グラフに従って並行実行する版は app.pipelines.async_pipeline.AsyncPipeline
 """
+import contextvars
+import json
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.cancellation import check_cancelled
+from app.events import stage_events
+from app.metrics import stage_timer
 
 
 class PipelineStep(ABC):
     """Pipeline内の1ステップを表す抽象クラス"""
-    
+
+    # ステップ名（メトリクスのステージ名にも使う、省略時はクラス名）
+    name: Optional[str] = None
+    # 読み取るコンテキストのキー / 書き込むコンテキストのキー
+    inputs: tuple = ()
+    outputs: tuple = ()
+    # 同時に使えない共有資源（例: "db"）。AsyncPipeline は同じ資源のステップを並行実行しない
+    locks: tuple = ()
+
+    @property
+    def step_name(self) -> str:
+        return self.name or self.__class__.__name__
+
     @abstractmethod
     def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         ステップを実行
-        
+
         Args:
             context: パイプライン共有コンテキスト
-        
+
         Returns:
             更新されたコンテキスト
         """
         pass
-    
+
+    def should_run(self, context: Dict[str, Any]) -> bool:
+        """False を返すとステップをスキップする"""
+        return True
+
+    def cache_key(self, context: Dict[str, Any]) -> Optional[str]:
+        """
+        キャッシュキー（None ならキャッシュしない）
+        キャッシュには outputs のキーの値が保存される
+        """
+        return None
+
     def on_error(self, context: Dict[str, Any], error: Exception) -> Dict[str, Any]:
         """
         エラーハンドリング（オプション）
-        
+
         Args:
             context: パイプライン共有コンテキスト
             error: 発生したエラー
-        
+
         Returns:
             エラー情報を含むコンテキスト
         """
         context['error'] = {
             'step': self.__class__.__name__,
             'message': str(error),
-            'type': type(error).__name__
+            'type': type(error).__name__,
+            'exception': error,
         }
         return context
 
 
+class StepCache:
+    """キャッシュフックのインターフェース（get は未登録なら None）"""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        pass
+
+
+class RedisStepCache(StepCache):
+    """Redis に JSON で保存するキャッシュ（リトライ時に LLM 呼び出しをやり直さない）"""
+
+    def __init__(self, r, ttl_sec: int = 86400, prefix: str = 'pipeline:cache:'):
+        self.r = r
+        self.ttl_sec = ttl_sec
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.r.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value):
+        self.r.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=self.ttl_sec)
+
+
+class DictStepCache(StepCache):
+    """プロセス内のキャッシュ（テスト・単発実行用）"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+def run_step(step: PipelineStep, context: Dict[str, Any], cache: Optional[StepCache] = None) -> Dict[str, Any]:
+    """
+    1ステップを実行（スキップ判定・キャッシュ・計測を含む）
+    例外はそのまま送出する
+    """
+    check_cancelled()
+    timings = context.setdefault('step_timings', {})
+    if not step.should_run(context):
+        timings[step.step_name] = None
+        return context
+
+    key = step.cache_key(context) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            context.update(cached)
+            timings[step.step_name] = 0.0
+            return context
+
+    start = time.perf_counter()
+    with stage_timer(step.step_name), stage_events(step.step_name):
+        context = step.execute(context)
+    timings[step.step_name] = time.perf_counter() - start
+
+    # 結果が得られなかった（None の）出力はキャッシュしない
+    if key is not None and 'error' not in context and all(context.get(k) is not None for k in step.outputs):
+        cache.set(key, {k: context[k] for k in step.outputs})
+    return context
+
+
+class ParallelSteps(PipelineStep):
+    """
+    互いに依存しないステップをスレッドで並行実行
+
+    各ステップはコンテキストの浅いコピーを受け取り、outputs のキーだけが統合される。
+    DB接続などスレッド間で共有できない資源に触れるステップは入れないこと。
+    """
+
+    def __init__(self, steps: list, max_workers: Optional[int] = None, name: str = 'parallel'):
+        self.steps = steps
+        self.max_workers = max_workers or len(steps)
+        self.name = name
+        self.outputs = tuple(k for step in steps for k in step.outputs)
+        self.cache = None
+
+    def _run_isolated(self, step, context):
+        try:
+            return run_step(step, context, self.cache)
+        except Exception as e:
+            return step.on_error(context, e)
+
+    def execute(self, context):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [
+                (step, pool.submit(contextvars.copy_context().run, self._run_isolated, step, dict(context, step_timings={})))
+                for step in self.steps
+            ]
+            results = [(step, future.result()) for step, future in futures]
+
+        timings = context.setdefault('step_timings', {})
+        for step, result in results:
+            timings.update(result.get('step_timings', {}))
+            if 'error' in result:
+                context['error'] = result['error']
+                return context
+            context.update({k: result[k] for k in step.outputs if k in result})
+        return context
+
+
 class Pipeline:
     """複数のステップを順次実行するパイプライン"""
-    
-    def __init__(self, steps: list[PipelineStep]):
+
+    def __init__(self, steps: list[PipelineStep], cache: Optional[StepCache] = None):
         self.steps = steps
-    
+        self.cache = cache
+        for step in steps:
+            if isinstance(step, ParallelSteps):
+                step.cache = cache
+
     def run(self, initial_context: Dict[str, Any]) -> Dict[str, Any]:
         """
         パイプラインを実行
-        
+
         Args:
             initial_context: 初期コンテキスト
-        
+
         Returns:
-            最終コンテキスト
+            最終コンテキスト（step_timings: ステップ名 -> 秒、スキップは None）
         """
         context = initial_context.copy()
-        
+        context['step_timings'] = {}
+
         for step in self.steps:
             try:
-                context = step.execute(context)
-                
+                context = run_step(step, context, self.cache)
+
                 # エラーが既に設定されている場合は中断
-                if 'error' in context:
+                if 'error' in context or context.get('halt'):
                     break
-                    
+
             except Exception as e:
                 context = step.on_error(context, e)
                 break
-        
+
         return context
@@ -0,0 +1,460 @@
+"""
+エントリ処理パイプライン（PROCESS_ENTRY）
+process_entry の各段階を PipelineStep として実装する
+
+  読み込み → ダウンロード → STT前処理 → STT → クリーニング → PII → NG判定 → 要約 → DB更新
+  → [タグ / 感情 / キーワード / 話し方 / アクション]（並行、LLM呼び出しのみ）
+  → 分析結果の保存 → ステージ結果の保存
+
+- 分析ステップは DB に触れず結果をコンテキストに置くだけにし、保存は後段でまとめて行う
+  （MySQL 接続はスレッド間で共有できないため）
+- DB に触れるステップは locks = ("db",) を宣言し、AsyncPipeline でも同時に実行しない
+- context['lease'] があれば書き込み前にリースを確認し、エントリ更新はフェンシングトークン付きで行う
+- content_flagged のエントリは要約・分析ステップをスキップする
+- LLM ステップは入力フィンガープリントをキャッシュキーにし、リトライ時に再呼び出ししない
+- LLM_MICROBATCH=1 なら感情・キーワードを1ステップ・1リクエストにまとめて分析する（タグは常にローカルで抽出）
+- 感情・キーワードはマイクロバッチと同じプロンプト（app.microbatch.analyze_one）で分析する
+- アクションアイテムは抽出してステージ結果に残すだけで、action_items テーブルには書き込まない
+  （009 の action_items は public_id 必須で、ワーカー側に書き込み処理がないため）
+"""
+
+import json
+import tempfile
+import time
+
+from app.providers_openai import chat_completion, stt_openai
+from app.action_extractor import ActionExtractor
+from app.cleaners import clean_transcript
+from app.config import get_microbatch_settings, get_openai_model
+from app.pii import detect_and_mask
+from app.ng_detector import entry_flags
+from app.tagger import extract_tags
+from app.speech_analyzer import analyze_speech
+from app.events import bind_event_user
+from app.jobs import is_bullet_format_ok, parse_audio_key, preprocess_for_stt
+from app.locks import LeaseLostError
+from app.metrics import add_bytes, add_tokens
+from app.microbatch import BATCH_TASKS, analyze_batch, analyze_one
+from app.stage_versions import stage_fingerprint, stage_result_row
+from app.storage import fetch_object
+from app.tokenizer import tokenize
+from app.usage import bind_user
+from app.pipelines.base import Pipeline, PipelineStep, ParallelSteps
+
+
+def _analyzable(context):
+    return bool(context.get("masked")) and context.get("content_flagged") == 0
+
+
+def _check_lease(context):
+    lease = context.get("lease")
+    if lease is not None:
+        lease.check()
+
+
+class LoadEntryStep(PipelineStep):
+    name = "db_read"
+    locks = ("db",)
+    inputs = ("entry_id",)
+    outputs = ("entry", "user_id", "audio_key")
+
+    def __init__(self, db, bucket):
+        self.db = db
+        self.bucket = bucket
+
+    def execute(self, context):
+        from app.db import get_entry
+
+        entry_id = context["entry_id"]
+        entry = get_entry(self.db, entry_id)
+        if not entry:
+            print(f"[PROCESS_ENTRY] Entry {entry_id} not found")
+            context["halt"] = "not_found"
+            return context
+        if entry.get("transcript_text"):
+            print(f"[PROCESS_ENTRY] Entry {entry_id} already processed")
+            context["halt"] = "already_processed"
+            return context
+
+        bind_user(entry["user_id"])
+        bind_event_user(entry["user_id"])
+        context["entry"] = entry
+        context["user_id"] = entry["user_id"]
+        context["audio_key"] = parse_audio_key(entry["audio_url"], self.bucket)
+        return context
+
+
+class DownloadAudioStep(PipelineStep):
+    name = "download"
+    inputs = ("audio_key",)
+    outputs = ("audio_data",)
+
+    def __init__(self, minio, bucket):
+        self.minio = minio
+        self.bucket = bucket
+
+    def execute(self, context):
+        print(f"[PROCESS_ENTRY] Downloading {context['audio_key']}")
+        context["audio_data"] = fetch_object(self.minio, self.bucket, context["audio_key"])
+        add_bytes("download", len(context["audio_data"]))
+        return context
+
+
+class SttPreprocessStep(PipelineStep):
+    name = "stt_preprocess"
+    inputs = ("entry_id", "audio_data", "audio_key")
+    outputs = ("stt_audio", "stt_format", "stt_stats")
+
+    def execute(self, context):
+        context["stt_audio"], context["stt_format"], context["stt_stats"] = preprocess_for_stt(
+            context["entry_id"], context["audio_data"], context["audio_key"]
+        )
+        return context
+
+
+class TranscribeStep(PipelineStep):
+    name = "stt"
+    locks = ("db",)
+    inputs = ("entry_id", "stt_audio", "stt_format", "stt_stats")
+    outputs = ("raw",)
+
+    def __init__(self, db, openai_client):
+        self.db = db
+        self.openai_client = openai_client
+
+    def execute(self, context):
+        from app.db import update_entry_stt_stats
+
+        entry_id = context["entry_id"]
+        stt_audio = context["stt_audio"]
+        stt_stats = context["stt_stats"]
+        print(f"[PROCESS_ENTRY] Transcribing {entry_id}")
+        stt_start = time.monotonic()
+        # Whisper はファイル名の拡張子で形式を判定する（前処理で再エンコードした場合はその形式）
+        suffix = f".{context['stt_format']}" if context.get("stt_format") else ""
+        with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+            f.write(stt_audio)
+            f.flush()
+            # STT の課金は音声の長さ（前処理済みなら短縮後の長さ）
+            audio_seconds = stt_stats["prepared_ms"] / 1000.0 if stt_stats.get("prepared_ms") else None
+            context["raw"] = stt_openai(f.name, audio_seconds)
+        add_bytes("stt", len(stt_audio), "out")
+        update_entry_stt_stats(
+            self.db, entry_id, len(stt_audio),
+            stt_stats.get("bytes_saved"), stt_stats.get("trimmed_ms"),
+            int((time.monotonic() - stt_start) * 1000)
+        )
+        return context
+
+
+class CleanStep(PipelineStep):
+    name = "clean"
+    inputs = ("raw",)
+    outputs = ("cleaned",)
+
+    def __init__(self, resources):
+        self.resources = resources
+
+    def execute(self, context):
+        context["cleaned"] = clean_transcript(context["raw"], self.resources.filler_patterns)
+        return context
+
+
+class PiiStep(PipelineStep):
+    name = "pii"
+    inputs = ("cleaned",)
+    outputs = ("pii_detected", "pii_json", "masked")
+
+    def __init__(self, resources):
+        self.resources = resources
+
+    def execute(self, context):
+        pii = detect_and_mask(
+            context["cleaned"], self.resources.pii_email_patterns, self.resources.pii_phone_patterns
+        )
+        masked = pii.masked_text
+        context["pii_detected"] = bool(pii.types)
+        context["pii_json"] = json.dumps(pii.types, ensure_ascii=False) if pii.types else None
+        context["masked"] = masked
+        add_tokens("transcript", len(tokenize(masked)))
+        return context
+
+
+class NgStep(PipelineStep):
+    name = "ng"
+    inputs = ("masked", "pii_detected")
+    outputs = ("ng_flags", "content_flagged", "flag_types", "flag_json")
+
+    def __init__(self, ng_patterns, nonsave_patterns):
+        self.ng_patterns = ng_patterns
+        self.nonsave_patterns = nonsave_patterns
+
+    def execute(self, context):
+        # バックフィルの ng ステージと同じ判定（entry_flags）
+        ng_flags, flag_types = entry_flags(
+            context["masked"], context["pii_detected"], self.ng_patterns, self.nonsave_patterns
+        )
+        context["ng_flags"] = ng_flags
+        context["content_flagged"] = 1 if flag_types else 0
+        context["flag_types"] = flag_types
+        context["flag_json"] = json.dumps(flag_types, ensure_ascii=False) if flag_types else None
+        return context
+
+
+class _LlmStep(PipelineStep):
+    """入力フィンガープリントをキャッシュキーにする LLM ステップ"""
+
+    def __init__(self, openai_client):
+        self.openai_client = openai_client
+
+    def should_run(self, context):
+        return _analyzable(context)
+
+    def cache_key(self, context):
+        return f"{self.name}:{stage_fingerprint(self.name, context['masked'])}"
+
+
+class SummaryStep(_LlmStep):
+    name = "summary"
+    inputs = ("masked", "content_flagged")
+    outputs = ("summary",)
+
+    def __init__(self, openai_client, resources):
+        super().__init__(openai_client)
+        self.resources = resources
+
+    def _summarize(self, text):
+        return chat_completion([
+            {"role": "system", "content": self.resources.entry_summary_system},
+            {"role": "user", "content": self.resources.entry_summary_user_tpl.replace("{TEXT}", text)},
+        ], model=get_openai_model())
+
+    def execute(self, context):
+        masked = context["masked"]
+        print(f"[PROCESS_ENTRY] Summarizing {context['entry_id']}")
+        summ = self._summarize(masked)
+        if summ and not is_bullet_format_ok(summ):
+            print(f"[PROCESS_ENTRY] Summary format invalid, retrying")
+            summ = self._summarize(masked)
+        context["summary"] = summ
+        return context
+
+
+class UpdateEntryStep(PipelineStep):
+    name = "db_update"
+    locks = ("db",)
+    inputs = ("masked", "summary", "pii_detected", "pii_json", "content_flagged", "flag_json")
+    # 分析結果・ステージ結果の保存はエントリ更新の後（AsyncPipeline の依存グラフでも順序を保つ）
+    outputs = ("entry_updated",)
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, context):
+        from app.db import update_entry
+
+        _check_lease(context)
+        lease = context.get("lease")
+        fence_token = lease.token if lease is not None else None
+        updated = update_entry(
+            self.db, context["entry_id"], context["masked"], context.get("summary"),
+            context["pii_detected"], context["pii_json"], context["content_flagged"], context["flag_json"],
+            fence_token=fence_token
+        )
+        if not updated:
+            raise LeaseLostError(f"entry {context['entry_id']} was written with a newer token than {fence_token}")
+        context["entry_updated"] = True
+        return context
+
+
+class TagsStep(_LlmStep):
+    name = "tags"
+    inputs = ("masked", "content_flagged")
+    outputs = ("tags",)
+
+    def execute(self, context):
+        context["tags"] = extract_tags(context["masked"]) or []
+        return context
+
+
+class EmotionStep(_LlmStep):
+    name = "emotion"
+    inputs = ("masked", "content_flagged")
+    outputs = ("emotion",)
+
+    def execute(self, context):
+        context["emotion"] = analyze_one(context["masked"], "emotion")
+        return context
+
+
+class KeywordsStep(_LlmStep):
+    name = "keywords"
+    inputs = ("masked", "content_flagged")
+    outputs = ("keywords",)
+
+    def execute(self, context):
+        context["keywords"] = analyze_one(context["masked"], "keywords")
+        return context
+
+
+class ActionsStep(_LlmStep):
+    name = "actions"
+    inputs = ("masked", "content_flagged")
+    outputs = ("action_items",)
+
+    def execute(self, context):
+        context["action_items"] = ActionExtractor().extract_actions(context["masked"]) or []
+        return context
+
+
+class BatchedAnalysisStep(_LlmStep):
+    """感情・キーワードを1リクエストで分析し（応答に無いものは個別に呼び出す）、タグはローカルで抽出"""
+
+    name = "analysis_batch"
+    inputs = ("masked", "content_flagged")
+    outputs = ("tags", "emotion", "keywords")
+
+    def cache_key(self, context):
+        return f"{self.name}:" + ":".join(stage_fingerprint(stage, context["masked"])
+                                          for stage in ("tags",) + BATCH_TASKS)
+
+    def execute(self, context):
+        masked = context["masked"]
+        entry_id = context["entry_id"]
+        result = analyze_batch([(entry_id, masked)]).get(entry_id) or {}
+
+        context["tags"] = extract_tags(masked) or []
+        context["emotion"] = result.get("emotion") or analyze_one(masked, "emotion")
+        context["keywords"] = result.get("keywords") or analyze_one(masked, "keywords")
+        return context
+
+
+class SpeechStep(PipelineStep):
+    name = "speech"
+    inputs = ("masked", "content_flagged")
+    outputs = ("speech",)
+
+    def should_run(self, context):
+        return _analyzable(context)
+
+    def execute(self, context):
+        context["speech"] = analyze_speech(context["masked"])
+        return context
+
+
+class PersistAnalysisStep(PipelineStep):
+    """並行ステップの分析結果を呼び出し元スレッドで保存"""
+
+    name = "db_analysis"
+    locks = ("db",)
+    inputs = ("entry_updated", "tags", "emotion", "keywords", "speech")
+
+    def __init__(self, db):
+        self.db = db
+
+    def should_run(self, context):
+        return _analyzable(context)
+
+    def execute(self, context):
+        from app.db import save_entry_tags, save_emotion_analysis, save_keywords, save_speech_analysis_bulk
+
+        _check_lease(context)
+        entry_id = context["entry_id"]
+        if context.get("tags"):
+            save_entry_tags(self.db, entry_id, context["tags"])
+
+        emotion_result = context.get("emotion")
+        if emotion_result:
+            save_emotion_analysis(
+                self.db, entry_id,
+                emotion_result["primary_emotion"],
+                emotion_result["emotions"],
+                emotion_result["valence"],
+                emotion_result["arousal"],
+                emotion_result["dominance"]
+            )
+
+        keyword_result = context.get("keywords")
+        if keyword_result:
+            save_keywords(self.db, entry_id, keyword_result["keywords"], keyword_result["topics"])
+
+        speech_result = context.get("speech")
+        if speech_result:
+            save_speech_analysis_bulk(self.db, [(
+                entry_id,
+                speech_result["speech_rate"],
+                speech_result["filler_word_rate"],
+                speech_result["avg_sentence_length"],
+                speech_result["vocabulary_diversity"]
+            )])
+        return context
+
+
+class SaveStageResultsStep(PipelineStep):
+    """ステージ結果（入力フィンガープリント付き、再処理時のスキップ判定用）をまとめて保存"""
+
+    name = "stage_results"
+    locks = ("db",)
+    inputs = ("entry_updated", "masked", "ng_flags", "summary", "tags", "emotion", "keywords", "action_items")
+
+    # ステージ名 -> (コンテキストのキー, 結果が空でも保存するか)
+    STAGES = (
+        ("ng", "ng_flags", True),
+        ("summary", "summary", False),
+        ("tags", "tags", True),
+        ("emotion", "emotion", False),
+        ("keywords", "keywords", False),
+        ("actions", "action_items", True),
+    )
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, context):
+        from app.db import save_stage_results_bulk
+
+        _check_lease(context)
+        masked = context["masked"]
+        rows = []
+        for stage, key, keep_empty in self.STAGES:
+            if key not in context:
+                continue
+            output = context[key]
+            if output or (keep_empty and output is not None):
+                rows.append(stage_result_row(context["entry_id"], stage, stage_fingerprint(stage, masked), output))
+        save_stage_results_bulk(self.db, rows)
+        return context
+
+
+def build_entry_pipeline(db, minio, bucket, openai_client, resources, ng_patterns, nonsave_patterns,
+                         cache=None, batched=None):
+    """
+    PROCESS_ENTRY のパイプラインを組み立てる
+
+    Args:
+        batched: 感情・キーワードを1リクエストにまとめるか（省略時は LLM_MICROBATCH の設定）
+    """
+    if batched is None:
+        batched = get_microbatch_settings()["enabled"]
+    if batched:
+        llm_analysis = [BatchedAnalysisStep(openai_client)]
+    else:
+        llm_analysis = [TagsStep(openai_client), EmotionStep(openai_client), KeywordsStep(openai_client)]
+
+    return Pipeline([
+        LoadEntryStep(db, bucket),
+        DownloadAudioStep(minio, bucket),
+        SttPreprocessStep(),
+        TranscribeStep(db, openai_client),
+        CleanStep(resources),
+        PiiStep(resources),
+        NgStep(ng_patterns, nonsave_patterns),
+        SummaryStep(openai_client, resources),
+        UpdateEntryStep(db),
+        ParallelSteps(llm_analysis + [
+            SpeechStep(),
+            ActionsStep(openai_client),
+        ], name="analysis"),
+        PersistAnalysisStep(db),
+        SaveStageResultsStep(db),
+    ], cache=cache)
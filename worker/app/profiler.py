@@ -0,0 +1,301 @@
+"""
+稼働中のワーカーのオンデマンドプロファイリング
+
+再デプロイせずに本番のワーカーをプロファイルするため、制御キーかシグナルで
+時間を区切ったプロファイルを取り、結果をローカルディスクか MinIO に書き出す
+
+- 開始: Redis の worker:profile に JSON を置く（全ワーカーが id ごとに1回実行）
+    {"id": "任意", "seconds": 30, "mode": "sample" | "cprofile", "memory": false}
+  または SIGUSR1（既定の設定で開始）
+- 計測するのは Worker.handle_job の実行中だけ（scope() の範囲、待機中の BRPOP は含まない）
+- sample: 別スレッドで interval_ms ごとに sys._current_frames() を読み、
+  flamegraph.pl / speedscope で読める collapsed 形式（"thread;frame;frame 件数"）で書き出す
+  スタックを読むだけなので 10ms 間隔でも負荷は数%以下。空きのスレッドプールのスレッドは数えない
+- cprofile: handle_job を cProfile で計測して pstats 形式（.prof、flameprof / snakeviz で表示）で書き出す
+  関数呼び出しごとに計測するため sample より負荷が大きい
+- memory: tracemalloc を開始し、終了時の開始時点からの増分を上位 MEMORY_TOP 行のテキストで書き出す
+- 期限が来たら poll() で終了して書き出す（メインループから呼ぶ）
+"""
+
+import cProfile
+import io
+import json
+import marshal
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+CONTROL_KEY = "worker:profile"
+MODES = ("sample", "cprofile")
+MEMORY_TOP = 50
+# 制御キーを確認する間隔（秒）
+POLL_INTERVAL_SEC = 5.0
+
+
+def _frame_label(code):
+    path = code.co_filename
+    parts = path.replace("\\", "/").split("/")
+    short = "/".join(parts[-2:]) if len(parts) > 1 else path
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _is_idle(frames):
+    """
+    スレッドプールでタスクを待っているだけのスレッドか（frames は末端から順）
+
+    タスク待ちの SimpleQueue.get は C 実装なので、末端が _worker のままになる
+    """
+    leaf = frames[0] if frames else None
+    return leaf is not None and leaf.co_name == "_worker" and \
+        leaf.co_filename.endswith(os.path.join("futures", "thread.py"))
+
+
+class StackSampler:
+    """
+    別スレッドで全スレッドのスタックを一定間隔で数える
+
+    Args:
+        interval_sec: サンプリング間隔
+        active: サンプリングするかどうかを返す関数（handle_job の実行中だけ数える）
+    """
+
+    def __init__(self, interval_sec=0.01, active=lambda: True):
+        self.interval_sec = interval_sec
+        self.active = active
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            if self.active():
+                self.sample()
+
+    def sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if _is_idle(codes):
+                continue
+            stack = [names.get(ident, str(ident))] + [_frame_label(code) for code in reversed(codes)]
+            self.counts[";".join(stack)] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """flamegraph の collapsed 形式"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class ProfileSession:
+    """1回分のプロファイル（mode: sample / cprofile、memory: tracemalloc も取るか）"""
+
+    def __init__(self, request_id, mode, seconds, memory, interval_sec, clock=time.monotonic):
+        self.request_id = request_id
+        self.mode = mode
+        self.memory = memory
+        self._clock = clock
+        self.deadline = clock() + seconds
+        self.started_at = time.time()
+        self._active = 0
+        self._lock = threading.Lock()
+        self.sampler = None
+        self.profile = None
+        self._snapshot = None
+
+        if mode == "sample":
+            self.sampler = StackSampler(interval_sec, active=lambda: self._active > 0)
+            self.sampler.start()
+        else:
+            self.profile = cProfile.Profile()
+        if memory:
+            self._tracing = tracemalloc.is_tracing()
+            if not self._tracing:
+                tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def expired(self):
+        return self._clock() >= self.deadline
+
+    @contextmanager
+    def scope(self):
+        with self._lock:
+            self._active += 1
+        if self.profile is not None:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            with self._lock:
+                self._active -= 1
+
+    def finish(self):
+        """
+        計測を止めて結果を返す
+
+        Returns:
+            [(拡張子, bytes)]
+        """
+        outputs = []
+        if self.sampler is not None:
+            self.sampler.stop()
+            outputs.append(("collapsed", self.sampler.collapsed().encode("utf-8")))
+        if self.profile is not None:
+            buf = io.BytesIO()
+            self.profile.create_stats()
+            marshal.dump(self.profile.stats, buf)
+            outputs.append(("prof", buf.getvalue()))
+        if self._snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+            if not self._tracing:
+                tracemalloc.stop()
+            text = "".join(f"{stat}\n" for stat in stats[:MEMORY_TOP])
+            outputs.append(("tracemalloc.txt", text.encode("utf-8")))
+        return outputs
+
+
+class Profiler:
+    """
+    制御キー・シグナルでプロファイルを開始し、期限が来たら書き出す
+
+    Args:
+        output_dir: 書き出し先のディレクトリ（bucket 指定時は使わない）
+        minio, bucket: MinIO に書き出す場合のクライアントとバケット（キーは profiles/ 以下）
+        interval_ms: sample のサンプリング間隔
+        max_sec: 1回のプロファイルの上限秒数
+    """
+
+    def __init__(self, output_dir="/tmp/worker-profiles", minio=None, bucket=None, interval_ms=10,
+                 default_sec=30, max_sec=300, worker=None, clock=time.monotonic):
+        self.output_dir = output_dir
+        self.minio = minio
+        self.bucket = bucket
+        self.interval_sec = interval_ms / 1000.0
+        self.default_sec = default_sec
+        self.max_sec = max_sec
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self._clock = clock
+        self.session = None
+        self._requested = None
+        self._last_id = None
+        self._last_poll = None
+
+    @classmethod
+    def from_env(cls, minio=None):
+        from app.config import get_profiler_settings
+
+        settings = get_profiler_settings()
+        return cls(minio=minio if settings["bucket"] else None, **settings)
+
+    def request(self, mode="sample", seconds=None, memory=False, request_id=None):
+        """プロファイルを要求（シグナルハンドラから呼べるよう、開始は次の poll() で行う）"""
+        self._requested = {"id": request_id, "mode": mode, "seconds": seconds, "memory": memory}
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR1", None)):
+        if signum is not None:
+            signal.signal(signum, lambda *_: self.request())
+
+    def _read_control(self, r):
+        now = self._clock()
+        if self._last_poll is not None and now - self._last_poll < POLL_INTERVAL_SEC:
+            return None
+        self._last_poll = now
+        try:
+            raw = r.get(CONTROL_KEY)
+        except Exception as e:
+            print(f"[PROFILE] Failed to read {CONTROL_KEY}: {e}")
+            return None
+        if not raw:
+            return None
+        try:
+            control = json.loads(raw)
+        except ValueError:
+            print(f"[PROFILE] Invalid {CONTROL_KEY}: {raw!r}")
+            return None
+        if control.get("id") is None or control["id"] == self._last_id:
+            return None
+        self._last_id = control["id"]
+        return control
+
+    def poll(self, r=None):
+        """期限の来たプロファイルを書き出し、要求があれば開始（メインループから呼ぶ）"""
+        if self.session is not None and self.session.expired():
+            self.stop()
+
+        control = self._requested
+        self._requested = None
+        if control is None and r is not None:
+            control = self._read_control(r)
+        if control is None or self.session is not None:
+            return
+
+        mode = control.get("mode") or "sample"
+        if mode not in MODES:
+            print(f"[PROFILE] Unknown mode: {mode}")
+            return
+        seconds = min(float(control.get("seconds") or self.default_sec), self.max_sec)
+        self.session = ProfileSession(control.get("id"), mode, seconds, bool(control.get("memory")),
+                                      self.interval_sec, self._clock)
+        print(f"[PROFILE] Started {mode} for {seconds:.0f}s")
+
+    @contextmanager
+    def scope(self):
+        """handle_job の実行範囲（プロファイル中だけ計測する）"""
+        session = self.session
+        if session is None:
+            yield
+            return
+        with session.scope():
+            yield
+
+    def stop(self):
+        """実行中のプロファイルを終了して書き出す"""
+        session, self.session = self.session, None
+        if session is None:
+            return []
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started_at))
+        written = []
+        for ext, data in session.finish():
+            name = f"{stamp}-{self.worker}.{ext}"
+            try:
+                written.append(self._write(name, data))
+            except Exception as e:
+                print(f"[PROFILE] Failed to write {name}: {e}")
+        print(f"[PROFILE] Finished: {', '.join(written)}")
+        return written
+
+    def _write(self, name, data):
+        if self.minio is not None and self.bucket:
+            from app.storage import put_stream
+
+            key = f"profiles/{name}"
+            put_stream(self.minio, self.bucket, key, data, fmt="bin")
+            return f"s3://{self.bucket}/{key}"
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
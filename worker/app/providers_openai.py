@@ -1,28 +1,89 @@
 """OpenAI provider functions for STT and other services."""
 from typing import Optional
+import os
 import openai
+from .cancellation import JobCancelled, check_cancelled, run_cancellable
+from .circuit import CircuitOpenError, get_breaker
 from .config import get_openai_api_key
+from .hedging import hedged_call
+from .retry import is_retryable
+from .streaming import current_stream
+from .tokenizer import tokenize
+from .usage import track_call
 
 
-def stt_openai(audio_file_path: str) -> Optional[str]:
+# Single provider attempts. A hedged call may run two of these concurrently,
+# so each attempt opens its own file handle and is tracked separately.
+
+def _transcribe(audio_file_path: str, audio_seconds: Optional[float] = None) -> str:
+    with open(audio_file_path, 'rb') as audio_file, get_breaker("stt").guard(), \
+            track_call("stt", "whisper-1", request_bytes=os.path.getsize(audio_file_path),
+                       audio_seconds=audio_seconds) as call:
+        # verbose_json also returns the audio duration, which STT is billed by
+        response = openai.Audio.transcribe(
+            model="whisper-1",
+            file=audio_file,
+            response_format="verbose_json"
+        )
+        call.response = response
+        if call.audio_seconds is None and response.get('duration') is not None:
+            call.audio_seconds = float(response['duration'])
+        return response.get('text', '')
+
+
+def _chat(messages: list, model: str, **kwargs):
+    with get_breaker("chat").guard(), track_call("chat", model) as call:
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            **kwargs
+        )
+        call.response = response
+    return response
+
+
+def _chat_stream(messages: list, model: str, on_delta, **kwargs) -> str:
+    # Streaming attempt: deltas are forwarded as they arrive and the full text is
+    # returned at the end. Not hedged; cancellation is checked between chunks.
+    with get_breaker("chat").guard(), track_call("chat", model) as call:
+        parts = []
+        for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True, **kwargs):
+            check_cancelled()
+            delta = chunk["choices"][0]["delta"].get("content")
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        # Streamed responses carry no usage: estimate prompt tokens with the shared
+        # tokenizer, count one completion token per chunk and flag the row as estimated
+        prompt_tokens = sum(len(tokenize(m.get("content") or "")) for m in messages)
+        call.response = {"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(parts)}}
+        call.estimated = True
+    return "".join(parts)
+
+
+def stt_openai(audio_file_path: str, audio_seconds: Optional[float] = None) -> Optional[str]:
     """Speech-to-text using OpenAI Whisper.
     
     Args:
         audio_file_path: Path to the audio file
+        audio_seconds: Length of the audio, for cost accounting (taken from the
+            response when omitted)
         
     Returns:
         Transcribed text or None if failed
+
+    Raises:
+        Retryable errors (rate limits, timeouts, 5xx), CircuitOpenError and JobCancelled
     """
     try:
         openai.api_key = get_openai_api_key()
-        
-        with open(audio_file_path, 'rb') as audio_file:
-            response = openai.Audio.transcribe(
-                model="whisper-1",
-                file=audio_file
-            )
-            return response.get('text', '')
+        return run_cancellable(hedged_call, "stt", _transcribe, audio_file_path, audio_seconds)
+    except (CircuitOpenError, JobCancelled):
+        raise
     except Exception as e:
+        if is_retryable(e):
+            # Rate limits and transient failures go back to the worker's retry/backoff
+            raise
         print(f"OpenAI STT error: {e}")
         return None
 
@@ -30,6 +91,9 @@ def stt_openai(audio_file_path: str) -> Optional[str]:
 def chat_completion(messages: list, model: str = "gpt-3.5-turbo", **kwargs) -> Optional[str]:
     """OpenAI chat completion.
     
+    Inside app.streaming.summary_stream the completion is streamed and partial
+    text is appended to the active stream.
+    
     Args:
         messages: List of message dictionaries
         model: Model name to use
@@ -37,16 +101,26 @@ def chat_completion(messages: list, model: str = "gpt-3.5-turbo", **kwargs) -> O
         
     Returns:
         Response text or None if failed
+
+    Raises:
+        Retryable errors (rate limits, timeouts, 5xx), CircuitOpenError and JobCancelled
     """
     try:
         openai.api_key = get_openai_api_key()
-        
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-            **kwargs
-        )
+        stream = current_stream.get()
+        if stream is not None:
+            return _chat_stream(messages, model, stream.append, **kwargs)
+        response = run_cancellable(hedged_call, "chat", _chat, messages, model, **kwargs)
         return response.choices[0].message.content
+    except (CircuitOpenError, JobCancelled):
+        raise
     except Exception as e:
+        if is_retryable(e):
+            # Rate limits and transient failures go back to the worker's retry/backoff
+            raise
         print(f"OpenAI chat completion error: {e}")
+        stream = current_stream.get()
+        if stream is not None:
+            # The caller gets None instead of the exception, so close the stream as failed here
+            stream.fail(type(e).__name__)
         return None
@@ -0,0 +1,163 @@
+"""
+ジョブの遅延リトライ
+
+失敗したジョブを待機せずに遅延キューへ入れ、期限が来たら実行キューに戻す
+
+- 遅延キュー: {queue}:delayed（ソート済みセット、スコア = 実行予定時刻の UNIX 秒）
+- 期限の来たジョブは promote_due が実行キューへ移す（メインループで毎回呼ぶ）
+- 待ち時間はエラー分類ごとの指数バックオフ + ジッタ
+  rate_limit（429）は長めに多く、parse（応答の解析失敗）は少なく、
+  not_found（対象が存在しない・ペイロード不正）はリトライしない
+- リトライ回数を超えたジョブは {queue}:dead（リスト）に理由と共に残す
+- 依存先のサーキットブレーカーが open の間は defer_job で回数を数えずに退避する
+"""
+
+import json
+import random
+import time
+from dataclasses import dataclass
+
+from app.dispatch import QUEUE_KEY
+from app.metrics import REGISTRY
+
+PROMOTE_BATCH = 100
+# BRPOP の最大待ち時間（遅延ジョブの期限がこれより早ければ短くする）
+MAX_POLL_SEC = 30
+DEAD_LETTER_MAX = 10000
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int
+    base_delay_sec: float
+    max_delay_sec: float
+
+
+POLICIES = {
+    "rate_limit": RetryPolicy(max_retries=8, base_delay_sec=30, max_delay_sec=900),
+    "transient": RetryPolicy(max_retries=5, base_delay_sec=5, max_delay_sec=300),
+    "parse": RetryPolicy(max_retries=2, base_delay_sec=10, max_delay_sec=60),
+    "not_found": RetryPolicy(max_retries=0, base_delay_sec=0, max_delay_sec=0),
+    "unknown": RetryPolicy(max_retries=3, base_delay_sec=30, max_delay_sec=600),
+}
+
+# 期限が来たジョブを取り出して実行キューへ移す
+PROMOTE_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+  redis.call('zrem', KEYS[1], job)
+  redis.call('lpush', KEYS[2], job)
+end
+return #due
+"""
+
+_TRANSIENT_NAMES = {
+    "Timeout", "TimeoutError", "APITimeoutError", "APIConnectionError", "ServiceUnavailableError",
+    "ConnectionError", "OperationalError", "InterfaceError", "S3Error", "MaxRetryError",
+}
+
+
+def delayed_key(queue=QUEUE_KEY):
+    return f"{queue}:delayed"
+
+
+def dead_key(queue=QUEUE_KEY):
+    return f"{queue}:dead"
+
+
+def _status_code(error):
+    for attr in ("http_status", "status_code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def classify_error(error):
+    """
+    例外をリトライ方針の分類に振り分ける
+
+    Returns:
+        rate_limit / transient / parse / not_found / unknown
+    """
+    status = _status_code(error)
+    name = type(error).__name__
+    if status == 429 or name == "RateLimitError":
+        return "rate_limit"
+    if (status is not None and status >= 500) or name in _TRANSIENT_NAMES or \
+            isinstance(error, (ConnectionError, TimeoutError)):
+        return "transient"
+    if isinstance(error, (LookupError, TypeError)) or status == 404:
+        # ペイロードのキー不足・対象なし（再実行しても結果は変わらない）
+        return "not_found"
+    if isinstance(error, ValueError):
+        # json.JSONDecodeError を含む
+        return "parse"
+    return "unknown"
+
+
+def is_retryable(error):
+    """時間を置けば成功する見込みがあるか（ジョブ内で握りつぶさず Worker に返してリトライさせる）"""
+    return classify_error(error) in ("rate_limit", "transient")
+
+
+def backoff_delay(policy, attempt, rand=random.random):
+    """attempt 回目のリトライまでの待ち時間（秒、上限付き指数バックオフの半分をジッタにする）"""
+    delay = min(policy.max_delay_sec, policy.base_delay_sec * (2 ** (attempt - 1)))
+    return delay / 2 + rand() * delay / 2
+
+
+def schedule_retry(r, job, error, queue=QUEUE_KEY, now=None, rand=random.random):
+    """
+    失敗したジョブを遅延キューへ入れる（回数超過・リトライ不可ならデッドレター）
+
+    job の attempts（リトライ回数）を加算し、最後のエラーを lastError に入れる
+
+    Returns:
+        (分類, 待ち時間の秒数)  デッドレターにした場合の待ち時間は None
+    """
+    now = time.time() if now is None else now
+    error_class = classify_error(error)
+    policy = POLICIES[error_class]
+    attempt = int(job.get("attempts", 0)) + 1
+    retry_job = dict(job, attempts=attempt, lastError=f"{type(error).__name__}: {error}"[:500])
+    labels = {"type": job.get("type"), "error_class": error_class}
+
+    if attempt > policy.max_retries:
+        r.lpush(dead_key(queue), json.dumps({
+            "job": retry_job, "errorClass": error_class, "failedAt": int(now),
+        }, ensure_ascii=False))
+        r.ltrim(dead_key(queue), 0, DEAD_LETTER_MAX - 1)
+        REGISTRY.inc("worker_jobs_dead_total", help_text="Jobs moved to the dead-letter list", **labels)
+        return error_class, None
+
+    delay = backoff_delay(policy, attempt, rand)
+    # キューの待ち時間は実行予定時刻から数える
+    retry_job["enqueuedAt"] = round(now + delay, 3)
+    r.zadd(delayed_key(queue), {json.dumps(retry_job, ensure_ascii=False): now + delay})
+    REGISTRY.inc("worker_jobs_retried_total", help_text="Jobs scheduled for a delayed retry", **labels)
+    return error_class, delay
+
+
+def defer_job(r, job, delay, queue=QUEUE_KEY, now=None):
+    """リトライ回数を数えずにジョブを遅延キューへ入れる（依存先の障害中の退避用）"""
+    now = time.time() if now is None else now
+    job = dict(job, enqueuedAt=round(now + delay, 3))
+    r.zadd(delayed_key(queue), {json.dumps(job, ensure_ascii=False): now + delay})
+    REGISTRY.inc("worker_jobs_deferred_total", help_text="Jobs parked while a dependency is unavailable",
+                 type=job.get("type"))
+
+
+def promote_due(r, queue=QUEUE_KEY, now=None, limit=PROMOTE_BATCH):
+    """期限の来た遅延ジョブを実行キューへ移す（複数Workerから呼んでも重複しない）"""
+    now = time.time() if now is None else now
+    return int(r.eval(PROMOTE_SCRIPT, 2, delayed_key(queue), queue, now, limit) or 0)
+
+
+def poll_timeout(r, queue=QUEUE_KEY, now=None, max_wait=MAX_POLL_SEC):
+    """次の遅延ジョブの期限までの秒数（BRPOP の timeout 用、1〜max_wait 秒）"""
+    now = time.time() if now is None else now
+    head = r.zrange(delayed_key(queue), 0, 0, withscores=True)
+    if not head:
+        return max_wait
+    return int(max(1, min(max_wait, head[0][1] - now + 1)))
@@ -1,10 +1,17 @@
 """
 Phase 4.6: 話し方分析
 話す速度、フィラーワード率、文長、語彙多様性（TTR）
+
+analyze_speech_batch / get_speech_quality_score_batch はバックフィル・集計用のバッチ版
+（NumPy配列で一括計算）
 """
 
 import re
 
+import numpy as np
+
+from app.tokenizer import tokenize
+
 # フィラーワードリスト（日本語）
 FILLER_WORDS = [
     'あー', 'えー', 'うー', 'んー',
@@ -12,6 +19,39 @@ FILLER_WORDS = [
     'まあ', 'ちょっと', 'やっぱり'
 ]
 
+_SENTENCE_SPLIT_RE = re.compile(r'[。！？\n]+')
+
+_METRIC_KEYS = ('speech_rate', 'filler_word_rate', 'avg_sentence_length', 'vocabulary_diversity')
+
+
+class FillerMatcher:
+    """
+    フィラーワードを1パスで数えるマッチャー
+
+    全フィラーの選択（長い順）を先読みで包んだ正規表現1本で、各開始位置の最長一致を拾う。
+    同じ位置で一致する短いフィラーは最長一致の接頭辞に限られるため、
+    「そのフィラーの接頭辞になっているフィラー数」を加算すれば
+    フィラーごとの text.count の合計と一致する（自己重複するフィラーを除く）。
+    """
+
+    def __init__(self, words):
+        words = sorted(set(w for w in words if w), key=len, reverse=True)
+        self._weights = {w: sum(1 for p in words if w.startswith(p)) for w in words}
+        if words:
+            self._pattern = re.compile('(?=(' + '|'.join(re.escape(w) for w in words) + '))')
+        else:
+            self._pattern = None
+
+    def count(self, text):
+        """テキスト中のフィラー出現数を返す"""
+        if not self._pattern or not text:
+            return 0
+        weights = self._weights
+        return sum(weights[m.group(1)] for m in self._pattern.finditer(text))
+
+
+_FILLER_MATCHER = FillerMatcher(FILLER_WORDS)
+
 def analyze_speech(text: str, duration_seconds: float = None) -> dict:
     """
     話し方を分析
@@ -32,7 +72,8 @@ def analyze_speech(text: str, duration_seconds: float = None) -> dict:
         }
     
     # 1. 話す速度 (words/min)
-    words = text.split()
+    # 日本語は空白で区切られないため、共有トークナイザで分割（結果はキャッシュ済み）
+    words = tokenize(text)
     word_count = len(words)
     
     if duration_seconds and duration_seconds > 0:
@@ -43,14 +84,12 @@ def analyze_speech(text: str, duration_seconds: float = None) -> dict:
         speech_rate = word_count / max(estimated_duration_min, 0.1)
     
     # 2. フィラーワード出現率
-    filler_count = 0
-    for filler in FILLER_WORDS:
-        filler_count += text.count(filler)
+    filler_count = _FILLER_MATCHER.count(text)
     
     filler_word_rate = filler_count / max(word_count, 1)
     
     # 3. 文の平均長さ
-    sentences = re.split(r'[。！？\n]+', text)
+    sentences = _SENTENCE_SPLIT_RE.split(text)
     sentences = [s.strip() for s in sentences if s.strip()]
     
     if sentences:
@@ -133,6 +172,124 @@ def get_speech_quality_score(analysis: dict) -> float:
     
     return round(score, 2)
 
+def analyze_speech_batch(texts, durations=None) -> dict:
+    """
+    複数テキストの話し方をまとめて分析（analyze_speech のバッチ版）
+
+    文字列処理（単語分割・フィラー計数・文分割）は1テキスト1パスで行い、
+    指標の計算は NumPy 配列でまとめて行う
+
+    Args:
+        texts: 文字起こしテキストのリスト
+        durations: 音声の長さ（秒）のリスト（省略可、None/0 の要素は文字数から推定）
+
+    Returns:
+        指標名 -> np.ndarray（texts と同じ順序）
+    """
+    n = len(texts)
+    word_counts = np.zeros(n)
+    unique_counts = np.zeros(n)
+    filler_counts = np.zeros(n)
+    char_counts = np.zeros(n)
+    sentence_chars = np.zeros(n)
+    sentence_counts = np.zeros(n)
+    valid = np.zeros(n, dtype=bool)
+
+    for i, text in enumerate(texts):
+        if not text or len(text.strip()) < 10:
+            continue
+        valid[i] = True
+        words = tokenize(text)
+        word_counts[i] = len(words)
+        unique_counts[i] = len(set(words))
+        filler_counts[i] = _FILLER_MATCHER.count(text)
+        char_counts[i] = len(text)
+        for sentence in _SENTENCE_SPLIT_RE.split(text):
+            sentence = sentence.strip()
+            if sentence:
+                sentence_chars[i] += len(sentence)
+                sentence_counts[i] += 1
+
+    if durations is None:
+        duration = np.zeros(n)
+    else:
+        duration = np.array([d or 0.0 for d in durations], dtype=float)
+
+    safe_words = np.maximum(word_counts, 1)
+    has_duration = duration > 0
+    # duration不明の場合、文字数から推定（日本語: 約300文字/分）
+    estimated_min = np.maximum(char_counts / 300, 0.1)
+    speech_rate = np.where(
+        has_duration,
+        word_counts / np.where(has_duration, duration, 1.0) * 60,
+        word_counts / estimated_min
+    )
+    avg_sentence_length = np.divide(
+        sentence_chars, sentence_counts,
+        out=np.zeros(n), where=sentence_counts > 0
+    )
+
+    result = {
+        'speech_rate': np.round(speech_rate, 2),
+        'filler_word_rate': np.round(filler_counts / safe_words, 4),
+        'avg_sentence_length': np.round(avg_sentence_length, 2),
+        'vocabulary_diversity': np.round(unique_counts / safe_words, 4),
+    }
+    for key in _METRIC_KEYS:
+        result[key][~valid] = 0.0
+    return result
+
+def get_speech_quality_score_batch(analysis: dict) -> np.ndarray:
+    """
+    話し方の質スコアをまとめて計算（get_speech_quality_score のバッチ版）
+
+    Args:
+        analysis: analyze_speech_batch の結果（指標名 -> 配列）
+
+    Returns:
+        スコア配列（0-1）
+    """
+    rate = np.asarray(analysis['speech_rate'], dtype=float)
+    speech_score = np.select(
+        [
+            (rate >= 120) & (rate <= 180),
+            ((rate >= 100) & (rate < 120)) | ((rate > 180) & (rate <= 200)),
+            ((rate >= 80) & (rate < 100)) | ((rate > 200) & (rate <= 220)),
+        ],
+        [1.0, 0.8, 0.6],
+        default=0.4
+    )
+
+    filler = np.asarray(analysis['filler_word_rate'], dtype=float)
+    filler_score = np.select([filler < 0.05, filler < 0.1, filler < 0.15], [1.0, 0.8, 0.6], default=0.4)
+
+    length = np.asarray(analysis['avg_sentence_length'], dtype=float)
+    length_score = np.select(
+        [
+            (length >= 15) & (length <= 30),
+            ((length >= 10) & (length < 15)) | ((length > 30) & (length <= 40)),
+        ],
+        [1.0, 0.8],
+        default=0.6
+    )
+
+    diversity = np.asarray(analysis['vocabulary_diversity'], dtype=float)
+    diversity_score = np.select([diversity >= 0.5, diversity >= 0.4, diversity >= 0.3], [1.0, 0.8, 0.6], default=0.4)
+
+    score = (
+        speech_score * 0.3 +
+        filler_score * 0.3 +
+        length_score * 0.2 +
+        diversity_score * 0.2
+    )
+    return np.round(score, 2)
+
+def iter_speech_batch(analysis: dict):
+    """analyze_speech_batch の結果を analyze_speech と同じ形式の辞書に展開"""
+    columns = [analysis[key].tolist() for key in _METRIC_KEYS]
+    for values in zip(*columns):
+        yield dict(zip(_METRIC_KEYS, values))
+
 # 使用例
 if __name__ == "__main__":
     sample_texts = [
@@ -1,7 +1,11 @@
 """Speech processing and transcription module."""
 from typing import Dict, Any, Optional
+import os
 import openai
 from .config import get_openai_api_key
+from .tokenizer import tokenize
+from .usage import track_call
+from .circuit import CircuitOpenError, get_breaker
 
 
 class SpeechProcessor:
@@ -21,12 +25,16 @@ class SpeechProcessor:
             Transcribed text or None if failed
         """
         try:
-            with open(audio_file_path, 'rb') as audio_file:
+            with open(audio_file_path, 'rb') as audio_file, get_breaker("stt").guard(), \
+                    track_call("stt", "whisper-1", request_bytes=os.path.getsize(audio_file_path)) as call:
                 response = openai.Audio.transcribe(
                     model="whisper-1",
                     file=audio_file
                 )
+                call.response = response
                 return response.get('text', '')
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"Error transcribing audio: {e}")
             return None
@@ -48,7 +56,7 @@ class SpeechProcessor:
             }
 
         # Basic analysis - count words, sentences, etc.
-        words = text.split()
+        words = tokenize(text)
         sentences = text.split('.')
         
         return {
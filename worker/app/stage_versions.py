@@ -0,0 +1,113 @@
+"""
+ステージ別の入力フィンガープリント
+
+各ステージの出力を「入力フィンガープリント」と一緒に保存し、
+再処理時に入力（マスク済みテキスト・依存辞書・プロンプト・モデル・コードバージョン）が
+変わっていないステージをスキップする。
+
+辞書を更新した場合は、その辞書に依存するステージのフィンガープリントだけが変わるため、
+バックフィルでは該当ステージのみが再実行される。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from app.config import get_openai_model
+
+RESOURCES_DIR = Path(__file__).parent.parent / "resources"
+
+# version: ステージのロジックを変更したら上げる（辞書に載らない定数の変更も含む）
+# resources: 依存するリソースファイル（resources/ からの相対パス）
+# model: LLMモデルに依存するか
+STAGE_SPECS = {
+    "tags": {"version": 2, "resources": ["tag_rules.txt"], "model": False},
+    "ng": {"version": 1, "resources": ["ng_topics.txt", "non_save_words.txt"], "model": False},
+    "speech": {"version": 2, "resources": [], "model": False},
+    "summary": {
+        "version": 1,
+        "resources": ["prompts/entry_summary_system.txt", "prompts/entry_summary_user.txt"],
+        "model": True,
+    },
+    "emotion": {"version": 1, "resources": [], "model": True},
+    "keywords": {"version": 1, "resources": [], "model": True},
+    "actions": {"version": 1, "resources": [], "model": True},
+}
+
+# (path, mtime_ns, size) -> sha256
+_file_hash_cache = {}
+
+
+def _file_hash(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    cache_key = (str(path), st.st_mtime_ns, st.st_size)
+    digest = _file_hash_cache.get(cache_key)
+    if digest is None:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        _file_hash_cache[cache_key] = digest
+    return digest
+
+
+def resource_version(stage, resources_dir=None):
+    """ステージが依存するリソースファイルのハッシュ（ファイルが変われば変わる）"""
+    base = Path(resources_dir) if resources_dir else RESOURCES_DIR
+    h = hashlib.sha256()
+    for name in STAGE_SPECS[stage]["resources"]:
+        h.update(name.encode("utf-8"))
+        h.update(_file_hash(base / name).encode("ascii"))
+    return h.hexdigest()
+
+
+def stage_fingerprint(stage, text, model=None, resources_dir=None):
+    """
+    ステージ入力のフィンガープリントを計算
+
+    Args:
+        stage: ステージ名（STAGE_SPECS のキー）
+        text: ステージに渡すテキスト（マスク済み）
+        model: LLMモデル名（省略時は OPENAI_MODEL）
+        resources_dir: リソースディレクトリ（省略時は worker/resources）
+
+    Returns:
+        SHA-256 の16進文字列
+    """
+    spec = STAGE_SPECS[stage]
+    parts = {
+        "stage": stage,
+        "version": spec["version"],
+        "resources": resource_version(stage, resources_dir),
+        "model": (model or get_openai_model()) if spec["model"] else None,
+        "text": hashlib.sha256((text or "").encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def split_stale(db, rows, stage, model=None, force=False):
+    """
+    入力が変わったエントリだけを抽出（保存済みフィンガープリントは1クエリで取得）
+
+    Args:
+        rows: id と transcript_text を持つエントリ
+        force: True なら全件を再実行対象にする
+
+    Returns:
+        (再実行が必要な rows, entry_id -> 新しいフィンガープリント)
+    """
+    from app.db import get_stage_fingerprints
+
+    fingerprints = {row["id"]: stage_fingerprint(stage, row["transcript_text"], model) for row in rows}
+    if force:
+        return list(rows), fingerprints
+    stored = get_stage_fingerprints(db, list(fingerprints), stage)
+    stale = [row for row in rows if stored.get(row["id"]) != fingerprints[row["id"]]]
+    return stale, fingerprints
+
+
+def stage_result_row(entry_id, stage, fingerprint, output):
+    """save_stage_results_bulk 用の1行を作成"""
+    return (entry_id, stage, fingerprint, json.dumps(output, ensure_ascii=False))
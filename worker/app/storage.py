@@ -1,5 +1,35 @@
+import fcntl
+import hashlib
+import io
+import mmap
+import os
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+
 from minio import Minio
 
+from app.circuit import get_breaker
+from app.config import get_object_cache_settings
+
+# マルチパートアップロードのパートサイズ（MinIO の下限は 5MiB）と並列数
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_PARALLEL_UPLOADS = 4
+
+# 出力形式 -> Content-Type
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+    "mp4": "audio/mp4",
+    "aac": "audio/aac",
+    "wav": "audio/wav",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+    "webm": "audio/webm",
+    "flac": "audio/flac",
+}
+
 def make_minio(endpoint: str, access_key: str, secret_key: str) -> Minio:
     endpoint2 = endpoint.replace("http://", "").replace("https://", "")
     host, port = (endpoint2.split(":") + ["9000"])[:2]
@@ -13,3 +43,252 @@ def make_minio(endpoint: str, access_key: str, secret_key: str) -> Minio:
 def get_object_bytes(m: Minio, bucket: str, key: str) -> bytes:
     obj = m.get_object(bucket, key)
     return obj.read()
+
+def content_type_for(fmt: str) -> str:
+    """形式（拡張子）から Content-Type を決める"""
+    return CONTENT_TYPES.get((fmt or "").lower().lstrip("."), "application/octet-stream")
+
+def derive_variant_key(source_key: str, variant: str, fmt: str) -> str:
+    """
+    バリアントのキーを導出（例: audio/1/abc.webm -> audio/1/abc_denoise.mp3）
+
+    元のキーの拡張子を出力形式の拡張子に置き換え、ファイル名にバリアント名を付ける。
+    バリアント名が必ず入るため、どの入力形式でも元のキーと一致しない。
+    """
+    if not variant:
+        raise ValueError("variant name is required")
+    root, _ = posixpath.splitext(source_key)
+    return f"{root}_{variant}.{fmt.lower().lstrip('.')}"
+
+class _IterReader(io.RawIOBase):
+    """bytes のイテレータ（ジェネレータ）をファイルライクに読むためのラッパー"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        if size < 0:
+            data, self._buf = self._buf, b""
+        else:
+            data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+def put_stream(m: Minio, bucket: str, key: str, source, fmt: str = None, length: int = None,
+               part_size: int = DEFAULT_PART_SIZE, parallel: int = DEFAULT_PARALLEL_UPLOADS):
+    """
+    マルチパート・並列アップロード
+
+    Args:
+        source: ファイルパス / bytes / ファイルライク / bytes のイテレータ
+        fmt: 出力形式（Content-Type の決定に使う、省略時はキーの拡張子）
+        length: ファイルライクのサイズ（不明なら None でストリーミング）
+        part_size: パートサイズ（5MiB 以上）
+        parallel: 並列にアップロードするパート数
+
+    Returns:
+        ObjectWriteResult
+    """
+    content_type = content_type_for(fmt or posixpath.splitext(key)[1])
+
+    with get_breaker("storage").guard():
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                return m.put_object(bucket, key, f, os.path.getsize(source), content_type=content_type,
+                                    part_size=part_size, num_parallel_uploads=parallel)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            length = len(source)
+            source = io.BytesIO(source)
+        elif not hasattr(source, "read"):
+            source = _IterReader(source)
+            length = None
+
+        return m.put_object(bucket, key, source, -1 if length is None else length,
+                            content_type=content_type, part_size=part_size,
+                            num_parallel_uploads=parallel)
+
+# スレッド間ロックの数（オブジェクト名のハッシュで割り当てる）
+LOCK_STRIPES = 64
+# メモリに覚えておく ETag の件数
+ETAG_INDEX_SIZE = 10000
+
+
+class ObjectCache:
+    """
+    MinIO オブジェクトのローカルディスクキャッシュ
+
+    - キーは bucket/key/ETag（オブジェクトが更新されれば別エントリになる）
+    - 直近 etag_ttl_sec 秒以内に確認した ETag はメモリに覚えておき、ヒット時は stat_object を呼ばない
+      （その間にオブジェクトが更新されても古い内容を返す。0 なら毎回確認する）
+    - 合計サイズが max_bytes を超えたら最終アクセスが古い順に削除（LRU）
+      ロックファイル（空）は削除しない。削除すると、待機中のプロセスが古い inode をロックしたまま
+      別のプロセスが新しいロックファイルを作ってしまい、同じオブジェクトを同時にダウンロードできてしまうため
+    - 読み出しは mmap（ファイル全体をヒープにコピーしない）。使い終わったら release_object で閉じる
+    - 同じオブジェクトの同時取得は1回のダウンロードにまとめる
+      （スレッド間は LOCK_STRIPES 本の threading.Lock、プロセス間は fcntl.flock）
+
+    Args:
+        root: キャッシュディレクトリ
+        max_bytes: キャッシュの合計サイズ上限
+        etag_ttl_sec: 覚えておいた ETag を使う秒数
+    """
+
+    def __init__(self, root: str, max_bytes: int, etag_ttl_sec: float = 300, clock=time.monotonic):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.etag_ttl_sec = etag_ttl_sec
+        self._clock = clock
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._etags = OrderedDict()
+        self._etags_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _name(self, bucket, key, etag):
+        return hashlib.sha256(f"{bucket}/{key}/{etag}".encode("utf-8")).hexdigest()
+
+    def _thread_lock(self, name):
+        return self._locks[int(name[:8], 16) % len(self._locks)]
+
+    def _known_etag(self, bucket, key):
+        with self._etags_guard:
+            known = self._etags.get((bucket, key))
+            if known is None or self._clock() - known[1] >= self.etag_ttl_sec:
+                return None
+            return known[0]
+
+    def _remember_etag(self, bucket, key, etag):
+        with self._etags_guard:
+            self._etags[(bucket, key)] = (etag, self._clock())
+            self._etags.move_to_end((bucket, key))
+            while len(self._etags) > ETAG_INDEX_SIZE:
+                self._etags.popitem(last=False)
+
+    def get(self, m: Minio, bucket: str, key: str):
+        """
+        オブジェクトを取得（キャッシュになければダウンロードして格納）
+
+        Returns:
+            読み取り専用の mmap（bytes ライク）。空オブジェクトは b""
+        """
+        etag = self._known_etag(bucket, key)
+        if etag is not None:
+            try:
+                return self._read(self._path(bucket, key, etag))
+            except FileNotFoundError:
+                pass
+
+        etag = m.stat_object(bucket, key).etag
+        self._remember_etag(bucket, key, etag)
+        name = self._name(bucket, key, etag)
+        path = os.path.join(self.root, name + ".bin")
+        try:
+            return self._read(path)
+        except FileNotFoundError:
+            pass
+
+        with self._thread_lock(name), open(os.path.join(self.root, name + ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # ロック待ちの間に他のスレッド・プロセスが取得済みなら再ダウンロードしない
+                if not os.path.exists(path):
+                    self._download(m, bucket, key, path)
+                    self.evict(keep=path)
+                return self._read(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, bucket, key, etag):
+        return os.path.join(self.root, self._name(bucket, key, etag) + ".bin")
+
+    def _download(self, m, bucket, key, path):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        obj = m.get_object(bucket, key)
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in obj.stream(1024 * 1024):
+                    f.write(chunk)
+            os.replace(tmp, path)
+        finally:
+            obj.close()
+            obj.release_conn()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _read(self, path):
+        # アクセス時刻を更新（LRU の順序に使う）
+        os.utime(path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def evict(self, keep: str = None):
+        """合計サイズが上限を超えていれば最終アクセスが古いものから削除"""
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, entry.path, st.st_size))
+                total += st.st_size
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+_object_cache = None
+_object_cache_guard = threading.Lock()
+
+def get_object_cache():
+    """環境変数 OBJECT_CACHE_DIR が設定されていれば共有のキャッシュを返す"""
+    global _object_cache
+    settings = get_object_cache_settings()
+    if not settings["dir"]:
+        return None
+    with _object_cache_guard:
+        if _object_cache is None or _object_cache.root != settings["dir"]:
+            _object_cache = ObjectCache(settings["dir"], settings["max_bytes"], settings["etag_ttl_sec"])
+        return _object_cache
+
+def fetch_object(m: Minio, bucket: str, key: str, cache: ObjectCache = None):
+    """
+    オブジェクトを取得（キャッシュ有効時はディスクキャッシュ経由）
+
+    Returns:
+        bytes、またはキャッシュ経由なら読み取り専用の mmap（使い終わったら release_object で閉じる）
+    """
+    cache = cache or get_object_cache()
+    with get_breaker("storage").guard():
+        if cache is None:
+            obj = m.get_object(bucket, key)
+            try:
+                return obj.read()
+            finally:
+                obj.close()
+                obj.release_conn()
+        return cache.get(m, bucket, key)
+
+def release_object(data):
+    """fetch_object の結果を使い終わったら閉じる（mmap のみ、bytes や None は何もしない）"""
+    if isinstance(data, mmap.mmap) and not data.closed:
+        data.close()
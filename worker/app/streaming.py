@@ -0,0 +1,125 @@
+"""
+要約のトークンストリーミング
+
+要約の生成中に OpenAI のトークンストリームを Redis Stream に書き出し、
+API が完成を待たずに途中のテキストを中継できるようにする（最終結果の DB 保存は従来どおり最後に1回）
+
+- ストリーム: stream:{種別}:{対象ID}（range_summary / custom_summary）
+- エントリ: {"type": "start"} / {"type": "delta", "text": ...} / {"type": "done"} / {"type": "error", "reason": ...}
+  開始時に前回のストリームは削除し、終了後は ttl_sec で消える
+  done / error は最初の1回だけ書く（途中で失敗した呼び出しの後に done を書かない）
+- delta はトークンごとではなく flush_interval_sec ごとにまとめて XADD する
+- summary_stream の範囲では providers_openai.chat_completion がストリーミングで呼ばれる
+  （呼び出し元の要約モジュールは変更不要）
+- 開始時にユーザーのチャンネルへ summary.streaming イベント（stream: ストリームのキー）を送る
+- SUMMARY_STREAMING=1 で有効（既定は無効）
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.events import emit
+from app.metrics import REGISTRY
+
+current_stream = ContextVar("summary_stream", default=None)
+
+
+def stream_key(kind, target_id):
+    return f"stream:{kind}:{target_id}"
+
+
+class SummaryStream:
+    """
+    Args:
+        r: Redis クライアント
+        key: ストリームのキー
+        flush_interval_sec: delta をまとめて書き出す間隔
+        ttl_sec: 終了後にストリームを残す秒数
+    """
+
+    def __init__(self, r, key, flush_interval_sec=0.1, ttl_sec=3600, clock=time.monotonic):
+        self.r = r
+        self.key = key
+        self.flush_interval_sec = flush_interval_sec
+        self.ttl_sec = ttl_sec
+        self._clock = clock
+        self._buffer = []
+        self._last_flush = clock()
+        self.chars = 0
+        self.closed = False
+
+    def _add(self, fields):
+        # 書き出しの失敗は要約の生成を止めない（最終結果は DB に保存される）
+        try:
+            self.r.xadd(self.key, fields)
+        except Exception as e:
+            print(f"[STREAM] Failed to write {self.key}: {e}")
+
+    def start(self):
+        try:
+            self.r.delete(self.key)
+        except Exception as e:
+            print(f"[STREAM] Failed to reset {self.key}: {e}")
+        self._add({"type": "start"})
+
+    def append(self, delta):
+        self._buffer.append(delta)
+        self.chars += len(delta)
+        if self._clock() - self._last_flush >= self.flush_interval_sec:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = self._clock()
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._add({"type": "delta", "text": text})
+
+    def _close(self, fields):
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self._add(fields)
+        try:
+            self.r.expire(self.key, self.ttl_sec)
+        except Exception as e:
+            print(f"[STREAM] Failed to expire {self.key}: {e}")
+
+    def finish(self):
+        self._close({"type": "done"})
+
+    def fail(self, reason):
+        self._close({"type": "error", "reason": reason})
+
+
+@contextmanager
+def summary_stream(r, key):
+    """
+    範囲内の chat_completion の出力を Redis Stream に書き出す
+
+    無効・Redis なしの場合は何もせず None を渡す
+    """
+    from app.config import get_streaming_settings
+
+    settings = get_streaming_settings()
+    if r is None or not settings.pop("enabled"):
+        yield None
+        return
+
+    stream = SummaryStream(r, key, **settings)
+    stream.start()
+    emit("summary.streaming", stream=key)
+    REGISTRY.inc("worker_summary_streams_total", help_text="Summaries streamed to Redis")
+    token = current_stream.set(stream)
+    try:
+        yield stream
+    except BaseException as e:
+        stream.fail(type(e).__name__)
+        raise
+    else:
+        stream.finish()
+    finally:
+        current_stream.reset(token)
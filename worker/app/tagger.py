@@ -2,11 +2,13 @@
 タグ抽出モジュール（Phase2-2）
 
 resources/tag_rules.txt に基づいてテキストからタグを抽出
+キーワードは共有トークナイザのトークン単位で照合する（トークンをまたぐ誤一致を防ぐ）
 """
 
-import re
 from pathlib import Path
 
+from app.tokenizer import tokenize
+
 
 class Tagger:
     def __init__(self, rules_path='resources/tag_rules.txt'):
@@ -18,6 +20,7 @@ class Tagger:
         """
         self.rules = []
         self._load_rules(rules_path)
+        self._build_index()
     
     def _load_rules(self, rules_path):
         """
@@ -54,12 +57,34 @@ class Tagger:
         
         print(f"[Tagger] Loaded {len(self.rules)} rules from {rules_path}")
     
-    def extract_tags(self, text):
+    def _build_index(self):
+        """
+        キーワード索引を構築
+        
+        1トークンのキーワード: トークン（複合語）内の部分文字列として照合
+        複数トークンのキーワード（例: いい天気）: 連続するトークン列として照合
+        """
+        self._word_index = {}
+        self._phrase_index = {}
+        for rule in self.rules:
+            for keyword in rule['keywords']:
+                kw_tokens = tokenize(keyword)
+                if not kw_tokens:
+                    continue
+                if len(kw_tokens) == 1:
+                    self._word_index.setdefault(kw_tokens[0], set()).add(rule['tag'])
+                else:
+                    self._phrase_index.setdefault(kw_tokens, set()).add(rule['tag'])
+        self._max_word_len = max((len(w) for w in self._word_index), default=0)
+        self._phrase_lengths = sorted({len(p) for p in self._phrase_index})
+    
+    def extract_tags(self, text, tokens=None):
         """
         テキストからタグを抽出
         
         Args:
             text: 解析対象のテキスト
+            tokens: トークン化済みの場合はそのトークン列（省略時は tokenize(text)）
         
         Returns:
             list: 抽出されたタグのリスト（重複なし）
@@ -67,14 +92,26 @@ class Tagger:
         if not text:
             return []
         
+        if tokens is None:
+            tokens = tokenize(text)
+        
         tags = set()
         
-        for rule in self.rules:
-            for keyword in rule['keywords']:
-                # 大文字小文字を区別せずに検索
-                if re.search(re.escape(keyword), text, re.IGNORECASE):
-                    tags.add(rule['tag'])
-                    break  # 1つマッチしたらこのルールは完了
+        # トークン内の部分文字列（キーワード長まで）を索引と照合
+        max_len = self._max_word_len
+        for token in set(tokens):
+            n = len(token)
+            for i in range(n):
+                for j in range(i + 1, min(n, i + max_len) + 1):
+                    found = self._word_index.get(token[i:j])
+                    if found:
+                        tags.update(found)
+        
+        for length in self._phrase_lengths:
+            for i in range(len(tokens) - length + 1):
+                found = self._phrase_index.get(tuple(tokens[i:i + length]))
+                if found:
+                    tags.update(found)
         
         return sorted(list(tags))
 
@@ -1,5 +1,9 @@
 import os, re, glob
 from dataclasses import dataclass
+from functools import lru_cache
+
+# リソースを渡されなかったときに読むディレクトリ（worker/resources、入力フィンガープリントと同じ）
+DEFAULT_RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
 
 def _read_lines(path: str) -> list[str]:
     out = []
@@ -54,3 +58,8 @@ def load_resources(resources_dir: str) -> TextResources:
         entry_summary_user_tpl=entry_user,
         range_summary_user_templates=templates,
     )
+
+
+@lru_cache(maxsize=1)
+def default_resources() -> TextResources:
+    return load_resources(DEFAULT_RESOURCES_DIR)
@@ -0,0 +1,181 @@
+"""
+日本語対応トークナイザ
+話し方分析・タグ抽出・キーワード抽出で共有する軽量な分かち書き
+
+- 文字種（漢字・ひらがな・カタカナ・英数字）の切れ目で分割
+- ひらがな部分は助詞・助動詞などの辞書で最長一致分割し、漢字直後の送り仮名は前の語に付ける
+- 結果は lru_cache でメモ化し、同じ文字起こしを各モジュールで再分割しない
+- TOKENIZER_MODE=ngram で文字バイグラムにフォールバック
+"""
+
+import os
+import unicodedata
+from functools import lru_cache
+
+# 助詞・助動詞・よく使うひらがな語（最長一致で使う）
+FUNCTION_WORDS = frozenset([
+    # 助詞
+    'は', 'が', 'を', 'に', 'で', 'と', 'も', 'の', 'へ', 'や', 'か', 'な', 'ね', 'よ', 'わ',
+    'から', 'まで', 'より', 'けど', 'けれど', 'けれども', 'ので', 'のに', 'って', 'とか',
+    'など', 'だけ', 'しか', 'ばかり', 'ほど', 'くらい', 'ぐらい', 'について', 'として', 'ながら',
+    # 助動詞・補助動詞
+    'だ', 'です', 'ます', 'でした', 'ました', 'ません', 'ませんでした', 'だった', 'たい', 'ない',
+    'なかった', 'た', 'て', 'ている', 'ていた', 'ています', 'ていました', 'てる', 'てた',
+    'いる', 'いた', 'ある', 'あった', 'する', 'した', 'して', 'します', 'しました',
+    'される', 'られる', 'れる', 'せる', 'なる', 'なった', 'でしょう', 'だろう',
+    # 形式名詞・指示語・副詞・接続詞
+    'こと', 'もの', 'よう', 'そう', 'この', 'その', 'あの', 'これ', 'それ', 'あれ', 'どう',
+    'とても', 'ちょっと', 'やっぱり', 'なんか', 'まあ', 'もう', 'まだ', 'すごく', 'たくさん',
+    'いつも', 'また', 'でも', 'だから', 'そして', 'しかし', 'けっこう', 'よく', 'いい',
+    'なり', 'なります', 'なりました', 'ください',
+    # フィラー
+    'あー', 'えー', 'うー', 'んー', 'えっと', 'えーっと', 'うーん',
+])
+
+_MAX_WORD_LEN = max(len(w) for w in FUNCTION_WORDS)
+
+_HIRAGANA, _KATAKANA, _KANJI, _ALNUM, _OTHER = 'H', 'K', 'C', 'A', 'O'
+
+_CACHE_SIZE = 4096
+
+
+def _char_type(ch):
+    o = ord(ch)
+    if 0x3041 <= o <= 0x309F:
+        return _HIRAGANA
+    if 0x30A0 <= o <= 0x30FF or 0x31F0 <= o <= 0x31FF:
+        return _KATAKANA
+    if 0x4E00 <= o <= 0x9FFF or 0x3400 <= o <= 0x4DBF or ch in '々〆':
+        return _KANJI
+    if ch.isalnum():
+        return _ALNUM
+    return _OTHER
+
+
+def _script_runs(text):
+    """同じ文字種の連続（区切り文字は除外）に分割。長音「ー」は直前の文字種に続ける"""
+    runs = []
+    cur_type = None
+    start = 0
+    for i, ch in enumerate(text):
+        t = _char_type(ch)
+        if ch == 'ー' and cur_type in (_HIRAGANA, _KATAKANA):
+            t = cur_type
+        if t != cur_type:
+            if cur_type is not None and cur_type != _OTHER:
+                runs.append((cur_type, text[start:i]))
+            cur_type = t
+            start = i
+    if cur_type is not None and cur_type != _OTHER:
+        runs.append((cur_type, text[start:]))
+    return runs
+
+
+def _split_hiragana(run):
+    """
+    ひらがな列を辞書の最長一致で分割
+
+    Returns:
+        (先頭の未知部分, 残りのトークン列)  先頭の未知部分は送り仮名候補
+    """
+    head = None
+    tokens = []
+    buf = ''
+    i = 0
+    n = len(run)
+    while i < n:
+        match = None
+        for length in range(min(_MAX_WORD_LEN, n - i), 0, -1):
+            if run[i:i + length] in FUNCTION_WORDS:
+                match = run[i:i + length]
+                break
+        if match is None:
+            buf += run[i]
+            i += 1
+            continue
+        if buf:
+            if head is None and not tokens:
+                head = buf
+            else:
+                tokens.append(buf)
+            buf = ''
+        tokens.append(match)
+        i += len(match)
+    if buf:
+        if head is None and not tokens:
+            head = buf
+        else:
+            tokens.append(buf)
+    return head, tokens
+
+
+def _segment(text):
+    tokens = []
+    prev_type = None
+    for run_type, run in _script_runs(text):
+        if run_type == _HIRAGANA:
+            head, rest = _split_hiragana(run)
+            if head:
+                if prev_type == _KANJI and tokens:
+                    # 送り仮名は直前の漢字語に付ける（例: 話 + し → 話し）
+                    tokens[-1] += head
+                else:
+                    tokens.append(head)
+            tokens.extend(rest)
+        elif run_type == _ALNUM:
+            tokens.append(run.lower())
+        else:
+            tokens.append(run)
+        prev_type = run_type
+    return tokens
+
+
+def _char_ngrams(text, n=2):
+    tokens = []
+    for _, run in _script_runs(text):
+        run = run.lower()
+        if len(run) <= n:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return tokens
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _tokenize_cached(text, mode):
+    normalized = unicodedata.normalize('NFKC', text)
+    if mode == 'ngram':
+        return tuple(_char_ngrams(normalized))
+    return tuple(_segment(normalized))
+
+
+def tokenize(text, mode=None):
+    """
+    テキストをトークン列に分割（メモ化済み）
+
+    Args:
+        text: 対象テキスト
+        mode: "dict"（辞書ベース分割、デフォルト）または "ngram"（文字バイグラム）
+              省略時は環境変数 TOKENIZER_MODE
+
+    Returns:
+        トークンのタプル（句読点・空白は含まない、英数字は小文字化）
+    """
+    if not text:
+        return ()
+    return _tokenize_cached(text, mode or os.getenv('TOKENIZER_MODE', 'dict'))
+
+
+def is_hiragana(token):
+    """ひらがなのみのトークンか"""
+    return bool(token) and all(_char_type(ch) == _HIRAGANA or ch == 'ー' for ch in token)
+
+
+def is_function_word(token):
+    """助詞・助動詞などの機能語か"""
+    return token in FUNCTION_WORDS
+
+
+def clear_cache():
+    """トークン化キャッシュをクリア"""
+    _tokenize_cached.cache_clear()
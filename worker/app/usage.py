@@ -0,0 +1,205 @@
+"""
+OpenAI の使用量アカウンティング
+プロバイダ呼び出しごとのトークン数・所要時間・推定コストを、
+ジョブ種別・ジョブID・ユーザー・ステージ別に記録する
+
+- ジョブ種別とステージは app.metrics のコンテキスト変数から取る
+- ジョブIDとユーザーは usage_context / bind_user で設定する
+- 記録はメモリ上のバッファに溜め、メインループから executemany でまとめて保存する
+  （DB接続をスレッド間で共有しないため、保存は呼び出し元スレッドで行う）
+- 保存の失敗が続いてもバッファは max_buffer 行までに抑え、超えた分は古い行から捨てる
+- 使用量を返さない呼び出し（ストリーミング）はトークン数を推定し、tokens_estimated を立てて記録する
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.metrics import REGISTRY, current_job, current_stage
+
+# 推定コスト用の単価（USD）: chat は 100万トークンあたり (入力, 出力)、stt は1分あたり
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+STT_PRICE_PER_MINUTE = {
+    "whisper-1": 0.006,
+}
+
+FLUSH_MAX_ROWS = 100
+FLUSH_MAX_AGE_SEC = 10.0
+# 保存に失敗し続けたときに保持する上限
+MAX_BUFFER_ROWS = 10000
+
+# ジョブID・ユーザー（ジョブ内で bind_user により後から設定できるよう dict で持つ）
+_usage_scope = ContextVar("usage_scope", default=None)
+
+
+@contextmanager
+def usage_context(job_id=None, user_id=None):
+    """ジョブの実行範囲でジョブID・ユーザーを設定"""
+    token = _usage_scope.set({"job_id": job_id, "user_id": user_id})
+    try:
+        yield
+    finally:
+        _usage_scope.reset(token)
+
+
+def bind_user(user_id):
+    """実行中のジョブにユーザーを設定（エントリ取得後に呼ぶ）"""
+    scope = _usage_scope.get()
+    if scope is not None:
+        scope["user_id"] = user_id
+
+
+def extract_usage(response):
+    """レスポンスから (prompt_tokens, completion_tokens) を取り出す（旧SDKの dict 形式にも対応）"""
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0)
+    return int(getattr(usage, "prompt_tokens", 0) or 0), int(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def estimate_cost(operation, model, prompt_tokens=0, completion_tokens=0, audio_seconds=None):
+    """推定コスト（USD）。単価が不明なモデルは None"""
+    if operation == "stt":
+        price = STT_PRICE_PER_MINUTE.get(model)
+        if price is None or audio_seconds is None:
+            return None
+        return price * audio_seconds / 60.0
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class UsageRecorder:
+    """使用量のバッファ（スレッドセーフ）"""
+
+    def __init__(self, max_rows=FLUSH_MAX_ROWS, max_age_sec=FLUSH_MAX_AGE_SEC, max_buffer=MAX_BUFFER_ROWS,
+                 clock=time.monotonic):
+        self.max_rows = max_rows
+        self.max_age_sec = max_age_sec
+        self.max_buffer = max_buffer
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows = []
+        self._last_flush = clock()
+
+    def record(self, operation, model, prompt_tokens=0, completion_tokens=0, duration_sec=0.0,
+               request_bytes=None, audio_seconds=None, estimated=False):
+        """
+        プロバイダ呼び出し1回分を記録
+
+        Args:
+            operation: "chat" または "stt"
+            duration_sec: 呼び出しの所要時間
+            request_bytes: 送信したデータ量（STT の音声など）
+            audio_seconds: 音声の長さ（STT のコスト見積もり用）
+            estimated: トークン数が推定値か
+        """
+        scope = _usage_scope.get() or {}
+        job_type = current_job.get()
+        stage = current_stage.get() or operation
+        cost = estimate_cost(operation, model, prompt_tokens, completion_tokens, audio_seconds)
+        row = (
+            job_type, scope.get("job_id"), scope.get("user_id"), stage, operation, model,
+            prompt_tokens, completion_tokens, request_bytes, int(duration_sec * 1000), cost, int(estimated),
+        )
+        with self._lock:
+            self._rows.append(row)
+            self._trim()
+
+        labels = {"job": job_type, "stage": stage, "model": model}
+        REGISTRY.observe("worker_provider_seconds", duration_sec,
+                         help_text="Provider call latency in seconds", operation=operation, **labels)
+        if prompt_tokens:
+            REGISTRY.inc("worker_llm_tokens_total", prompt_tokens,
+                         help_text="LLM tokens by job, stage and model", kind="prompt", **labels)
+        if completion_tokens:
+            REGISTRY.inc("worker_llm_tokens_total", completion_tokens,
+                         help_text="LLM tokens by job, stage and model", kind="completion", **labels)
+        if cost:
+            REGISTRY.inc("worker_llm_cost_usd_total", cost,
+                         help_text="Estimated provider cost in USD", **labels)
+
+    def _trim(self):
+        """バッファが上限を超えたら古い行から捨てる（ロック内で呼ぶ）"""
+        dropped = len(self._rows) - self.max_buffer
+        if dropped > 0:
+            del self._rows[:dropped]
+            REGISTRY.inc("worker_usage_rows_dropped_total", dropped,
+                         help_text="Usage rows dropped because the buffer was full")
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def due(self):
+        """件数または経過時間がしきい値を超えたか"""
+        with self._lock:
+            if not self._rows:
+                return False
+            return len(self._rows) >= self.max_rows or self._clock() - self._last_flush >= self.max_age_sec
+
+    def flush(self, db):
+        """バッファを1回の executemany で保存。失敗したら次回に持ち越す"""
+        from app.db import save_openai_usage_bulk
+
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._last_flush = self._clock()
+        if not rows:
+            return 0
+        try:
+            save_openai_usage_bulk(db, rows)
+        except Exception as e:
+            print(f"[USAGE] Flush failed, keeping {len(rows)} rows: {e}")
+            with self._lock:
+                self._rows = rows + self._rows
+                self._trim()
+            return 0
+        return len(rows)
+
+    def maybe_flush(self, db):
+        return self.flush(db) if self.due() else 0
+
+
+RECORDER = UsageRecorder()
+
+
+@contextmanager
+def track_call(operation, model, request_bytes=None, audio_seconds=None, recorder=None):
+    """
+    プロバイダ呼び出しを計測して記録
+
+    with track_call("chat", model) as call:
+        response = client.chat.completions.create(...)
+        call.response = response
+
+    トークン数を手元で数えた場合は call.estimated = True にする
+    音声の長さが呼び出し後にわかる場合は call.audio_seconds に設定する
+    """
+    call = _Call()
+    call.audio_seconds = audio_seconds
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        prompt_tokens, completion_tokens = extract_usage(call.response) if call.response is not None else (0, 0)
+        (recorder or RECORDER).record(
+            operation, model, prompt_tokens, completion_tokens,
+            time.perf_counter() - start, request_bytes, call.audio_seconds, call.estimated,
+        )
+
+
+class _Call:
+    response = None
+    estimated = False
+    audio_seconds = None
@@ -0,0 +1,57 @@
+"""
+DSPバックエンドのベンチマーク（pydub.effects vs app.dsp）
+
+合成した音声（正弦波 + ノイズ）に各エンハンスチェーンを適用して処理時間を比較する。
+エンコードは含まない。
+
+    cd worker && python -m benchmarks.bench_dsp --seconds 600
+"""
+
+import argparse
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from app.audio_processor import apply_enhancements
+
+
+def synth_recording(seconds, rate=44100):
+    """話し声に近い帯域の合成音声（16bit モノラル）"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * rate)) / rate
+    voice = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 0.5 * t))
+    noise = 0.05 * rng.standard_normal(len(t))
+    hum = 0.1 * np.sin(2 * np.pi * 50 * t)
+    pcm = np.clip(voice + noise + hum, -1, 1 - 1 / 32768)
+    return AudioSegment((pcm * 32768).astype(np.int16).tobytes(),
+                        frame_rate=rate, sample_width=2, channels=1)
+
+
+def bench(audio, enhancement_types, backend):
+    start = time.perf_counter()
+    apply_enhancements(audio, enhancement_types, backend=backend)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=600)
+    parser.add_argument('--types', default='denoise,enhance')
+    parser.add_argument('--backends', default='numpy,pydub')
+    args = parser.parse_args()
+
+    audio = synth_recording(args.seconds)
+    enhancement_types = args.types.split(',')
+    print(f"{args.seconds:.0f}s / {audio.frame_rate}Hz / types={enhancement_types}")
+
+    timings = {}
+    for backend in args.backends.split(','):
+        timings[backend] = bench(audio, enhancement_types, backend)
+        print(f"  {backend:6s} {timings[backend]:8.2f}s")
+    if 'numpy' in timings and 'pydub' in timings:
+        print(f"  speedup x{timings['pydub'] / timings['numpy']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
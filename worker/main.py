@@ -3,10 +3,10 @@ Worker Main (Refactored)
 Workerメインプロセスのリファクタリング版
 """
 
-import json
 import time
 import signal
 import sys
+from concurrent.futures import Future
 from app.settings import load_settings
 from app.text_resources import load_resources
 from app.storage import make_minio
@@ -16,6 +16,20 @@ import openai
 
 from app.entry_processor import EntryProcessor
 from app.jobs import process_range_summary, process_custom_summary, process_audio_enhancement
+from app.backfill import process_backfill, process_backfill_batch
+from app.dispatch import enqueue_job, idempotency_key, pop_job
+from app.retry import defer_job, poll_timeout, promote_due, schedule_retry
+from app.cancellation import JobCancelled, check_cancelled, job_deadline, job_scope
+from app.circuit import CircuitOpenError, JOB_DEPENDENCIES, blocked_dependency, get_breaker, is_mysql_error
+from app.audio_pool import AudioPool
+from app.config import get_autoscale_settings, get_metrics_port, get_redis_url, get_worker_mode
+from app.autoscale import BusyTracker, Exporter, WorkerReporter
+from app.profiler import Profiler
+from app.metrics import start_metrics_server
+from app.usage import RECORDER as usage_recorder, usage_context
+
+# 依存先が half_open で試行枠が埋まっているときの退避時間（秒）
+MIN_DEFER_SEC = 5
 
 class Worker:
     """メインWorkerクラス"""
@@ -29,6 +43,10 @@ class Worker:
         self.minio = None
         self.openai_client = None
         self.entry_processor = None
+        self.audio_pool = None
+        self.busy = BusyTracker()
+        self.reporter = None
+        self.profiler = None
     
     def initialize(self):
         """初期化処理"""
@@ -44,6 +62,10 @@ class Worker:
             decode_responses=True
         )
         
+        # 稼働率の報告（オートスケール用エクスポーターが集計する、長いジョブの実行中も報告する）
+        self.reporter = WorkerReporter(self.redis_client, self.busy)
+        self.reporter.start()
+        
         # MySQL
         self.db = connect_mysql(
             self.settings["mysql_host"],
@@ -71,10 +93,22 @@ class Worker:
             self.minio,
             self.settings["s3_bucket"],
             self.resources,
-            self.resources.get("ng_patterns", []),
-            self.resources.get("non_save_word", [])
+            self.resources.ng_topic_patterns,
+            self.resources.non_save_patterns
         )
         
+        # オンデマンドプロファイラ（worker:profile キー / SIGUSR1 で開始）
+        self.profiler = Profiler.from_env(self.minio)
+        self.profiler.install_signal()
+        
+        # メトリクス（METRICS_PORT 設定時のみ /metrics を公開）
+        metrics_port = get_metrics_port()
+        if metrics_port:
+            start_metrics_server(metrics_port)
+        
+        # 音声エンハンス用プロセスプール（AUDIO_POOL_WORKERS=0 ならインライン実行、実行時間は稼働率に含める）
+        self.audio_pool = AudioPool.from_env(tracker=self.busy)
+        
         print("[WORKER] Initialization complete")
     
     def handle_job(self, job):
@@ -82,6 +116,9 @@ class Worker:
         job_type = job.get("type")
         
         try:
+            # 期限切れ・キャンセル済みのジョブは実行しない
+            check_cancelled()
+            
             if job_type == "PROCESS_ENTRY":
                 entry_id = job["entryId"]
                 print(f"[WORKER] Processing entry {entry_id}")
@@ -90,28 +127,79 @@ class Worker:
             elif job_type == "PROCESS_RANGE_SUMMARY":
                 summary_id = job["summaryId"]
                 print(f"[WORKER] Processing range summary {summary_id}")
-                process_range_summary(summary_id, self.db, None)
+                process_range_summary(summary_id, self.db, None, self.redis_client, self.resources)
             
             elif job_type == "CUSTOM_SUMMARY":
                 entry_id = job["entryId"]
                 options = job.get("options", {})
                 print(f"[WORKER] Processing custom summary {entry_id}")
-                process_custom_summary(entry_id, options, self.db, None)
+                process_custom_summary(entry_id, options, self.db, None, self.redis_client)
             
             elif job_type == "AUDIO_ENHANCEMENT":
                 entry_id = job["entryId"]
-                enhancement_type = job.get("enhancementType", "denoise")
+                enhancement_types = job.get("enhancementTypes") or [job.get("enhancementType", "denoise")]
                 print(f"[WORKER] Processing audio enhancement {entry_id}")
-                process_audio_enhancement(
-                    entry_id, enhancement_type, self.db,
-                    self.minio, self.settings["s3_bucket"]
+                accepted = process_audio_enhancement(
+                    entry_id, enhancement_types, self.db,
+                    self.minio, self.settings["s3_bucket"], self.audio_pool
                 )
+                if not accepted:
+                    # プールのキューが満杯: 末尾に戻して他のジョブを先に処理する
+                    print(f"[WORKER] Audio pool full, requeueing entry {entry_id}")
+                    enqueue_job(self.redis_client, job)
+                elif isinstance(accepted, Future):
+                    # プールで実行した分の失敗もインライン実行と同じくリトライ・退避する
+                    accepted.add_done_callback(lambda future: self.finish_pooled(job, future))
+            
+            elif job_type == "BACKFILL":
+                print(f"[WORKER] Processing backfill {job['backfillId']}")
+                process_backfill(job, self.redis_client, self.db, None, self.resources)
+            
+            elif job_type == "BACKFILL_BATCH":
+                process_backfill_batch(job, self.db, None, self.resources)
             
             else:
                 print(f"[WORKER] Unknown job type: {job_type}")
         
         except Exception as e:
-            print(f"[WORKER] Job failed: {e}")
+            self.handle_failure(job, e)
+        
+        else:
+            if "mysql" in JOB_DEPENDENCIES.get(job_type, ()):
+                get_breaker("mysql").record_success()
+    
+    def handle_failure(self, job, e):
+        """失敗したジョブをキャンセル扱い・退避・リトライに振り分ける"""
+        job_type = job.get("type")
+        
+        if isinstance(e, JobCancelled):
+            # キャンセル・期限切れはリトライしない
+            print(f"[WORKER] {job_type} stopped: {e}")
+        
+        elif isinstance(e, CircuitOpenError):
+            # 実行中に依存先のブレーカーが open になった: 回数を数えずに退避
+            defer_job(self.redis_client, job, max(e.retry_after, MIN_DEFER_SEC))
+            print(f"[WORKER] {e.dependency} unavailable, deferring {job_type} for {e.retry_after:.0f}s")
+        
+        else:
+            if is_mysql_error(e):
+                get_breaker("mysql").record_failure()
+            # 待機せずに遅延キューへ（分類ごとのバックオフ後に再実行、リトライ不可ならデッドレター）
+            error_class, delay = schedule_retry(self.redis_client, job, e)
+            if delay is None:
+                print(f"[WORKER] Job failed ({error_class}), moved to dead-letter: {e}")
+            else:
+                print(f"[WORKER] Job failed ({error_class}), retrying in {delay:.0f}s: {e}")
+    
+    def finish_pooled(self, job, future):
+        """プールで実行したジョブの完了（ディスパッチャスレッドから呼ばれる）"""
+        error = future.exception()
+        if error is None:
+            return
+        try:
+            self.handle_failure(job, error)
+        except Exception as e:
+            print(f"[WORKER] Failed to reschedule {job.get('type')}: {e}")
     
     def run(self):
         """メインループ"""
@@ -119,16 +207,30 @@ class Worker:
         
         while self.running:
             try:
-                # ジョブ取得 (30秒タイムアウト)
-                result = self.redis_client.brpop("jobs:default", timeout=30)
+                # 期限の来たリトライを実行キューへ戻す
+                promote_due(self.redis_client)
+                self.profiler.poll(self.redis_client)
+                # OpenAI 使用量をまとめて保存（件数・経過時間のしきい値を超えたときのみ、待機中も行う）
+                usage_recorder.maybe_flush(self.db)
                 
-                if not result:
+                # ジョブ取得 (次のリトライ期限まで、最大30秒でタイムアウト)
+                # 集約されたジョブは最新のペイロードを取得（取得済みなら None）
+                job = pop_job(self.redis_client, poll_timeout(self.redis_client))
+                if job is None:
                     continue
                 
-                _, payload_str = result
-                job = json.loads(payload_str)
+                # 依存先のブレーカーが open のジョブ種別だけ退避し、他のジョブは処理を続ける
+                blocked = blocked_dependency(job.get("type"))
+                if blocked:
+                    dependency, retry_after = blocked
+                    defer_job(self.redis_client, job, max(retry_after, MIN_DEFER_SEC))
+                    print(f"[WORKER] {dependency} unavailable, deferring {job.get('type')}")
+                    continue
                 
-                self.handle_job(job)
+                job_id = job.get("entryId") or job.get("summaryId") or job.get("backfillId")
+                with self.busy.busy(), self.profiler.scope(), usage_context(job_id=job_id), \
+                        job_scope(self.redis_client, idempotency_key(job), job_deadline(job)):
+                    self.handle_job(job)
             
             except KeyboardInterrupt:
                 print("[WORKER] Keyboard interrupt received")
@@ -143,9 +245,20 @@ class Worker:
         print("[WORKER] Shutting down...")
         self.running = False
         
+        if self.audio_pool:
+            self.audio_pool.shutdown()
+        
         if self.db:
+            usage_recorder.flush(self.db)
             self.db.close()
         
+        if self.profiler:
+            self.profiler.stop()
+        
+        if self.reporter:
+            self.reporter.stop()
+            self.reporter.remove()
+        
         if self.redis_client:
             self.redis_client.close()
         
@@ -156,12 +269,23 @@ def signal_handler(signum, frame):
     print(f"\n[WORKER] Received signal {signum}")
     sys.exit(0)
 
+def run_exporter():
+    """エクスポーターモード: キュー遅延・ワーカー稼働率を /metrics で公開（ジョブは処理しない）"""
+    redis_client = redis.from_url(get_redis_url(), decode_responses=True)
+    start_metrics_server(get_metrics_port() or 9100)
+    print("[EXPORTER] Collecting queue metrics")
+    Exporter(redis_client, **get_autoscale_settings()).run()
+
 def main():
     """メイン関数"""
     # シグナルハンドラ設定
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    if get_worker_mode() == "exporter":
+        run_exporter()
+        return
+    
     worker = Worker()
     
     try:
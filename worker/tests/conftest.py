@@ -54,6 +54,17 @@ def mock_redis():
     return redis
 
 
+@pytest.fixture
+def fake_redis():
+    """インメモリRedis（fakeredis）、テストごとに空、Lua スクリプト（EVAL）も実際に実行する
+    
+    キュー・ロック・遅延リトライなど、Redis のデータ構造やスクリプトの結果を検証するテストで使う
+    """
+    import fakeredis
+    
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
 @pytest.fixture(scope='session')
 def mock_logger():
     """モックロガー、テスト中のログ出力を抑制、、ログ出力が正しく呼ばれるかを検証可能、、"""
@@ -0,0 +1,215 @@
+"""
+AsyncPipeline Tests
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.pipelines.async_pipeline import AsyncPipeline, AsyncPipelineStep, build_graph
+from app.pipelines.base import DictStepCache, ParallelSteps, Pipeline, PipelineStep
+
+
+class KeyStep(PipelineStep):
+    """inputs の値を連結して outputs[0] に書き込むステップ"""
+
+    def __init__(self, name, inputs, output, delay=0, locks=(), run_if=None, cached=False, log=None):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.outputs = (output,) if output else ()
+        self.delay = delay
+        self.locks = tuple(locks)
+        self.run_if = run_if
+        self.cached = cached
+        self.log = log if log is not None else []
+
+    def should_run(self, context):
+        return self.run_if is None or self.run_if(context)
+
+    def cache_key(self, context):
+        return self.name if self.cached else None
+
+    def execute(self, context):
+        self.log.append(("start", self.name, time.perf_counter()))
+        time.sleep(self.delay)
+        if self.outputs:
+            context[self.outputs[0]] = "+".join([self.name] + [str(context[k]) for k in self.inputs])
+        context["scratch"] = self.name
+        self.log.append(("end", self.name, time.perf_counter()))
+        return context
+
+
+class SleepAsyncStep(AsyncPipelineStep):
+    def __init__(self, name, output, delay):
+        self.name = name
+        self.outputs = (output,)
+        self.delay = delay
+
+    async def execute_async(self, context):
+        await asyncio.sleep(self.delay)
+        context[self.outputs[0]] = self.name
+        return context
+
+
+class FailStep(PipelineStep):
+    name = "fail"
+
+    def __init__(self, inputs=(), delay=0):
+        self.inputs = tuple(inputs)
+        self.delay = delay
+
+    def execute(self, context):
+        time.sleep(self.delay)
+        raise ValueError("boom")
+
+
+class HaltStep(PipelineStep):
+    name = "halt"
+    outputs = ("loaded",)
+
+    def execute(self, context):
+        context["halt"] = "not_found"
+        return context
+
+
+class TestBuildGraph:
+    def test_dependencies_from_keys(self):
+        steps = [KeyStep("a", ["x"], "a"), KeyStep("b", ["a"], "b"), KeyStep("c", ["a", "b"], "c")]
+        assert build_graph(steps, {"x"}) == {0: set(), 1: {0}, 2: {0, 1}}
+
+    def test_duplicate_output_rejected(self):
+        with pytest.raises(ValueError):
+            build_graph([KeyStep("a", [], "k"), KeyStep("b", [], "k")], set())
+
+    def test_missing_input_rejected(self):
+        with pytest.raises(ValueError):
+            build_graph([KeyStep("a", ["nope"], "a")], set())
+
+    def test_cycle_rejected(self):
+        with pytest.raises(ValueError):
+            build_graph([KeyStep("a", ["b"], "a"), KeyStep("b", ["a"], "b")], set())
+
+
+class TestAsyncPipeline:
+    def test_runs_in_dependency_order(self):
+        steps = [KeyStep("c", ["a", "b"], "c"), KeyStep("b", ["a"], "b"), KeyStep("a", ["x"], "a")]
+        context = AsyncPipeline(steps).run({"x": 1})
+        assert context["c"] == "c+a+1+b+a+1"
+        # 宣言していないキーはコンテキストに統合されない
+        assert "scratch" not in context
+        assert set(context["step_timings"]) == {"a", "b", "c"}
+
+    def test_independent_steps_run_concurrently(self):
+        steps = [KeyStep(n, ["x"], n, delay=0.2) for n in ("a", "b", "c")]
+        start = time.perf_counter()
+        AsyncPipeline(steps).run({"x": 1})
+        assert time.perf_counter() - start < 0.5
+
+    def test_semaphore_bounds_concurrency(self):
+        log = []
+        steps = [KeyStep(n, [], n, delay=0.05, log=log) for n in ("a", "b", "c", "d")]
+        AsyncPipeline(steps, max_concurrency=2).run({})
+        active = peak = 0
+        for event, _, _ in sorted(log, key=lambda e: (e[2], e[0] == "start")):
+            active += 1 if event == "start" else -1
+            peak = max(peak, active)
+        assert peak == 2
+
+    def test_locked_steps_do_not_overlap(self):
+        log = []
+        steps = [KeyStep(n, [], n, delay=0.05, locks=("db",), log=log) for n in ("a", "b", "c")]
+        AsyncPipeline(steps).run({})
+        intervals = sorted((s[2], e[2]) for s in log if s[0] == "start"
+                           for e in log if e[0] == "end" and e[1] == s[1])
+        for (_, end), (start, _) in zip(intervals, intervals[1:]):
+            assert start >= end
+
+    def test_async_steps_are_awaited(self):
+        steps = [SleepAsyncStep(n, n, 0.2) for n in ("a", "b", "c")]
+        start = time.perf_counter()
+        context = AsyncPipeline(steps).run({})
+        assert time.perf_counter() - start < 0.5
+        assert context["a"] == "a"
+
+    def test_sync_steps_run_off_the_event_loop(self):
+        seen = []
+
+        class ThreadStep(PipelineStep):
+            outputs = ("t",)
+
+            def execute(self, context):
+                seen.append(threading.current_thread() is threading.main_thread())
+                context["t"] = 1
+                return context
+
+        AsyncPipeline([ThreadStep()]).run({})
+        assert seen == [False]
+
+    def test_error_short_circuits(self):
+        log = []
+        steps = [FailStep(), KeyStep("after", ["a"], "b", log=log), KeyStep("a", [], "a", delay=0.3)]
+        context = AsyncPipeline(steps).run({})
+        assert context["error"]["type"] == "ValueError"
+        assert context["error"]["message"] == "boom"
+        assert log == []
+        statuses = {t["step"]: t["status"] for t in context["trace"]}
+        assert statuses == {"fail": "error", "a": "cancelled", "after": "not_run"}
+
+    def test_halt_stops_dependents(self):
+        log = []
+        steps = [HaltStep(), KeyStep("next", ["loaded"], "n", log=log)]
+        context = AsyncPipeline(steps).run({})
+        assert context["halt"] == "not_found"
+        assert "error" not in context
+        assert log == []
+
+    def test_skip_and_cache(self):
+        cache = DictStepCache()
+        log = []
+        steps = [
+            KeyStep("a", [], "a", cached=True, log=log),
+            KeyStep("skipped", [], "s", run_if=lambda c: False),
+        ]
+        AsyncPipeline(steps, cache=cache).run({})
+        context = AsyncPipeline(steps, cache=cache).run({})
+        assert context["a"] == "a"
+        assert len([e for e in log if e[0] == "start"]) == 1
+        assert context["step_timings"]["skipped"] is None
+        statuses = {t["step"]: t["status"] for t in context["trace"]}
+        assert statuses == {"a": "cached", "skipped": "skipped"}
+
+    def test_trace_records_timing(self):
+        context = AsyncPipeline([KeyStep("a", [], "a", delay=0.05)]).run({})
+        trace, = context["trace"]
+        assert trace["status"] == "ok"
+        assert trace["end"] - trace["start"] >= 0.05
+
+    def test_from_pipeline_flattens_parallel_steps(self):
+        pipeline = Pipeline([
+            KeyStep("a", ["x"], "a"),
+            ParallelSteps([KeyStep("b", ["a"], "b"), KeyStep("c", ["a"], "c")]),
+            KeyStep("d", ["b", "c"], "d"),
+        ])
+        async_pipeline = AsyncPipeline.from_pipeline(pipeline)
+        assert [s.step_name for s in async_pipeline.steps] == ["a", "b", "c", "d"]
+        assert async_pipeline.run({"x": 1})["d"] == pipeline.run({"x": 1})["d"]
+
+    def test_shared_semaphore(self):
+        async def main():
+            semaphore = asyncio.Semaphore(1)
+            pipelines = [AsyncPipeline([SleepAsyncStep("a", "a", 0.1)], semaphore=semaphore) for _ in range(3)]
+            start = time.perf_counter()
+            await asyncio.gather(*(p.run_async({}) for p in pipelines))
+            return time.perf_counter() - start
+
+        assert asyncio.run(main()) >= 0.3
+
+
+def test_async_step_requires_execute_async():
+    class Incomplete(AsyncPipelineStep):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,93 @@
+"""
+Audio Pool Tests
+"""
+
+import time
+
+import pytest
+
+from app.audio_pool import AudioPool, AudioTaskError
+from tests.test_audio_processor import make_wav
+
+
+def test_process_runs_in_child_process():
+    pool = AudioPool(workers=1, memory_limit_mb=2048, timeout_sec=60)
+
+    variants, info = pool.process(make_wav(), ['denoise', 'normalize'], 'wav', export_format='wav')
+
+    assert set(variants) == {'denoise', 'normalize'}
+    assert all(data[:4] == b'RIFF' for data in variants.values())
+    assert info['duration_ms'] == 500
+
+
+def test_child_error_is_reported():
+    pool = AudioPool(workers=1, timeout_sec=60)
+    with pytest.raises(AudioTaskError, match='ValueError'):
+        pool.process(make_wav(), ['karaoke'], 'wav', export_format='wav')
+
+
+def test_timeout_terminates_child():
+    pool = AudioPool(workers=1, timeout_sec=0.01)
+    with pytest.raises(AudioTaskError, match='timed out'):
+        pool.process(make_wav(), ['denoise'], 'wav', export_format='wav')
+
+
+def test_bounded_queue_rejects_when_full():
+    pool = AudioPool(workers=1, max_queue=1)
+
+    assert pool.submit(print, 'a', wait=0) is not None
+    assert pool.submit(print, 'b', wait=0) is None
+    assert pool.pending() == 1
+
+
+def test_dispatcher_runs_tasks_and_survives_errors():
+    done = []
+
+    def boom():
+        raise RuntimeError('boom')
+
+    pool = AudioPool(workers=2).start()
+    failed = pool.submit(boom)
+    pool.submit(done.append, 1)
+    pool.submit(done.append, 2)
+    pool.shutdown()
+
+    assert sorted(done) == [1, 2]
+    assert isinstance(failed.exception(), RuntimeError)
+
+
+def test_task_runs_in_submitter_context():
+    from contextvars import ContextVar
+
+    job = ContextVar('job', default=None)
+    pool = AudioPool(workers=1).start()
+    job.set('job-1')
+    future = pool.submit(job.get)
+    job.set(None)
+
+    assert future.result(timeout=5) == 'job-1'
+    pool.shutdown()
+
+
+def test_from_env_disabled(monkeypatch):
+    monkeypatch.setenv('AUDIO_POOL_WORKERS', '0')
+    assert AudioPool.from_env() is None
+
+
+def test_memory_limit_is_enforced():
+    pool = AudioPool(workers=1, memory_limit_mb=1, timeout_sec=60)
+    with pytest.raises(AudioTaskError, match='memory limit'):
+        pool.process(make_wav(seconds=5), ['enhance'], 'wav', export_format='wav')
+
+
+def test_task_time_counts_as_busy_without_counting_a_job():
+    from app.autoscale import BusyTracker
+
+    tracker = BusyTracker()
+    pool = AudioPool(workers=1, tracker=tracker).start()
+    pool.submit(time.sleep, 0.05).result(timeout=5)
+    pool.shutdown()
+
+    _, busy_sec, jobs = tracker.take()
+    assert busy_sec >= 0.05
+    assert jobs == 0
@@ -0,0 +1,127 @@
+"""
+Audio Processor Tests
+"""
+
+import io
+import math
+import struct
+import wave
+
+import pytest
+
+from app import audio_processor
+from app.audio_processor import process_variants, apply_enhancements, decode_audio, prepare_for_stt
+
+
+def make_wav(seconds=0.5, rate=16000, freq=440):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b''.join(
+            struct.pack('<h', int(8000 * math.sin(2 * math.pi * freq * i / rate)))
+            for i in range(int(seconds * rate))
+        ))
+    return buf.getvalue()
+
+
+def test_process_variants_decodes_once(monkeypatch):
+    calls = []
+    original = audio_processor.decode_audio
+    monkeypatch.setattr(audio_processor, 'decode_audio',
+                        lambda data, fmt=None: calls.append(fmt) or original(data, fmt))
+
+    variants, info = process_variants(make_wav(), ['denoise', 'normalize'], 'wav', export_format='wav')
+
+    assert calls == ['wav']
+    assert set(variants) == {'denoise', 'normalize'}
+    assert all(data[:4] == b'RIFF' for data in variants.values())
+    assert info['duration_ms'] == 500
+    assert info['frame_rate'] == 16000
+    assert info['channels'] == 1
+
+
+def test_shared_chain_prefix_is_computed_once(monkeypatch):
+    applied = []
+    original = audio_processor._apply_filter
+    monkeypatch.setattr(audio_processor, '_apply_filter',
+                        lambda audio, spec: applied.append(spec[0]) or original(audio, spec))
+
+    audio = decode_audio(make_wav(), 'wav')
+    results = apply_enhancements(audio, ['denoise', 'enhance'], backend='pydub')
+
+    assert set(results) == {'denoise', 'enhance'}
+    assert applied == ['high_pass', 'low_pass', 'compress', 'normalize', 'gain']
+
+
+def test_unknown_enhancement_type():
+    audio = decode_audio(make_wav(), 'wav')
+    with pytest.raises(ValueError):
+        apply_enhancements(audio, ['karaoke'])
+
+
+def test_numpy_backend_shares_prefix_and_keeps_format(monkeypatch):
+    applied = []
+    original = audio_processor.dsp.apply_filter
+    monkeypatch.setattr(audio_processor.dsp, 'apply_filter',
+                        lambda x, spec, rate: applied.append(spec[0]) or original(x, spec, rate))
+
+    audio = decode_audio(make_wav(), 'wav')
+    results = apply_enhancements(audio, ['denoise', 'enhance'], backend='numpy')
+
+    assert applied == ['high_pass', 'low_pass', 'compress', 'normalize', 'gain']
+    for segment in results.values():
+        assert len(segment) == len(audio)
+        assert (segment.frame_rate, segment.channels, segment.sample_width) == (16000, 1, 2)
+
+
+def test_backend_from_env(monkeypatch):
+    monkeypatch.setenv('AUDIO_DSP_BACKEND', 'pydub')
+    monkeypatch.setattr(audio_processor, '_apply_filter', lambda audio, spec: audio)
+    audio = decode_audio(make_wav(), 'wav')
+    assert apply_enhancements(audio, ['normalize'])['normalize'] is audio
+
+    monkeypatch.setenv('AUDIO_DSP_BACKEND', 'scipy')
+    with pytest.raises(ValueError):
+        apply_enhancements(audio, ['normalize'])
+
+
+def make_padded_wav(rate=44100):
+    """前後3秒と途中2秒の無音を含むステレオ音声"""
+    silence = b'\x00\x00' * 2
+    tone = b''.join(
+        struct.pack('<hh', v, v)
+        for v in (int(8000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(rate))
+    )
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(silence * rate * 3 + tone + silence * rate * 2 + tone + silence * rate * 3)
+    return buf.getvalue()
+
+
+def test_prepare_for_stt_downsamples_and_trims():
+    original = make_padded_wav()
+
+    prepared, ext, stats = prepare_for_stt(original, 'wav', export_format='wav', max_pause_ms=500)
+
+    audio = decode_audio(prepared, 'wav')
+    assert ext == 'wav'
+    assert (audio.frame_rate, audio.channels) == (16000, 1)
+    assert stats['original_ms'] == 10000
+    # 発話 2000 + 余白 200 x 4 + 途中の無音 500
+    assert stats['prepared_ms'] == 3300
+    assert stats['upload_bytes'] == len(prepared)
+    assert stats['bytes_saved'] == len(original) - len(prepared) > 0
+
+
+def test_prepare_for_stt_keeps_original_when_not_smaller():
+    original = make_wav(rate=8000)
+
+    prepared, ext, stats = prepare_for_stt(original, 'wav', export_format='wav')
+
+    assert prepared is original
+    assert stats['bytes_saved'] == 0
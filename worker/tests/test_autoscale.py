@@ -0,0 +1,138 @@
+"""
+キュー遅延・稼働率エクスポーターのテスト
+"""
+
+import json
+import time
+
+from app.autoscale import (
+    BusyTracker,
+    Exporter,
+    WorkerReporter,
+    job_timestamp,
+    recommend_replicas,
+    sample_queue,
+    workers_key,
+)
+from app.dispatch import QUEUE_KEY, enqueue_job, pending_key
+from app.metrics import Registry
+from app.retry import delayed_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def push(r, job):
+    r.lpush(QUEUE_KEY, json.dumps(job))
+
+
+def test_job_timestamp():
+    assert job_timestamp({"enqueuedAt": 100.5}) == 100.5
+    assert job_timestamp({"createdAt": "1970-01-01T00:01:40.000Z"}) == 100
+    assert job_timestamp({"createdAt": "not a date"}) is None
+    assert job_timestamp({"type": "BACKFILL_BATCH"}) is None
+
+
+def test_sample_queue_reports_oldest_age_and_backlog(fake_redis):
+    r = fake_redis
+    push(r, {"type": "BACKFILL_BATCH"})
+    push(r, {"type": "PROCESS_ENTRY", "enqueuedAt": 900})
+    push(r, {"type": "PROCESS_ENTRY", "enqueuedAt": 950})
+    push(r, {"type": "CUSTOM_SUMMARY", "enqueuedAt": 990})
+    r.zadd(delayed_key(), {"x": 1})
+
+    stats = sample_queue(r, now=1000)
+    assert stats["depth"] == 4
+    assert stats["delayed"] == 1
+    # 時刻のない末尾のジョブは飛ばす
+    assert stats["oldest_age_sec"] == 100
+    assert stats["backlog"] == {"BACKFILL_BATCH": 1, "PROCESS_ENTRY": 2, "CUSTOM_SUMMARY": 1}
+
+    # 末尾の2件だけ数えて全体に按分
+    assert sample_queue(r, sample_size=2, now=1000)["backlog"] == {"BACKFILL_BATCH": 2, "PROCESS_ENTRY": 2}
+
+
+def test_coalesced_refs_carry_enqueue_time(fake_redis):
+    r = fake_redis
+    enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 1})
+    assert job_timestamp(json.loads(r.lindex(QUEUE_KEY, 0))) is not None
+    assert r.hlen(pending_key()) == 1
+
+
+def test_busy_tracker_and_reporter(fake_redis):
+    r = fake_redis
+    clock = Clock()
+    tracker = BusyTracker(clock=clock)
+    reporter = WorkerReporter(r, tracker, interval_sec=10, worker="w1", clock=clock)
+    with tracker.busy():
+        clock.now = 3
+    assert not reporter.maybe_report(now=1000)
+
+    clock.now = 10
+    assert reporter.maybe_report(now=1000)
+    report = json.loads(r.hget(workers_key(), "w1"))
+    assert report == {"busySec": 3, "windowSec": 10, "jobs": 1, "ts": 1000}
+    reporter.remove()
+    assert r.hlen(workers_key()) == 0
+
+
+def test_recommend_replicas():
+    # 到着 1件/秒 + 滞留 300件を 300秒で捌く = 2件/秒、1台 0.5件/秒 × 稼働率 0.8
+    assert recommend_replicas(1.0, 300, 0.5, target_utilization=0.8, target_drain_sec=300) == 5
+    assert recommend_replicas(0.0, 0, 0.5, min_replicas=2) == 2
+    assert recommend_replicas(100.0, 0, 0.5, max_replicas=10) == 10
+    # 処理レートが不明なら現状維持
+    assert recommend_replicas(1.0, 10, None, current=3) == 3
+
+
+def test_exporter_sets_gauges_and_drops_stale_workers(fake_redis):
+    r = fake_redis
+    for _ in range(30):
+        push(r, {"type": "PROCESS_ENTRY", "enqueuedAt": 940})
+    r.hset(workers_key(), "w1", json.dumps({"busySec": 12, "windowSec": 15, "jobs": 6, "ts": 995}))
+    r.hset(workers_key(), "w2", json.dumps({"busySec": 0, "windowSec": 15, "jobs": 0, "ts": 800}))
+
+    registry = Registry()
+    exporter = Exporter(r, target_utilization=0.8, target_drain_sec=60, registry=registry)
+    stats = exporter.collect(now=1000)
+
+    assert stats["workers"] == 1
+    assert not r.hexists(workers_key(), "w2")
+    assert stats["service_rate"] == 0.5
+    assert registry.gauge_value("worker_queue_depth", queue=QUEUE_KEY) == 30
+    assert registry.gauge_value("worker_queue_oldest_age_seconds", queue=QUEUE_KEY) == 60
+    assert registry.gauge_value("worker_busy_ratio", queue=QUEUE_KEY) == 0.8
+    # (0.4件/秒 + 30件 / 60秒) / (0.5 × 0.8) = 2.25 -> 3台
+    assert registry.gauge_value("worker_recommended_replicas", queue=QUEUE_KEY) == 3
+    assert "# TYPE worker_recommended_replicas gauge" in registry.render()
+
+
+def test_in_flight_job_counts_toward_busy_time(fake_redis):
+    clock = Clock()
+    tracker = BusyTracker(clock=clock)
+    reporter = WorkerReporter(fake_redis, tracker, interval_sec=10, worker="w1", clock=clock)
+    with tracker.busy():
+        clock.now = 10
+        assert reporter.report(now=1000)
+        assert json.loads(fake_redis.hget(workers_key(), "w1"))["busySec"] == 10
+        clock.now = 25
+    # 前回の報告までに数えた分は含めない
+    assert tracker.take() == (15, 15, 1)
+
+
+def test_reporter_thread_reports_periodically(fake_redis):
+    reporter = WorkerReporter(fake_redis, BusyTracker(), interval_sec=0.01, worker="w1")
+    reporter.start()
+    try:
+        deadline = time.monotonic() + 2
+        while not fake_redis.hexists(workers_key(), "w1") and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        reporter.stop()
+    assert fake_redis.hexists(workers_key(), "w1")
+    assert not reporter._thread.is_alive()
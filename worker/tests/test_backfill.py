@@ -0,0 +1,254 @@
+"""
+Backfill Engine Tests
+"""
+
+import json
+import os
+import re
+
+import pytest
+from unittest.mock import Mock
+
+from app import backfill
+from app.backfill import RateLimiter, parse_stages, process_backfill, load_checkpoint
+from app.text_resources import load_resources
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), '..', 'resources')
+
+
+def make_rows(ids):
+    return [{'id': i, 'user_id': 1, 'transcript_text': f'entry {i}', 'pii_detected': 0, 'content_flagged': 0} for i in ids]
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """id 1..7 を主キー順に返す fetch_entry_batch"""
+    calls = []
+
+    def fake_fetch(db, after_id, end_id, limit, with_text=True):
+        calls.append(after_id)
+        ids = [i for i in range(1, 8) if i > after_id and (end_id is None or i <= end_id)]
+        return make_rows(ids[:limit])
+
+    monkeypatch.setattr('app.db.fetch_entry_batch', fake_fetch)
+    return calls
+
+
+def test_parse_stages():
+    assert parse_stages(None) == ['tags', 'ng', 'speech']
+    assert parse_stages(['speech', 'tags', 'tags']) == ['tags', 'speech']
+    with pytest.raises(ValueError):
+        parse_stages(['summary'])
+
+
+def test_rate_limiter_sleeps_to_cap_throughput():
+    now = [0.0]
+    slept = []
+    limiter = RateLimiter(100, clock=lambda: now[0], sleep=slept.append)
+
+    limiter.wait(50)
+    assert slept == [0.5]
+
+    unlimited = RateLimiter(0, clock=lambda: now[0], sleep=slept.append)
+    unlimited.wait(1000)
+    assert slept == [0.5]
+
+
+def test_execute_mode_scans_in_batches_and_checkpoints(monkeypatch, batches, fake_redis):
+    r = fake_redis
+    seen = []
+    monkeypatch.setattr(backfill, 'run_backfill_stages',
+                        lambda db, rows, *args: seen.append([row['id'] for row in rows]))
+
+    process_backfill({'backfillId': 'bf1', 'stages': ['tags'], 'batchSize': 3}, r, Mock())
+
+    assert seen == [[1, 2, 3], [4, 5, 6], [7]]
+    assert batches == [0, 3, 6, 7]
+    assert load_checkpoint(r, 'bf1') == {'last_id': 7, 'processed': 7, 'status': 'done'}
+    assert not r.exists('lock:backfill:bf1')
+
+
+def test_lost_lease_stops_without_touching_new_holder(monkeypatch, batches, fake_redis):
+    import time
+    r = fake_redis
+    monkeypatch.setattr(backfill, 'LOCK_TTL_SEC', 0.3)
+
+    def slow_batch(db, rows, *args):
+        # TTL 切れで他のコーディネータがロックを取り直した
+        r.set('lock:backfill:bf5', 'other')
+        time.sleep(0.3)
+
+    monkeypatch.setattr(backfill, 'run_backfill_stages', slow_batch)
+
+    process_backfill({'backfillId': 'bf5', 'stages': ['tags'], 'batchSize': 3}, r, Mock())
+
+    assert r.get('lock:backfill:bf5') == 'other'
+    assert load_checkpoint(r, 'bf5')['status'] == 'new'
+
+
+def test_running_backfill_is_not_started_twice(monkeypatch, batches, fake_redis):
+    r = fake_redis
+    r.set('lock:backfill:bf6', 'other')
+    monkeypatch.setattr(backfill, 'run_backfill_stages', Mock())
+
+    process_backfill({'backfillId': 'bf6'}, r, Mock())
+
+    backfill.run_backfill_stages.assert_not_called()
+    assert r.get('lock:backfill:bf6') == 'other'
+
+
+def test_resumes_from_checkpoint(monkeypatch, batches, fake_redis):
+    r = fake_redis
+    r.hset('backfill:bf2:checkpoint', mapping={'last_id': 5, 'processed': 5, 'status': 'paused'})
+    seen = []
+    monkeypatch.setattr(backfill, 'run_backfill_stages',
+                        lambda db, rows, *args: seen.append([row['id'] for row in rows]))
+
+    process_backfill({'backfillId': 'bf2', 'batchSize': 10}, r, Mock())
+
+    assert seen == [[6, 7]]
+    assert load_checkpoint(r, 'bf2')['processed'] == 7
+
+
+def test_pause_control_key_stops_scan(monkeypatch, batches, fake_redis):
+    r = fake_redis
+    r.set('backfill:bf3:control', 'pause')
+    monkeypatch.setattr(backfill, 'run_backfill_stages', Mock())
+
+    process_backfill({'backfillId': 'bf3'}, r, Mock())
+
+    backfill.run_backfill_stages.assert_not_called()
+    assert load_checkpoint(r, 'bf3')['status'] == 'paused'
+
+
+def test_enqueue_mode_pushes_batch_jobs(batches, fake_redis):
+    r = fake_redis
+
+    process_backfill({'backfillId': 'bf4', 'stages': ['ng'], 'mode': 'enqueue', 'batchSize': 4, 'endId': 6}, r, Mock())
+
+    jobs = [json.loads(p) for p in reversed(r.lrange('jobs:default', 0, -1))]
+    assert [j['entryIds'] for j in jobs] == [[1, 2, 3, 4], [5, 6]]
+    assert all(j['type'] == 'BACKFILL_BATCH' and j['stages'] == ['ng'] for j in jobs)
+
+
+def test_tags_stage_writes_one_bulk_statement(monkeypatch):
+    replace = Mock()
+    monkeypatch.setattr('app.db.replace_entry_tags_bulk', replace)
+    monkeypatch.setattr('app.db.get_stage_fingerprints', lambda db, ids, stage: {})
+    monkeypatch.setattr('app.db.save_stage_results_bulk', Mock())
+    monkeypatch.setattr('app.tagger.extract_tags', lambda text: ['#仕事'] if '仕事' in text else [])
+    rows = [
+        {'id': 1, 'transcript_text': '今日は仕事だった', 'content_flagged': 0},
+        {'id': 2, 'transcript_text': '散歩した', 'content_flagged': 0},
+        {'id': 3, 'transcript_text': None, 'content_flagged': 0},
+    ]
+
+    counts = backfill.run_backfill_stages(Mock(), rows, ['tags'])
+
+    assert counts == {'tags': 2}
+    replace.assert_called_once()
+    _, entry_ids, pairs = replace.call_args[0]
+    assert entry_ids == [1, 2]
+    assert pairs == [(1, '#仕事')]
+
+
+def test_stage_skipped_when_fingerprint_unchanged(monkeypatch):
+    from app.stage_versions import stage_fingerprint
+
+    rows = [
+        {'id': 1, 'transcript_text': '今日は仕事だった', 'content_flagged': 0},
+        {'id': 2, 'transcript_text': '散歩した', 'content_flagged': 0},
+    ]
+    stored = {1: stage_fingerprint('tags', '今日は仕事だった')}
+    replace = Mock()
+    saved = Mock()
+    monkeypatch.setattr('app.db.get_stage_fingerprints', lambda db, ids, stage: stored)
+    monkeypatch.setattr('app.db.replace_entry_tags_bulk', replace)
+    monkeypatch.setattr('app.db.save_stage_results_bulk', saved)
+    monkeypatch.setattr('app.tagger.extract_tags', lambda text: [])
+
+    assert backfill.run_backfill_stages(Mock(), rows, ['tags']) == {'tags': 1}
+    assert replace.call_args[0][1] == [2]
+    assert [row[0] for row in saved.call_args[0][1]] == [2]
+
+    assert backfill.run_backfill_stages(Mock(), rows, ['tags'], force=True) == {'tags': 2}
+
+
+def test_ng_stage_keeps_pattern_flags(monkeypatch):
+    from app.pipelines.entry import NgStep
+
+    update = Mock()
+    saved = Mock()
+    monkeypatch.setattr('app.db.update_entry_flags_bulk', update)
+    monkeypatch.setattr('app.db.get_stage_fingerprints', lambda db, ids, stage: {})
+    monkeypatch.setattr('app.db.save_stage_results_bulk', saved)
+    resources = load_resources(RESOURCES_DIR)
+    resources = type(resources)(**dict(vars(resources), ng_topic_patterns=[re.compile('映画')]))
+    text = '映画を見た'
+
+    # パイプラインでパターンだけに当たってフラグが付いたエントリ
+    live = NgStep(resources.ng_topic_patterns, resources.non_save_patterns).execute(
+        {'masked': text, 'pii_detected': False})
+    assert live['content_flagged'] == 1
+
+    rows = [{'id': 1, 'transcript_text': text, 'pii_detected': 0, 'content_flagged': 1}]
+    assert backfill.run_backfill_stages(Mock(), rows, ['ng'], resources=resources) == {'ng': 1}
+    assert update.call_args[0][1] == [(1, live['flag_json'], 1)]
+    assert json.loads(saved.call_args[0][1][0][3]) == live['ng_flags'] == []
+
+
+@pytest.fixture
+def llm_stage(monkeypatch):
+    """マイクロバッチ無効で LLM ステージを実行（個別分析の analyze_one をモックに差し替える）"""
+    monkeypatch.delenv('LLM_MICROBATCH', raising=False)
+    monkeypatch.setattr('app.db.get_stage_fingerprints', lambda db, ids, stage: {})
+    monkeypatch.setattr('app.db.save_stage_results_bulk', Mock())
+    analyze = Mock()
+    monkeypatch.setattr('app.microbatch.analyze_one', analyze)
+    return analyze
+
+
+def test_emotion_stage_saves_each_analysis(monkeypatch, llm_stage):
+    save = Mock()
+    monkeypatch.setattr('app.db.save_emotion_analysis', save)
+    llm_stage.side_effect = lambda text, task: None if text == '不正' else {
+        'primary_emotion': 'joy', 'emotions': {'joy': 0.9}, 'valence': 0.8, 'arousal': 0.5, 'dominance': 0.4,
+    }
+    rows = [{'id': 1, 'transcript_text': '楽しかった', 'content_flagged': 0}, {'id': 2, 'transcript_text': '不正', 'content_flagged': 0}]
+
+    assert backfill.run_backfill_stages(Mock(), rows, ['emotion']) == {'emotion': 1}
+    save.assert_called_once()
+    assert save.call_args[0][1:] == (1, 'joy', {'joy': 0.9}, 0.8, 0.5, 0.4)
+    assert [c[0] for c in llm_stage.call_args_list] == [('楽しかった', 'emotion'), ('不正', 'emotion')]
+
+
+def test_keywords_stage_saves_each_analysis(monkeypatch, llm_stage):
+    save = Mock()
+    monkeypatch.setattr('app.db.save_keywords', save)
+    llm_stage.return_value = {'keywords': ['ランチ'], 'topics': ['友人']}
+    rows = [{'id': 5, 'transcript_text': '友人とランチ', 'content_flagged': 0}]
+
+    assert backfill.run_backfill_stages(Mock(), rows, ['keywords']) == {'keywords': 1}
+    assert save.call_args[0][1:] == (5, ['ランチ'], ['友人'])
+    llm_stage.assert_called_once_with('友人とランチ', 'keywords')
+
+
+def test_analysis_stages_skip_flagged_entries(monkeypatch, llm_stage):
+    monkeypatch.setattr('app.db.update_entry_flags_bulk', Mock())
+    replace_tags = Mock()
+    monkeypatch.setattr('app.db.replace_entry_tags_bulk', replace_tags)
+    monkeypatch.setattr('app.db.save_keywords', Mock())
+    monkeypatch.setattr('app.tagger.extract_tags', lambda text: [])
+    llm_stage.return_value = {'keywords': [], 'topics': []}
+    rows = [
+        {'id': 1, 'transcript_text': '友人とランチ', 'pii_detected': 0, 'content_flagged': 0},
+        {'id': 2, 'transcript_text': '電話番号を聞いた', 'pii_detected': 1, 'content_flagged': 1},
+        # ng ステージで新たにフラグが付くエントリ（同じバッチの分析ステージでは対象外）
+        {'id': 3, 'transcript_text': '暴力的な映画', 'pii_detected': 0, 'content_flagged': 0},
+    ]
+
+    counts = backfill.run_backfill_stages(Mock(), rows, ['tags', 'ng', 'keywords'])
+
+    assert counts == {'ng': 3, 'tags': 1, 'keywords': 1}
+    llm_stage.assert_called_once_with('友人とランチ', 'keywords')
+    assert replace_tags.call_args[0][1] == [1]
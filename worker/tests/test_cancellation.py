@@ -0,0 +1,122 @@
+"""
+ジョブの期限・キャンセルのテスト
+"""
+
+import threading
+
+import pytest
+
+from app.cancellation import (
+    CANCEL_TTL_SEC,
+    CancelToken,
+    JobCancelled,
+    cancel_job,
+    cancel_key,
+    check_cancelled,
+    job_deadline,
+    job_scope,
+    run_cancellable,
+)
+from app.pipelines.base import Pipeline, PipelineStep
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline_expires_token():
+    clock = Clock()
+    token = CancelToken(None, "PROCESS_ENTRY:1", deadline=1010, clock=clock)
+    token.check()
+    assert token.remaining() == 10
+
+    clock.now = 1010
+    with pytest.raises(JobCancelled) as exc:
+        token.check()
+    assert exc.value.reason == "deadline"
+
+
+def test_cancel_only_affects_jobs_started_before_request(fake_redis):
+    r = fake_redis
+    clock = Clock()
+    running = CancelToken(r, "CUSTOM_SUMMARY:3", poll_interval=0, clock=clock)
+    cancel_job(r, "CUSTOM_SUMMARY:3", now=1001)
+
+    # 要求後に開始した（再投入された）ジョブは止めない
+    clock.now = 1002
+    requeued = CancelToken(r, "CUSTOM_SUMMARY:3", poll_interval=0, clock=clock)
+    assert not requeued.cancelled()
+
+    with pytest.raises(JobCancelled) as exc:
+        running.check()
+    assert exc.value.reason == "cancelled"
+    assert 0 < r.ttl(cancel_key("CUSTOM_SUMMARY:3")) <= CANCEL_TTL_SEC
+
+
+def test_redis_is_polled_at_most_once_per_interval(fake_redis, mocker):
+    r = fake_redis
+    get = mocker.spy(r, "get")
+    clock = Clock()
+    token = CancelToken(r, "PROCESS_ENTRY:1", poll_interval=1.0, clock=clock)
+    for _ in range(5):
+        assert not token.cancelled()
+    assert get.call_count == 1
+    clock.now += 1.0
+    token.cancelled()
+    assert get.call_count == 2
+
+
+def test_job_deadline_uses_earliest_limit():
+    assert job_deadline({"type": "CUSTOM_SUMMARY"}, now=1000) == 1300
+    assert job_deadline({"type": "CUSTOM_SUMMARY", "deadline": 1100}, now=1000) == 1100
+    assert job_deadline({"type": "PROCESS_ENTRY", "timeoutSec": 60}, now=1000) == 1060
+    assert job_deadline({"type": "BACKFILL"}, now=1000) is None
+
+
+def test_check_is_noop_outside_job():
+    check_cancelled()
+    assert run_cancellable(lambda x: x * 2, 21) == 42
+
+
+def test_run_cancellable_stops_waiting_on_cancel(fake_redis):
+    r = fake_redis
+    release = threading.Event()
+    with job_scope(r, "PROCESS_ENTRY:1") as token:
+        token.poll_interval = 0
+
+        def slow_call():
+            cancel_job(r, "PROCESS_ENTRY:1")
+            release.wait(5)
+            return "late"
+
+        with pytest.raises(JobCancelled):
+            run_cancellable(slow_call, wait_interval=0.01)
+    release.set()
+
+
+class CancelStep(PipelineStep):
+    name = "cancel"
+
+    def execute(self, context):
+        context["token"].cancel()
+        return context
+
+
+class RecordStep(PipelineStep):
+    name = "record"
+
+    def execute(self, context):
+        context["ran"] = True
+        return context
+
+
+def test_pipeline_stops_between_steps():
+    with job_scope(None, "PROCESS_ENTRY:1") as token:
+        context = Pipeline([CancelStep(), RecordStep()]).run({"token": token})
+    assert "ran" not in context
+    assert context["error"]["step"] == "RecordStep"
+    assert isinstance(context["error"]["exception"], JobCancelled)
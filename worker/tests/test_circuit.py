@@ -0,0 +1,115 @@
+"""
+サーキットブレーカーのテスト
+"""
+
+import pytest
+
+from app import circuit
+from app.circuit import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    blocked_dependency,
+    get_breaker,
+    reset_breakers,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def failing_call(breaker, error):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+def test_opens_after_consecutive_dependency_failures():
+    clock = Clock()
+    breaker = CircuitBreaker("chat", failure_threshold=3, reset_timeout_sec=10, clock=clock)
+    for _ in range(2):
+        failing_call(breaker, TimeoutError())
+    assert breaker.state == CLOSED
+
+    # 成功で連続失敗数はリセット
+    with breaker.guard():
+        pass
+    for _ in range(3):
+        failing_call(breaker, ConnectionError())
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as exc:
+        with breaker.guard():
+            pytest.fail("call must not run while open")
+    assert exc.value.dependency == "chat"
+    assert exc.value.retry_after == 10
+
+
+def test_non_dependency_errors_do_not_trip():
+    breaker = CircuitBreaker("chat", failure_threshold=1)
+    failing_call(breaker, ValueError("bad json"))
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probe_closes_on_success():
+    clock = Clock()
+    breaker = CircuitBreaker("stt", failure_threshold=1, reset_timeout_sec=10, half_open_max=1, clock=clock)
+    failing_call(breaker, TimeoutError())
+    clock.now = 9
+    assert breaker.retry_after() == 1
+    assert not breaker.available()
+
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.available()
+    breaker.before_call()
+    # 試行枠は1件だけ
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probe_failure_reopens():
+    clock = Clock()
+    breaker = CircuitBreaker("storage", failure_threshold=2, reset_timeout_sec=5, clock=clock)
+    failing_call(breaker, TimeoutError())
+    failing_call(breaker, TimeoutError())
+    clock.now = 5
+    failing_call(breaker, TimeoutError())
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 5
+
+
+def test_blocked_dependency_only_affects_dependent_job_types(monkeypatch):
+    monkeypatch.setenv("CIRCUIT_FAILURE_THRESHOLD", "1")
+    failing_call(get_breaker("stt"), TimeoutError())
+
+    dependency, retry_after = blocked_dependency("PROCESS_ENTRY")
+    assert dependency == "stt"
+    assert retry_after > 0
+    assert blocked_dependency("CUSTOM_SUMMARY") is None
+    assert blocked_dependency("AUDIO_ENHANCEMENT") is None
+
+
+def test_is_mysql_error():
+    OperationalError = type("OperationalError", (Exception,), {"__module__": "mysql.connector.errors"})
+    ProgrammingError = type("ProgrammingError", (Exception,), {"__module__": "mysql.connector.errors"})
+    assert circuit.is_mysql_error(OperationalError("gone away"))
+    assert not circuit.is_mysql_error(ProgrammingError("syntax"))
+    assert not circuit.is_mysql_error(TimeoutError())
@@ -0,0 +1,98 @@
+"""
+ジョブ集約（冪等キー）のテスト
+"""
+
+import json
+
+from app.dispatch import (
+    QUEUE_KEY,
+    claim_job,
+    enqueue_job,
+    idempotency_key,
+    pending_key,
+    pop_job,
+)
+
+
+def pop(r):
+    raw = r.rpop(QUEUE_KEY)
+    return claim_job(r, json.loads(raw)) if raw else None
+
+
+def test_idempotency_keys():
+    assert idempotency_key({"type": "PROCESS_ENTRY", "entryId": 5}) == "PROCESS_ENTRY:5"
+    assert idempotency_key({"type": "CUSTOM_SUMMARY", "entryId": 5, "options": {"style": "a"}}) == "CUSTOM_SUMMARY:5"
+    assert idempotency_key({"type": "AUDIO_ENHANCEMENT", "entryId": 5, "enhancementTypes": ["normalize", "denoise"]}) == \
+        idempotency_key({"type": "AUDIO_ENHANCEMENT", "entryId": 5, "enhancementTypes": ["denoise", "normalize"]})
+    assert idempotency_key({"type": "PROCESS_ENTRY", "entryId": 5, "idempotencyKey": "req-1"}) == "req-1"
+    assert idempotency_key({"type": "BACKFILL_BATCH", "entryIds": [1, 2]}) is None
+    assert idempotency_key({"type": "PROCESS_ENTRY"}) is None
+
+
+def test_duplicates_collapse_into_one_job(fake_redis):
+    r = fake_redis
+    assert enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 1}) is True
+    assert enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 1}) is False
+    assert enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 2}) is True
+    assert r.llen(QUEUE_KEY) == 2
+
+    assert pop(r)["entryId"] == 1
+    assert pop(r)["entryId"] == 2
+    assert pop(r) is None
+    assert r.hlen(pending_key()) == 0
+
+
+def test_latest_custom_summary_options_win(fake_redis):
+    r = fake_redis
+    enqueue_job(r, {"type": "CUSTOM_SUMMARY", "entryId": 3, "options": {"style": "bullet"}})
+    enqueue_job(r, {"type": "CUSTOM_SUMMARY", "entryId": 3, "options": {"style": "narrative"}})
+    job = pop(r)
+    assert job["options"] == {"style": "narrative"}
+    assert job["idempotencyKey"] == "CUSTOM_SUMMARY:3"
+
+
+def test_custom_summary_requeue_cancels_running_job(fake_redis):
+    r = fake_redis
+    enqueue_job(r, {"type": "CUSTOM_SUMMARY", "entryId": 3})
+    assert r.exists("job:cancel:CUSTOM_SUMMARY:3")
+    # PROCESS_ENTRY は実行中のジョブを止めない
+    enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 3})
+    assert not r.exists("job:cancel:PROCESS_ENTRY:3")
+
+
+def test_job_after_claim_is_queued_again(fake_redis):
+    r = fake_redis
+    enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 1})
+    assert pop(r)["entryId"] == 1
+    # 処理開始後に届いたジョブは新しいジョブとして積まれる
+    assert enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 1}) is True
+    assert pop(r)["entryId"] == 1
+
+
+def test_requeue_of_claimed_job_keeps_key(fake_redis):
+    r = fake_redis
+    enqueue_job(r, {"type": "AUDIO_ENHANCEMENT", "entryId": 9, "enhancementTypes": ["denoise"]})
+    job = pop(r)
+    assert enqueue_job(r, job) is True
+    assert pop(r) == job
+
+
+def test_uncoalesced_and_raw_jobs_pass_through(fake_redis):
+    r = fake_redis
+    batch = {"type": "BACKFILL_BATCH", "backfillId": "b", "entryIds": [1, 2]}
+    assert enqueue_job(r, batch) is True
+    assert enqueue_job(r, batch) is True
+    assert pop(r) == batch
+    assert pop(r) == batch
+    # API から直接積まれた生のペイロード
+    raw = {"type": "PROCESS_ENTRY", "entryId": 4}
+    assert claim_job(r, raw) is raw
+
+
+def test_pop_job_resolves_refs(fake_redis):
+    r = fake_redis
+    enqueue_job(r, {"type": "PROCESS_ENTRY", "entryId": 7, "options": {"a": 1}})
+    job = pop_job(r, timeout=1)
+    assert job["entryId"] == 7 and job["options"] == {"a": 1}
+    assert r.hlen(pending_key()) == 0
+    assert pop_job(r, timeout=1) is None
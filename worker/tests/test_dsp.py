@@ -0,0 +1,101 @@
+"""
+DSP Tests
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from app import dsp
+
+RATE = 16000
+
+
+def tone(freq, seconds=1.0, amplitude=0.5, channels=1):
+    t = np.arange(int(seconds * RATE)) / RATE
+    x = amplitude * np.sin(2 * math.pi * freq * t)
+    return np.repeat(x[:, None], channels, axis=1)
+
+
+def iir_reference(x, b, a):
+    """差分方程式をそのまま計算した参照実装"""
+    y = np.zeros_like(x)
+    for n in range(len(x)):
+        y[n] = b[0] * x[n]
+        if n >= 1:
+            y[n] += b[1] * x[n - 1] - a[1] * y[n - 1]
+        if n >= 2:
+            y[n] += b[2] * x[n - 2] - a[2] * y[n - 2]
+    return y
+
+
+def rms(x):
+    return float(np.sqrt(np.mean(x ** 2)))
+
+
+@pytest.mark.parametrize('kind,cutoff', [('high_pass', 100), ('low_pass', 3000)])
+def test_biquad_matches_difference_equation(kind, cutoff):
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-0.5, 0.5, size=(3000, 1))
+    b, a = dsp.biquad_coefficients(kind, cutoff, RATE)
+
+    y = dsp.fft_convolve(x, dsp._impulse_response(b, a), block_size=1024)
+
+    assert np.allclose(y[:, 0], iir_reference(x[:, 0], b, a), atol=1e-6)
+
+
+def test_filters_attenuate_stopband():
+    low = tone(50)
+    high = tone(6000)
+
+    assert rms(dsp.high_pass(low, 400, RATE)[RATE // 2:]) < 0.1 * rms(low)
+    assert rms(dsp.high_pass(high, 400, RATE)) > 0.9 * rms(high)
+    assert rms(dsp.low_pass(high, 1000, RATE)[RATE // 2:]) < 0.1 * rms(high)
+
+
+def test_compress_reduces_loud_parts_only():
+    quiet = tone(440, amplitude=0.01)
+    loud = tone(440, amplitude=0.9)
+
+    assert np.allclose(dsp.compress_rms(quiet, RATE), quiet)
+    assert rms(dsp.compress_rms(loud, RATE)) < rms(loud)
+
+
+def test_normalize_and_gain():
+    x = tone(440, amplitude=0.25, channels=2)
+
+    y = dsp.normalize_peak(x)
+    assert np.max(np.abs(y)) == pytest.approx(10 ** (-0.1 / 20))
+    assert np.array_equal(dsp.normalize_peak(np.zeros((10, 1))), np.zeros((10, 1)))
+    assert np.max(np.abs(dsp.apply_gain(x, 6))) == pytest.approx(0.25 * 10 ** (6 / 20))
+
+
+def test_segment_round_trip():
+    from pydub import AudioSegment
+
+    pcm = (tone(440, seconds=0.1, channels=2) * 32767).astype(np.int16)
+    segment = AudioSegment(pcm.tobytes(), frame_rate=RATE, sample_width=2, channels=2)
+
+    samples, rate = dsp.segment_to_array(segment)
+    assert rate == RATE and samples.shape == (1600, 2)
+    assert dsp.array_to_segment(samples, segment).raw_data == segment.raw_data
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        dsp.apply_filter(np.zeros((10, 1)), ('reverb', None), RATE)
+
+
+def test_shorten_silence_trims_edges_and_caps_pauses():
+    rate = 1000
+    x = np.zeros((10 * rate, 1))
+    x[2000:3000] = 0.5
+    x[6000:6500] = 0.5
+
+    y = dsp.shorten_silence(x, rate, thresh_db=-40, max_pause_ms=1000, keep_ms=200)
+
+    # 発話 1000 + 500、前後の余白 200 x 4、途中の無音 2600 -> 1000
+    assert len(y) == 1000 + 500 + 800 + 1000
+    assert np.count_nonzero(y) == 1500
+    assert len(dsp.shorten_silence(np.zeros((rate, 1)), rate, thresh_db=-40)) == 0
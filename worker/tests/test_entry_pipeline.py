@@ -0,0 +1,116 @@
+"""
+エントリ処理パイプライン（app.pipelines.entry）のテスト
+"""
+
+import os
+import re
+from unittest.mock import Mock
+
+from app import backfill
+from app.pipelines.async_pipeline import AsyncPipeline, build_graph
+from app.pipelines.base import ParallelSteps
+from app.pipelines.entry import (
+    BatchedAnalysisStep,
+    CleanStep,
+    NgStep,
+    PiiStep,
+    SaveStageResultsStep,
+    TranscribeStep,
+    build_entry_pipeline,
+)
+from app.text_resources import load_resources
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "..", "resources")
+
+
+def build(batched=None):
+    return build_entry_pipeline(Mock(), Mock(), "bucket", Mock(), load_resources(RESOURCES_DIR), [], [],
+                                batched=batched)
+
+
+def step_names(pipeline):
+    names = []
+    for step in pipeline.steps:
+        names.extend(s.step_name for s in (step.steps if isinstance(step, ParallelSteps) else [step]))
+    return names
+
+
+def test_build_entry_pipeline_with_fakes(monkeypatch):
+    monkeypatch.delenv("LLM_MICROBATCH", raising=False)
+    assert step_names(build()) == [
+        "db_read", "download", "stt_preprocess", "stt", "clean", "pii", "ng", "summary", "db_update",
+        "tags", "emotion", "keywords", "speech", "actions", "db_analysis", "stage_results",
+    ]
+
+    names = step_names(build(batched=True))
+    assert "analysis_batch" in names
+    assert not {"tags", "emotion", "keywords"} & set(names)
+
+
+def test_clean_and_pii_steps_use_resources():
+    resources = load_resources(RESOURCES_DIR)
+    context = CleanStep(resources).execute({"raw": "えーっと  今日は 090-1234-5678 に電話した"})
+    context = PiiStep(resources).execute(context)
+    assert "090-1234-5678" not in context["masked"]
+    assert context["pii_detected"] is True
+    assert context["pii_json"] == '["phone"]'
+
+
+def test_batched_analysis_sends_one_request_and_tags_locally(mocker):
+    analyze_batch = mocker.patch("app.pipelines.entry.analyze_batch",
+                                 return_value={1: {"emotion": {"primary_emotion": "joy"}}})
+    extract_tags = mocker.patch("app.pipelines.entry.extract_tags", return_value=["#仕事"])
+    analyze_one = mocker.patch("app.pipelines.entry.analyze_one", return_value={"keywords": [], "topics": []})
+
+    context = BatchedAnalysisStep(Mock()).execute({"entry_id": 1, "masked": "今日は仕事"})
+    analyze_batch.assert_called_once_with([(1, "今日は仕事")])
+    extract_tags.assert_called_once_with("今日は仕事")
+    # 応答に無いタスクだけ個別に呼び出す
+    analyze_one.assert_called_once_with("今日は仕事", "keywords")
+    assert context["tags"] == ["#仕事"]
+    assert context["emotion"] == {"primary_emotion": "joy"}
+
+
+def test_entry_graph_saves_after_entry_update(monkeypatch):
+    monkeypatch.delenv("LLM_MICROBATCH", raising=False)
+    steps = AsyncPipeline.from_pipeline(build()).steps
+    deps = build_graph(steps, {"entry_id", "lease"})
+    index = {step.step_name: i for i, step in enumerate(steps)}
+
+    def ancestors(name):
+        seen, todo = set(), [index[name]]
+        while todo:
+            for dep in deps[todo.pop()] - seen:
+                seen.add(dep)
+                todo.append(dep)
+        return {steps[i].step_name for i in seen}
+
+    assert "db_update" in ancestors("db_analysis")
+    assert "db_update" in ancestors("stage_results")
+
+
+def test_transcribe_uploads_with_prepared_format(mocker):
+    names = []
+    stt = mocker.patch("app.pipelines.entry.stt_openai", side_effect=lambda path, seconds: names.append(path) or "text")
+    mocker.patch("app.db.update_entry_stt_stats")
+    context = {"entry_id": 1, "stt_audio": b"fLaC", "stt_format": "flac", "stt_stats": {"prepared_ms": 4500}}
+
+    assert TranscribeStep(Mock(), Mock()).execute(context)["raw"] == "text"
+    assert names[0].endswith(".flac")
+    assert stt.call_args[0][1] == 4.5
+
+
+def test_ng_stage_matches_backfill(mocker):
+    update = mocker.patch("app.db.update_entry_flags_bulk")
+    text = "暴力的な映画を見て死ねと思った"
+    resources = Mock(ng_topic_patterns=[re.compile("映画")], non_save_patterns=[])
+
+    context = NgStep(resources.ng_topic_patterns, resources.non_save_patterns).execute(
+        {"masked": text, "pii_detected": True})
+    outputs = backfill._run_ng(Mock(), [{"id": 1, "transcript_text": text, "pii_detected": 1}], None, resources)
+
+    assert context["ng_flags"] == outputs[1] == ["pii", "ng_topic", "non_save_word"]
+    # 追加パターンはエントリのフラグにだけ入る（バックフィルでも同じ）
+    assert context["flag_types"] == ["pii", "ng_topic", "non_save_word", "ng_pattern"]
+    assert update.call_args[0][1] == [(1, context["flag_json"], 1)]
+    assert dict((stage, key) for stage, key, _ in SaveStageResultsStep.STAGES)["ng"] == "ng_flags"
@@ -0,0 +1,86 @@
+"""
+進捗・完了イベントのテスト
+"""
+
+import json
+
+import pytest
+
+from app.events import bind_event_user, emit, event_context, publish_event, stage_events, user_channel
+from app.pipelines.base import Pipeline, PipelineStep
+
+
+@pytest.fixture
+def received(fake_redis):
+    """events:user:* に届いたイベントを (チャンネル, イベント) のリストで返す関数"""
+    pubsub = fake_redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe("events:user:*")
+    # 購読の確認メッセージを読み捨てる
+    pubsub.get_message()
+
+    def drain():
+        messages = []
+        while (message := pubsub.get_message()) is not None:
+            messages.append((message["channel"], json.loads(message["data"])))
+        return messages
+
+    return drain
+
+
+class BindStep(PipelineStep):
+    name = "db_read"
+
+    def execute(self, context):
+        bind_event_user(7)
+        return context
+
+
+class WorkStep(PipelineStep):
+    name = "stt"
+
+    def execute(self, context):
+        return context
+
+
+def test_publish_compact_event_to_user_channel(fake_redis, received):
+    publish_event(fake_redis, 7, "summary.ready", summaryId=3)
+    channel, event = received()[0]
+    assert channel == user_channel(7) == "events:user:7"
+    assert event["type"] == "summary.ready"
+    assert event["summaryId"] == 3
+    assert "ts" in event
+
+
+def test_emit_waits_for_user_and_ignores_outside_job(fake_redis, received):
+    emit("entry.done")
+    with event_context(fake_redis, entryId=1):
+        emit("stage.started", stage="db_read")
+        assert received() == []
+        bind_event_user(7)
+        emit("entry.done")
+    messages = received()
+    assert [(channel, event["type"]) for channel, event in messages] == [("events:user:7", "entry.done")]
+    assert messages[0][1]["entryId"] == 1
+
+
+def test_pipeline_publishes_stage_events(fake_redis, received):
+    with event_context(fake_redis, entryId=1):
+        Pipeline([BindStep(), WorkStep()]).run({})
+    messages = received()
+    events = [(e["type"], e["stage"]) for _, e in messages]
+    # ユーザー確定前の db_read の開始は送られない
+    assert events == [("stage.finished", "db_read"), ("stage.started", "stt"), ("stage.finished", "stt")]
+    assert messages[-1][1]["failed"] is False
+
+
+def test_failed_stage_and_publish_errors(fake_redis, received, mocker):
+    with event_context(fake_redis, 7, entryId=1):
+        with pytest.raises(ValueError):
+            with stage_events("summary"):
+                raise ValueError("boom")
+    assert received()[-1][1]["failed"] is True
+
+    # publish の失敗はジョブを止めない
+    mocker.patch.object(fake_redis, "publish", side_effect=ConnectionError("redis down"))
+    with event_context(fake_redis, 7, entryId=1):
+        emit("entry.done")
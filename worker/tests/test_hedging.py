@@ -0,0 +1,119 @@
+"""
+ヘッジリクエストのテスト
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.hedging import Hedger, hedged_call
+from app.metrics import REGISTRY, current_stage
+
+
+def warm(hedger, seconds=0.01, n=20):
+    for _ in range(n):
+        hedger.observe(seconds)
+
+
+def test_no_hedge_until_enough_samples():
+    hedger = Hedger("chat", min_samples=5, min_delay_sec=0.01)
+    calls = []
+    assert hedger.call(lambda: calls.append(1) or "ok") == "ok"
+    assert hedger.hedge_delay() is None
+    assert len(calls) == 1
+
+
+def test_hedge_delay_uses_quantile_with_floor():
+    hedger = Hedger("chat", quantile=0.95, min_samples=20, min_delay_sec=0.05)
+    for i in range(20):
+        hedger.observe(0.001 * (i + 1))
+    assert hedger.hedge_delay() == 0.05
+    hedger.observe(1.0)
+    hedger.observe(1.0)
+    assert hedger.hedge_delay() == 1.0
+
+
+def test_slow_primary_is_hedged_and_first_response_wins():
+    REGISTRY.reset()
+    hedger = Hedger("stt", min_samples=20, min_delay_sec=0.02, max_ratio=0.5)
+    warm(hedger)
+    attempts = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            attempts.append(current_stage.get())
+            n = len(attempts)
+        time.sleep(0.5 if n == 1 else 0.01)
+        return f"answer-{n}"
+
+    token = current_stage.set("stt")
+    try:
+        start = time.perf_counter()
+        assert hedger.call(call) == "answer-2"
+        assert time.perf_counter() - start < 0.3
+    finally:
+        current_stage.reset(token)
+    # ヘッジ側はステージ名で区別される（使用量の追加コスト集計用）
+    assert attempts == ["stt", "stt:hedge"]
+    assert REGISTRY.counter_value("worker_hedges_total", operation="stt") == 1
+    assert REGISTRY.counter_value("worker_hedge_wins_total", operation="stt", winner="hedge") == 1
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = Hedger("chat", min_samples=20, min_delay_sec=0.2, max_ratio=1.0)
+    warm(hedger)
+    calls = []
+    assert hedger.call(lambda: calls.append(1) or "fast") == "fast"
+    assert len(calls) == 1
+
+
+def test_hedge_rate_is_capped():
+    hedger = Hedger("chat", min_samples=20, min_delay_sec=0.01, max_ratio=0.05)
+    warm(hedger, seconds=0.001)
+    counts = []
+
+    def slow():
+        counts.append(1)
+        time.sleep(0.03)
+        return "ok"
+
+    for _ in range(3):
+        hedger.call(slow)
+    time.sleep(0.05)
+    # 20件の窓に対して 5% = 1件だけヘッジ
+    assert len(counts) == 4
+
+
+def test_error_from_first_attempt_falls_back_to_other():
+    hedger = Hedger("chat", min_samples=20, min_delay_sec=0.01, max_ratio=1.0)
+    warm(hedger, seconds=0.001)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(0.05)
+            raise TimeoutError("slow and failed")
+        time.sleep(0.1)
+        return "late but ok"
+
+    assert hedger.call(flaky) == "late but ok"
+
+
+def test_both_attempts_fail():
+    hedger = Hedger("chat", min_samples=20, min_delay_sec=0.01, max_ratio=1.0)
+    warm(hedger, seconds=0.001)
+
+    def fail():
+        time.sleep(0.03)
+        raise TimeoutError("down")
+
+    with pytest.raises(TimeoutError):
+        hedger.call(fail)
+
+
+def test_hedged_call_disabled_runs_inline(monkeypatch):
+    monkeypatch.delenv("HEDGE_ENABLED", raising=False)
+    assert hedged_call("chat", lambda x: threading.current_thread().name + x, "!") == "MainThread!"
@@ -0,0 +1,63 @@
+"""
+ジョブ処理（app.jobs）のテスト
+"""
+
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from app import jobs
+from app.retry import schedule_retry
+from app.text_resources import load_resources
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "..", "resources")
+
+
+def test_range_summary_uses_template(mocker):
+    chat = mocker.patch("app.jobs.chat_completion", return_value="要約")
+    resources = load_resources(RESOURCES_DIR)
+
+    assert jobs.range_summary("本文", "bullet", resources) == "要約"
+    messages = chat.call_args[0][0]
+    assert messages[0]["content"] == resources.entry_summary_system
+    assert messages[1]["content"] == resources.range_summary_user_templates["bullet"].replace("{TEXT}", "本文")
+
+    jobs.range_summary("本文", "unknown", resources)
+    assert chat.call_args[0][0][1]["content"] == \
+        resources.range_summary_user_templates["default"].replace("{TEXT}", "本文")
+
+
+def test_custom_summary_passes_transcript_first(mocker):
+    mocker.patch("app.db.get_entry", return_value={"transcript_text": "今日は仕事", "user_id": 1})
+    update = mocker.patch("app.db.update_entry_summary")
+    generate = mocker.patch("app.jobs.generate_custom_summary", return_value="要約")
+
+    jobs.process_custom_summary(3, {"style": "concise"}, Mock(), None)
+
+    assert generate.call_args[0][:2] == ("今日は仕事", "concise")
+    assert update.call_args[0][1:] == (3, "要約")
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_stt_rate_limit_schedules_retry_instead_of_done(mocker, monkeypatch, fake_redis):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    for name in ("LLM_MICROBATCH", "STT_PREPROCESS", "PIPELINE_RUNNER"):
+        monkeypatch.delenv(name, raising=False)
+    mocker.patch("app.db.get_entry", return_value={
+        "id": 1, "user_id": 1, "audio_url": "s3://bucket/a.m4a", "transcript_text": None,
+    })
+    mocker.patch("app.pipelines.entry.fetch_object", return_value=b"audio")
+    mocker.patch("app.providers_openai._transcribe", side_effect=RateLimitError("rate limited"))
+    update = mocker.patch("app.db.update_entry")
+    job = {"type": "PROCESS_ENTRY", "entryId": 1}
+
+    with pytest.raises(RateLimitError) as exc:
+        jobs.process_entry(1, fake_redis, Mock(), Mock(), "bucket", Mock(), load_resources(RESOURCES_DIR), [], [])
+
+    update.assert_not_called()
+    error_class, delay = schedule_retry(fake_redis, job, exc.value)
+    assert error_class == "rate_limit" and delay is not None
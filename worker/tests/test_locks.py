@@ -0,0 +1,102 @@
+"""
+リースロックのテスト
+"""
+
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.db import update_entry
+from app.locks import RENEW_SCRIPT, LeaseLostError, LockManager, acquire_lock, fence_key
+
+
+def renewals(spy):
+    """RENEW_SCRIPT の実行回数"""
+    return sum(1 for call in spy.call_args_list if call.args[0] == RENEW_SCRIPT)
+
+
+def test_acquire_lock_simple(fake_redis):
+    r = fake_redis
+    assert acquire_lock(r, "k", 10) is True
+    assert acquire_lock(r, "k", 10) is False
+
+
+def test_lease_is_exclusive_with_monotonic_tokens(fake_redis):
+    r = fake_redis
+    locks = LockManager(r, ttl_sec=30)
+    first = locks.acquire("lock:entry:1", heartbeat=False)
+    assert first is not None
+    assert 29000 < r.pttl("lock:entry:1") <= 30000
+    assert locks.acquire("lock:entry:1", heartbeat=False) is None
+
+    assert first.release() is True
+    second = locks.acquire("lock:entry:1", heartbeat=False)
+    assert second.token > first.token
+    assert int(r.get(fence_key("lock:entry:1"))) >= second.token
+
+
+def test_release_does_not_delete_other_owner(fake_redis):
+    r = fake_redis
+    locks = LockManager(r, ttl_sec=30)
+    stale = locks.acquire("k", heartbeat=False)
+    # TTL 切れ後に別のWorkerが取得
+    r.delete("k")
+    fresh = locks.acquire("k", heartbeat=False)
+    assert stale.release() is False
+    assert r.get("k") == fresh.value
+
+
+def test_heartbeat_renews_until_release(fake_redis, mocker):
+    r = fake_redis
+    spy = mocker.spy(r, "eval")
+    locks = LockManager(r, ttl_sec=1, renew_interval=0.02)
+    with locks.lease("k") as lease:
+        time.sleep(0.15)
+        assert renewals(spy) >= 3
+        lease.check()
+    assert not r.exists("k")
+    count = renewals(spy)
+    time.sleep(0.05)
+    assert renewals(spy) == count
+
+
+def test_lost_lease_detected_by_heartbeat(fake_redis):
+    r = fake_redis
+    locks = LockManager(r, ttl_sec=1, renew_interval=0.02)
+    with locks.lease("k") as lease:
+        r.delete("k")
+        other = locks.acquire("k", heartbeat=False)
+        deadline = time.time() + 2
+        while not lease.lost and time.time() < deadline:
+            time.sleep(0.01)
+        assert lease.lost
+        with pytest.raises(LeaseLostError):
+            lease.check()
+    # 失ったリースの解放で他のWorkerのロックを消さない
+    assert r.get("k") == other.value
+
+
+def test_renew_error_keeps_lease(fake_redis):
+    r = fake_redis
+    lease = LockManager(r, ttl_sec=30).acquire("k", heartbeat=False)
+    r.eval = MagicMock(side_effect=ConnectionError("redis down"))
+    assert lease.renew() is True
+    assert lease.lost is False
+
+
+def test_update_entry_fencing():
+    db = MagicMock()
+    cursor = db.cursor.return_value
+    cursor.rowcount = 0
+    assert update_entry(db, 7, "t", "s", 0, None, 0, None, fence_token=5) is False
+    sql, params = cursor.execute.call_args[0]
+    assert "lock_token <= %s" in sql
+    assert params[-3:] == [5, 7, 5]
+
+    cursor.rowcount = 1
+    assert update_entry(db, 7, "t", "s", 0, None, 0, None, fence_token=6) is True
+    # トークンなしは従来どおり無条件に更新
+    cursor.rowcount = 0
+    assert update_entry(db, 7, "t", "s", 0, None, 0, None) is True
+    assert "lock_token" not in cursor.execute.call_args[0][0]
@@ -0,0 +1,57 @@
+"""
+Worker メインループ（main.py）のテスト
+"""
+
+import json
+
+import pytest
+
+import main
+from app.audio_pool import AudioPool
+from app.circuit import CircuitOpenError
+from app.retry import delayed_key
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def worker(fake_redis):
+    worker = main.Worker()
+    worker.redis_client = fake_redis
+    worker.settings = {"s3_bucket": "bucket"}
+    worker.audio_pool = AudioPool(workers=1).start()
+    yield worker
+    worker.audio_pool.shutdown()
+
+
+def run_pooled(mocker, worker, error):
+    def enhance(*args):
+        raise error
+
+    mocker.patch("main.process_audio_enhancement",
+                 side_effect=lambda *args: worker.audio_pool.submit(enhance))
+    worker.handle_job({"type": "AUDIO_ENHANCEMENT", "entryId": 1, "enhancementTypes": ["denoise"]})
+    worker.audio_pool.shutdown()
+    return [json.loads(raw) for raw in worker.redis_client.zrange(delayed_key(), 0, -1)]
+
+
+def test_pooled_retryable_error_is_scheduled_for_retry(mocker, worker):
+    delayed = run_pooled(mocker, worker, RateLimitError("slow down"))
+    assert [(job["entryId"], job["attempts"]) for job in delayed] == [(1, 1)]
+
+
+def test_pooled_circuit_open_is_deferred(mocker, worker):
+    delayed = run_pooled(mocker, worker, CircuitOpenError("storage", 30))
+    assert [job["entryId"] for job in delayed] == [1]
+    assert "attempts" not in delayed[0]
+
+
+def test_full_pool_requeues(mocker, worker):
+    mocker.patch("main.process_audio_enhancement", return_value=False)
+    requeue = mocker.patch("main.enqueue_job")
+    job = {"type": "AUDIO_ENHANCEMENT", "entryId": 2}
+
+    worker.handle_job(job)
+    requeue.assert_called_once_with(worker.redis_client, job)
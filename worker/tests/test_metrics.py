@@ -0,0 +1,88 @@
+"""
+Metrics Tests
+"""
+
+import urllib.request
+
+import pytest
+
+from app.metrics import (
+    Registry, Histogram, stage_timer, job_timer, add_bytes, add_tokens,
+    current_job, current_stage, start_metrics_server, timed_job
+)
+
+
+def test_histogram_buckets_and_quantiles():
+    hist = Histogram(buckets=(1, 5, 10))
+    for v in range(1, 101):
+        hist.observe(v / 10)
+
+    assert hist.count == 100
+    assert hist.counts == [10, 40, 50, 0]
+    q = hist.quantiles()
+    assert q[0.5] == pytest.approx(5.1)
+    assert q[0.95] == pytest.approx(9.6)
+    assert q[0.99] == pytest.approx(10.0)
+
+
+def test_stage_and_job_timers_record_with_labels():
+    registry = Registry()
+
+    with job_timer('process_entry', registry):
+        assert current_job.get() == 'process_entry'
+        with stage_timer('stt', registry=registry):
+            assert current_stage.get() == 'stt'
+            add_bytes('stt', 1000, 'out', registry)
+        add_tokens('transcript', 42, registry=registry)
+        with pytest.raises(RuntimeError):
+            with stage_timer('summary', registry=registry):
+                raise RuntimeError('boom')
+
+    assert current_job.get() is None and current_stage.get() is None
+    assert registry.histogram('worker_stage_seconds', job='process_entry', stage='stt').count == 1
+    assert registry.counter_value('worker_stage_errors_total', job='process_entry', stage='summary') == 1
+    assert registry.counter_value('worker_bytes_total', job='process_entry', stage='stt', direction='out') == 1000
+    assert registry.counter_value('worker_tokens_total', job='process_entry', stage='transcript', kind='text') == 42
+    assert registry.counter_value('worker_jobs_total', job='process_entry', status='ok') == 1
+
+
+def test_timed_job_counts_errors(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr('app.metrics.REGISTRY', registry)
+
+    @timed_job('custom_summary')
+    def fail():
+        raise ValueError('x')
+
+    with pytest.raises(ValueError):
+        fail()
+    assert registry.counter_value('worker_jobs_total', job='custom_summary', status='error') == 1
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    registry.observe('worker_stage_seconds', 0.2, help_text='Stage latency', job='j', stage='s')
+    registry.inc('worker_bytes_total', 10, job='j', stage='s', direction='in')
+
+    text = registry.render()
+
+    assert '# TYPE worker_bytes_total counter' in text
+    assert 'worker_bytes_total{direction="in",job="j",stage="s"} 10' in text
+    assert '# HELP worker_stage_seconds Stage latency' in text
+    assert 'worker_stage_seconds_bucket{job="j",stage="s",le="0.1"} 0' in text
+    assert 'worker_stage_seconds_bucket{job="j",stage="s",le="0.25"} 1' in text
+    assert 'worker_stage_seconds_bucket{job="j",stage="s",le="+Inf"} 1' in text
+    assert 'worker_stage_seconds_count{job="j",stage="s"} 1' in text
+    assert 'worker_stage_seconds_quantile{job="j",stage="s",quantile="0.99"} 0.2' in text
+
+
+def test_metrics_endpoint():
+    registry = Registry()
+    registry.inc('worker_jobs_total', job='j', status='ok')
+    server = start_metrics_server(0, addr='127.0.0.1', registry=registry)
+    try:
+        port = server.server_address[1]
+        body = urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics').read().decode()
+        assert 'worker_jobs_total{job="j",status="ok"} 1' in body
+    finally:
+        server.shutdown()
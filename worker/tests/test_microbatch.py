@@ -0,0 +1,139 @@
+"""
+LLM マイクロバッチのテスト
+"""
+
+import json
+
+from app import backfill, microbatch
+from app.microbatch import (
+    BATCH_TASKS,
+    analyze_batch,
+    analyze_one,
+    build_batch_api_requests,
+    build_batch_messages,
+    chunk_items,
+    parse_batch_api_output,
+    parse_batch_response,
+)
+
+EMOTION = {"primary_emotion": "joy", "emotions": {"joy": 0.8}, "valence": 0.7, "arousal": 0.5, "dominance": 0.4}
+KEYWORDS = {"keywords": ["ランチ"], "topics": ["友人"]}
+
+
+def _response(*results):
+    return json.dumps({"results": list(results)}, ensure_ascii=False)
+
+
+def test_messages_share_one_system_prompt():
+    messages = build_batch_messages([(1, "今日は晴れ"), (2, "仕事で疲れた")], ("emotion",))
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert '"emotion"' in messages[0]["content"]
+    assert '"keywords"' not in messages[0]["content"]
+    assert json.loads(messages[1]["content"]) == {
+        "entries": [{"id": "1", "text": "今日は晴れ"}, {"id": "2", "text": "仕事で疲れた"}]
+    }
+
+
+def test_parse_demultiplexes_by_id():
+    content = _response(
+        {"id": "2", "emotion": EMOTION, "keywords": KEYWORDS, "tags": ["#仕事"]},
+        {"id": "1", "emotion": {"primary_emotion": "joy"}, "keywords": KEYWORDS},
+        {"id": "99", "keywords": KEYWORDS},
+    )
+    outputs = parse_batch_response(content, [1, 2])
+    # タグはローカルで抽出するため応答に含まれていても使わない
+    assert outputs[2] == {"emotion": EMOTION, "keywords": KEYWORDS}
+    # 形式が不正なタスクは除外、依頼していない id は無視
+    assert outputs[1] == {"keywords": KEYWORDS}
+    assert 99 not in outputs
+
+
+def test_parse_invalid_content():
+    assert parse_batch_response(None, [1]) == {}
+    assert parse_batch_response("not json", [1]) == {}
+    assert parse_batch_response('{"results": "x"}', [1]) == {}
+
+
+def test_analyze_batch_makes_one_request():
+    calls = []
+
+    def complete(messages, model, **kwargs):
+        calls.append((messages, model, kwargs))
+        return _response({"id": "a", "keywords": KEYWORDS}, {"id": "b", "emotion": EMOTION, "keywords": KEYWORDS})
+
+    outputs = analyze_batch([("a", "晴れ"), ("b", "雨")], model="m", complete=complete)
+    assert len(calls) == 1
+    assert calls[0][1] == "m"
+    assert calls[0][2]["response_format"] == {"type": "json_object"}
+    assert '"tags"' not in calls[0][0][0]["content"]
+    assert outputs == {"a": {"keywords": KEYWORDS}, "b": {"emotion": EMOTION, "keywords": KEYWORDS}}
+    assert BATCH_TASKS == ("emotion", "keywords")
+
+
+def test_chunk_items_limits():
+    items = [(i, "x" * 10) for i in range(5)]
+    assert [len(c) for c in chunk_items(items, max_batch=2)] == [2, 2, 1]
+    assert [len(c) for c in chunk_items(items, max_batch=10, max_chars=25)] == [2, 2, 1]
+    # 上限を超える1件は単独で送る
+    assert [len(c) for c in chunk_items([(1, "x" * 100), (2, "y")], max_chars=50)] == [1, 1]
+
+
+def test_batch_api_round_trip():
+    lines = build_batch_api_requests([(1, "a"), (2, "b"), (3, "c")], ("keywords",), model="m", max_batch=2)
+    requests = [json.loads(line) for line in lines]
+    assert [r["custom_id"] for r in requests] == ["entries:1,2", "entries:3"]
+    assert requests[0]["url"] == "/v1/chat/completions"
+    assert requests[0]["body"]["model"] == "m"
+
+    output = [
+        json.dumps({"custom_id": "entries:1,2", "response": {"status_code": 200, "body": {"choices": [
+            {"message": {"content": _response({"id": "1", "keywords": KEYWORDS}, {"id": "2", "keywords": KEYWORDS})}}
+        ]}}}),
+        json.dumps({"custom_id": "entries:3", "response": {"status_code": 500, "body": {}}}),
+        "",
+    ]
+    assert parse_batch_api_output(output, ("keywords",)) == {"1": {"keywords": KEYWORDS}, "2": {"keywords": KEYWORDS}}
+
+
+def test_backfill_llm_results_batched_with_fallback(monkeypatch):
+    monkeypatch.setenv("LLM_MICROBATCH", "1")
+    monkeypatch.setenv("LLM_MICROBATCH_MAX", "2")
+    batch_calls = []
+
+    def fake_analyze_batch(items, tasks):
+        batch_calls.append([item_id for item_id, _ in items])
+        return {item_id: {"emotion": EMOTION} for item_id, _ in items if item_id != 2}
+
+    single_calls = []
+
+    def fake_analyze_one(text, task):
+        single_calls.append(text)
+        return {"single": text}
+
+    monkeypatch.setattr(microbatch, "analyze_batch", fake_analyze_batch)
+    monkeypatch.setattr(microbatch, "analyze_one", fake_analyze_one)
+
+    rows = [{"id": i, "transcript_text": f"t{i}"} for i in (1, 2, 3)]
+    results = backfill._llm_results(rows, "emotion")
+    assert batch_calls == [[1, 2], [3]]
+    assert single_calls == ["t2"]
+    assert results == {1: EMOTION, 2: {"single": "t2"}, 3: EMOTION}
+
+
+def test_backfill_llm_results_disabled(monkeypatch):
+    monkeypatch.delenv("LLM_MICROBATCH", raising=False)
+    monkeypatch.setattr(microbatch, "analyze_one", lambda text, task: KEYWORDS)
+    rows = [{"id": 1, "transcript_text": "t"}]
+    assert backfill._llm_results(rows, "keywords") == {1: KEYWORDS}
+
+
+def test_analyze_one_uses_batch_prompt_for_a_single_task():
+    calls = []
+
+    def complete(messages, **kwargs):
+        calls.append(messages)
+        return _response({"id": "0", "keywords": KEYWORDS})
+
+    assert analyze_one("ランチに行った", "keywords", complete=complete) == KEYWORDS
+    assert '"emotion"' not in calls[0][0]["content"]
+    assert analyze_one("ランチに行った", "emotion", complete=complete) is None
@@ -0,0 +1,115 @@
+"""
+Pipeline Tests
+"""
+
+import threading
+import time
+
+from app.pipelines.base import Pipeline, PipelineStep, ParallelSteps, DictStepCache
+
+
+class SetStep(PipelineStep):
+    def __init__(self, name, key, value, delay=0, run_if=None, cached=False, calls=None):
+        self.name = name
+        self.outputs = (key,)
+        self.key = key
+        self.value = value
+        self.delay = delay
+        self.run_if = run_if
+        self.cached = cached
+        self.calls = calls if calls is not None else []
+
+    def should_run(self, context):
+        return self.run_if is None or self.run_if(context)
+
+    def cache_key(self, context):
+        return f"{self.name}:{context.get('text')}" if self.cached else None
+
+    def execute(self, context):
+        self.calls.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        context[self.key] = self.value
+        return context
+
+
+class FailStep(PipelineStep):
+    name = 'fail'
+
+    def execute(self, context):
+        raise ValueError('boom')
+
+
+class HaltStep(PipelineStep):
+    name = 'halt'
+
+    def execute(self, context):
+        context['halt'] = 'not_found'
+        return context
+
+
+def test_sequential_run_records_timings_and_skips():
+    pipeline = Pipeline([
+        SetStep('a', 'flagged', 1),
+        SetStep('b', 'summary', 'x', run_if=lambda c: c['flagged'] == 0),
+        SetStep('c', 'done', True),
+    ])
+
+    context = pipeline.run({'text': 't'})
+
+    assert 'summary' not in context and context['done'] is True
+    assert context['step_timings']['b'] is None
+    assert context['step_timings']['a'] >= 0
+
+
+def test_error_short_circuits_with_exception():
+    after = SetStep('after', 'x', 1)
+    context = Pipeline([SetStep('a', 'y', 1), FailStep(), after]).run({})
+
+    assert context['error']['step'] == 'FailStep'
+    assert isinstance(context['error']['exception'], ValueError)
+    assert after.calls == []
+
+
+def test_halt_stops_without_error():
+    after = SetStep('after', 'x', 1)
+    context = Pipeline([HaltStep(), after]).run({})
+
+    assert context['halt'] == 'not_found' and 'error' not in context
+    assert after.calls == []
+
+
+def test_cache_hook_restores_outputs():
+    cache = DictStepCache()
+    calls = []
+
+    for _ in range(2):
+        context = Pipeline([SetStep('llm', 'tags', ['#仕事'], cached=True, calls=calls)], cache=cache).run({'text': 't'})
+        assert context['tags'] == ['#仕事']
+
+    assert len(calls) == 1
+    assert context['step_timings']['llm'] == 0.0
+
+
+def test_none_output_is_not_cached():
+    cache = DictStepCache()
+    Pipeline([SetStep('llm', 'emotion', None, cached=True)], cache=cache).run({'text': 't'})
+    assert cache.data == {}
+
+
+def test_parallel_steps_run_concurrently_and_merge_outputs():
+    steps = [SetStep(f's{i}', f'out{i}', i, delay=0.1) for i in range(4)]
+    start = time.perf_counter()
+
+    context = Pipeline([ParallelSteps(steps)]).run({'text': 't'})
+
+    assert time.perf_counter() - start < 0.3
+    assert [context[f'out{i}'] for i in range(4)] == [0, 1, 2, 3]
+    assert set(context['step_timings']) >= {'s0', 's1', 's2', 's3', 'parallel'}
+    assert len({step.calls[0] for step in steps}) == 4
+
+
+def test_parallel_error_reports_failing_step():
+    context = Pipeline([ParallelSteps([SetStep('ok', 'x', 1), FailStep()]), SetStep('after', 'y', 1)]).run({})
+
+    assert context['error']['step'] == 'FailStep'
+    assert 'y' not in context
@@ -0,0 +1,101 @@
+"""
+オンデマンドプロファイラのテスト
+"""
+
+import json
+import pstats
+import threading
+
+from app.profiler import CONTROL_KEY, Profiler, StackSampler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+def make_profiler(tmp_path, clock):
+    return Profiler(output_dir=str(tmp_path), worker="w1", clock=clock)
+
+
+def test_sampler_collapses_stacks_and_skips_idle_pool_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=1)
+    pool.submit(lambda: None).result()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="job")
+    thread.start()
+    try:
+        sampler = StackSampler()
+        for _ in range(5):
+            sampler.sample()
+    finally:
+        stop.set()
+        thread.join()
+        pool.shutdown()
+
+    lines = sampler.collapsed().splitlines()
+    job_stacks = [line for line in lines if line.startswith("job;")]
+    assert job_stacks and all("busy_loop" in line for line in job_stacks)
+    assert not any("_worker" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_control_key_starts_time_bounded_session(tmp_path, fake_redis):
+    r = fake_redis
+    clock = Clock()
+    profiler = make_profiler(tmp_path, clock)
+    r.set(CONTROL_KEY, json.dumps({"id": "p1", "seconds": 10, "mode": "cprofile", "memory": True}))
+
+    profiler.poll(r)
+    assert profiler.session is not None
+    with profiler.scope():
+        sum(range(1000))
+
+    clock.now = 9
+    profiler.poll(r)
+    assert profiler.session is not None
+    clock.now = 10
+    profiler.poll(r)
+    assert profiler.session is None
+
+    written = sorted(p.name for p in tmp_path.iterdir())
+    assert [name.split("-w1.")[1] for name in written] == ["prof", "tracemalloc.txt"]
+    stats = pstats.Stats(str(tmp_path / written[0]))
+    assert stats.total_calls > 0
+
+    # 同じ id では再実行しない
+    clock.now = 20
+    profiler.poll(r)
+    assert profiler.session is None
+
+
+def test_signal_request_and_limits(tmp_path):
+    clock = Clock()
+    profiler = make_profiler(tmp_path, clock)
+    profiler.request(seconds=10000)
+    profiler.poll()
+    assert profiler.session.deadline == profiler.max_sec
+
+    written = profiler.stop()
+    assert len(written) == 1 and written[0].endswith(".collapsed")
+
+    profiler.request(mode="perf")
+    profiler.poll()
+    assert profiler.session is None
+
+
+def test_scope_is_noop_without_session(tmp_path):
+    profiler = make_profiler(tmp_path, Clock())
+    with profiler.scope():
+        pass
+    assert profiler.stop() == []
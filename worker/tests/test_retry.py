@@ -0,0 +1,100 @@
+"""
+遅延リトライのテスト
+"""
+
+import json
+
+from app.retry import (
+    POLICIES,
+    backoff_delay,
+    classify_error,
+    is_retryable,
+    dead_key,
+    delayed_key,
+    poll_timeout,
+    promote_due,
+    schedule_retry,
+)
+
+QUEUE = "jobs:default"
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"http {status}")
+        self.http_status = status
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def test_classify_error():
+    assert classify_error(HttpError(429)) == "rate_limit"
+    assert classify_error(RateLimitError("slow down")) == "rate_limit"
+    assert classify_error(HttpError(503)) == "transient"
+    assert classify_error(TimeoutError()) == "transient"
+    assert classify_error(json.JSONDecodeError("bad", "x", 0)) == "parse"
+    assert classify_error(KeyError("entryId")) == "not_found"
+    assert classify_error(HttpError(404)) == "not_found"
+    assert classify_error(RuntimeError("?")) == "unknown"
+
+
+def test_is_retryable():
+    assert is_retryable(HttpError(429))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(KeyError("entryId"))
+    assert not is_retryable(RuntimeError("?"))
+
+
+def test_backoff_grows_and_is_capped():
+    policy = POLICIES["transient"]
+    assert backoff_delay(policy, 1, rand=lambda: 1.0) == policy.base_delay_sec
+    assert backoff_delay(policy, 3, rand=lambda: 1.0) == policy.base_delay_sec * 4
+    assert backoff_delay(policy, 3, rand=lambda: 0.0) == policy.base_delay_sec * 2
+    assert backoff_delay(policy, 50, rand=lambda: 1.0) == policy.max_delay_sec
+
+
+def test_schedule_and_promote(fake_redis):
+    r = fake_redis
+    job = {"type": "PROCESS_ENTRY", "entryId": 1}
+    error_class, delay = schedule_retry(r, job, HttpError(503), now=1000, rand=lambda: 1.0)
+    assert error_class == "transient"
+    assert delay == POLICIES["transient"].base_delay_sec
+    assert r.llen(QUEUE) == 0
+
+    # 期限前は移さない
+    assert promote_due(r, now=1000 + delay - 1) == 0
+    assert promote_due(r, now=1000 + delay) == 1
+    promoted = json.loads(r.lindex(QUEUE, 0))
+    assert promoted["entryId"] == 1
+    assert promoted["attempts"] == 1
+    assert "503" in promoted["lastError"]
+    assert r.zcard(delayed_key()) == 0
+
+
+def test_exhausted_retries_go_to_dead_letter(fake_redis):
+    r = fake_redis
+    job = {"type": "PROCESS_ENTRY", "entryId": 1, "attempts": POLICIES["parse"].max_retries}
+    error_class, delay = schedule_retry(r, job, ValueError("bad json"), now=0)
+    assert (error_class, delay) == ("parse", None)
+    dead = json.loads(r.lindex(dead_key(), 0))
+    assert dead["errorClass"] == "parse"
+    assert dead["job"]["entryId"] == 1
+
+
+def test_not_found_is_not_retried(fake_redis):
+    r = fake_redis
+    _, delay = schedule_retry(r, {"type": "PROCESS_ENTRY"}, KeyError("entryId"), now=0)
+    assert delay is None
+    assert r.zcard(delayed_key()) == 0
+
+
+def test_poll_timeout_tracks_next_due_job(fake_redis):
+    r = fake_redis
+    assert poll_timeout(r, now=0) == 30
+    r.zadd(delayed_key(), {"a": 10.0})
+    assert poll_timeout(r, now=0) == 11
+    assert poll_timeout(r, now=20) == 1
+    r.zadd(delayed_key(), {"a": 1000.0})
+    assert poll_timeout(r, now=0) == 30
@@ -0,0 +1,64 @@
+"""
+Speech Analyzer Tests
+"""
+
+import pytest
+
+from app.speech_analyzer import (
+    FILLER_WORDS, FillerMatcher, analyze_speech, analyze_speech_batch,
+    get_speech_quality_score, get_speech_quality_score_batch, iter_speech_batch
+)
+
+SAMPLE_TEXTS = [
+    "今日は会議で新しいプロジェクトについて話し合いました。田中さんが来週までに企画書を作成することになりました。",
+    "あー、えっと、その、なんか、まあ、ちょっと、やっぱり難しいと思うんですけど、あの、頑張ります。",
+    "Today I had a meeting. Then I went home and cooked dinner with my family!",
+    "まあー そのあの えーえー",
+    "短い",
+    "",
+    None,
+]
+
+
+def test_filler_matcher_matches_per_word_count():
+    for text in SAMPLE_TEXTS:
+        expected = sum((text or '').count(w) for w in FILLER_WORDS)
+        assert FillerMatcher(FILLER_WORDS).count(text) == expected
+
+
+def test_filler_matcher_counts_prefix_fillers_at_same_position():
+    matcher = FillerMatcher(['えー', 'えーっと'])
+    assert matcher.count('えーっと、えー') == 3
+
+
+def test_batch_matches_scalar_analysis():
+    durations = [30.0, None, 5.0, 0, None, None, None]
+    batch = analyze_speech_batch(SAMPLE_TEXTS, durations)
+
+    for text, duration, row in zip(SAMPLE_TEXTS, durations, iter_speech_batch(batch)):
+        expected = analyze_speech(text, duration)
+        assert row == pytest.approx(expected)
+
+
+def test_quality_score_batch_matches_scalar():
+    batch = analyze_speech_batch(SAMPLE_TEXTS)
+    scores = get_speech_quality_score_batch(batch)
+
+    assert len(scores) == len(SAMPLE_TEXTS)
+    for row, score in zip(iter_speech_batch(batch), scores.tolist()):
+        assert score == pytest.approx(get_speech_quality_score(row))
+
+
+def test_quality_score_batch_boundaries():
+    analysis = {
+        'speech_rate': [120, 110, 90, 300],
+        'filler_word_rate': [0.0, 0.07, 0.12, 0.2],
+        'avg_sentence_length': [15, 12, 45, 20],
+        'vocabulary_diversity': [0.5, 0.45, 0.35, 0.1],
+    }
+    assert get_speech_quality_score_batch(analysis).tolist() == [1.0, 0.8, 0.6, 0.52]
+
+
+def test_empty_batch():
+    batch = analyze_speech_batch([])
+    assert all(len(v) == 0 for v in batch.values())
@@ -0,0 +1,41 @@
+"""
+Stage Fingerprint Tests
+"""
+
+import pytest
+
+from app.stage_versions import stage_fingerprint, resource_version
+
+
+@pytest.fixture
+def resources_dir(tmp_path):
+    (tmp_path / 'tag_rules.txt').write_text('仕事|会社 -> #仕事\n', encoding='utf-8')
+    (tmp_path / 'ng_topics.txt').write_text('暴力\n', encoding='utf-8')
+    (tmp_path / 'non_save_words.txt').write_text('パスワード\n', encoding='utf-8')
+    return tmp_path
+
+
+def test_fingerprint_depends_on_text(resources_dir):
+    a = stage_fingerprint('tags', '今日は仕事', resources_dir=resources_dir)
+    assert a == stage_fingerprint('tags', '今日は仕事', resources_dir=resources_dir)
+    assert a != stage_fingerprint('tags', '今日は休み', resources_dir=resources_dir)
+
+
+def test_dictionary_update_only_changes_dependent_stages(resources_dir):
+    tags_before = stage_fingerprint('tags', 'text', resources_dir=resources_dir)
+    ng_before = stage_fingerprint('ng', 'text', resources_dir=resources_dir)
+
+    (resources_dir / 'ng_topics.txt').write_text('暴力\n違法\n', encoding='utf-8')
+
+    assert stage_fingerprint('tags', 'text', resources_dir=resources_dir) == tags_before
+    assert stage_fingerprint('ng', 'text', resources_dir=resources_dir) != ng_before
+
+
+def test_model_only_affects_llm_stages(resources_dir):
+    assert stage_fingerprint('tags', 't', model='a', resources_dir=resources_dir) == \
+        stage_fingerprint('tags', 't', model='b', resources_dir=resources_dir)
+    assert stage_fingerprint('emotion', 't', model='a') != stage_fingerprint('emotion', 't', model='b')
+
+
+def test_missing_resource_file_is_stable(tmp_path):
+    assert resource_version('tags', tmp_path) == resource_version('tags', tmp_path)
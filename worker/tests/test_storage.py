@@ -0,0 +1,193 @@
+"""
+Storage Tests
+"""
+
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import Mock
+
+from app.storage import (
+    LOCK_STRIPES,
+    ObjectCache,
+    content_type_for,
+    derive_variant_key,
+    fetch_object,
+    put_stream,
+    release_object,
+)
+
+
+@pytest.mark.parametrize('ext', ['m4a', 'mp3', 'wav', 'mp4', 'webm', 'ogg', 'aac'])
+def test_variant_key_never_overwrites_source(ext):
+    source = f'audio/1/2024/rec.{ext}'
+    key = derive_variant_key(source, 'denoise', 'mp3')
+    assert key == 'audio/1/2024/rec_denoise.mp3'
+    assert key != source
+
+
+def test_variant_key_edge_cases():
+    assert derive_variant_key('audio/1/rec', 'enhance', 'mp3') == 'audio/1/rec_enhance.mp3'
+    assert derive_variant_key('audio/v1.2/rec.m4a', 'enhance', '.MP3') == 'audio/v1.2/rec_enhance.mp3'
+    assert derive_variant_key('rec_denoise.mp3', 'denoise', 'mp3') != 'rec_denoise.mp3'
+    with pytest.raises(ValueError):
+        derive_variant_key('rec.mp3', '', 'mp3')
+
+
+def test_content_type_for():
+    assert content_type_for('mp3') == 'audio/mpeg'
+    assert content_type_for('.FLAC') == 'audio/flac'
+    assert content_type_for('xyz') == 'application/octet-stream'
+
+
+def test_put_stream_bytes_and_file(tmp_path):
+    m = Mock()
+    put_stream(m, 'audio', 'a/rec_denoise.mp3', b'abc', part_size=5 * 1024 * 1024, parallel=3)
+    _, kwargs = m.put_object.call_args
+    args = m.put_object.call_args[0]
+    assert args[:2] == ('audio', 'a/rec_denoise.mp3') and args[3] == 3
+    assert kwargs == {'content_type': 'audio/mpeg', 'part_size': 5 * 1024 * 1024, 'num_parallel_uploads': 3}
+
+    path = tmp_path / 'out.wav'
+    path.write_bytes(b'RIFF1234')
+    m.put_object.side_effect = lambda bucket, key, data, length, **kw: (data.read(), length, kw['content_type'])
+    assert put_stream(m, 'audio', 'a/out.wav', str(path)) == (b'RIFF1234', 8, 'audio/wav')
+
+
+def test_put_stream_generator_uses_unknown_length():
+    m = Mock()
+    m.put_object.side_effect = lambda bucket, key, data, length, **kw: (data.read(4), data.read(), length)
+
+    assert put_stream(m, 'audio', 'k.ogg', (c for c in [b'ab', b'cd', b'ef'])) == (b'abcd', b'ef', -1)
+
+
+class FakeObject:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, amt):
+        for i in range(0, len(self.data), amt):
+            yield self.data[i:i + amt]
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """ETag 付きのオブジェクトを返す MinIO（ダウンロード回数を数える）"""
+
+    def __init__(self, objects, delay=0):
+        self.objects = objects
+        self.delay = delay
+        self.downloads = []
+        self.stats = []
+
+    def stat_object(self, bucket, key):
+        self.stats.append(key)
+        data = self.objects[key]
+        return Mock(etag=f'etag-{hash(data)}', size=len(data))
+
+    def get_object(self, bucket, key):
+        import time
+        time.sleep(self.delay)
+        self.downloads.append(key)
+        return FakeObject(self.objects[key])
+
+
+def test_cache_hit_uses_mmap_without_download(tmp_path):
+    m = FakeMinio({'a.m4a': b'x' * 100})
+    cache = ObjectCache(str(tmp_path), max_bytes=1000)
+
+    first = cache.get(m, 'audio', 'a.m4a')
+    second = cache.get(m, 'audio', 'a.m4a')
+
+    assert bytes(first) == bytes(second) == b'x' * 100
+    assert isinstance(second, mmap.mmap)
+    assert m.downloads == ['a.m4a']
+
+
+def test_cache_key_includes_etag(tmp_path):
+    m = FakeMinio({'a.m4a': b'old'})
+    cache = ObjectCache(str(tmp_path), max_bytes=1000, etag_ttl_sec=0)
+    cache.get(m, 'audio', 'a.m4a')
+
+    m.objects['a.m4a'] = b'new'
+    assert bytes(cache.get(m, 'audio', 'a.m4a')) == b'new'
+    assert len(m.downloads) == 2
+
+
+def test_lru_eviction_by_total_bytes(tmp_path):
+    m = FakeMinio({'a': b'a' * 400, 'b': b'b' * 400, 'c': b'c' * 400})
+    cache = ObjectCache(str(tmp_path), max_bytes=900)
+
+    cache.get(m, 'audio', 'a')
+    cache.get(m, 'audio', 'b')
+    # a を最近使ったことにする（b の方が古い）
+    paths = {p.read_bytes()[:1]: p for p in tmp_path.glob('*.bin')}
+    os.utime(paths[b'a'], (2, 2))
+    os.utime(paths[b'b'], (1, 1))
+    cache.get(m, 'audio', 'c')  # b が追い出される
+
+    assert sum(p.stat().st_size for p in tmp_path.glob('*.bin')) == 800
+    # ロックファイルは追い出さない（flock の対象が入れ替わらないように）
+    assert len(list(tmp_path.glob('*.lock'))) == 3
+    cache.get(m, 'audio', 'a')
+    cache.get(m, 'audio', 'b')
+    assert m.downloads == ['a', 'b', 'c', 'b']
+
+
+def test_concurrent_fills_download_once(tmp_path):
+    m = FakeMinio({'a.m4a': b'z' * 1000}, delay=0.05)
+    cache = ObjectCache(str(tmp_path), max_bytes=10000)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: bytes(cache.get(m, 'audio', 'a.m4a')), range(8)))
+
+    assert results == [b'z' * 1000] * 8
+    assert m.downloads == ['a.m4a']
+
+
+def test_known_etag_skips_stat_until_ttl(tmp_path):
+    now = [0.0]
+    m = FakeMinio({'a.m4a': b'old'})
+    cache = ObjectCache(str(tmp_path), max_bytes=1000, etag_ttl_sec=60, clock=lambda: now[0])
+
+    cache.get(m, 'audio', 'a.m4a')
+    m.objects['a.m4a'] = b'new'
+    assert bytes(cache.get(m, 'audio', 'a.m4a')) == b'old'
+    assert m.stats == ['a.m4a']
+
+    now[0] = 60.0
+    assert bytes(cache.get(m, 'audio', 'a.m4a')) == b'new'
+    assert m.stats == ['a.m4a', 'a.m4a']
+
+
+def test_thread_locks_are_bounded(tmp_path):
+    m = FakeMinio({str(i): b'x' for i in range(200)})
+    cache = ObjectCache(str(tmp_path), max_bytes=10000)
+    for i in range(200):
+        cache.get(m, 'audio', str(i))
+    assert len(cache._locks) == LOCK_STRIPES
+
+
+def test_release_object_closes_mmap(tmp_path):
+    m = FakeMinio({'a.m4a': b'x' * 100})
+    data = fetch_object(m, 'audio', 'a.m4a', cache=ObjectCache(str(tmp_path), max_bytes=1000))
+    release_object(data)
+    assert data.closed
+    release_object(data)
+    release_object(b'raw')
+
+
+def test_fetch_object_without_cache(monkeypatch):
+    monkeypatch.delenv('OBJECT_CACHE_DIR', raising=False)
+    m = FakeMinio({'a.m4a': b'raw'})
+    assert fetch_object(m, 'audio', 'a.m4a') == b'raw'
@@ -0,0 +1,129 @@
+"""
+要約ストリーミングのテスト
+"""
+
+from unittest.mock import Mock
+
+import openai
+import pytest
+
+from app.circuit import reset_breakers
+from app.providers_openai import chat_completion
+from app.streaming import SummaryStream, stream_key, summary_stream
+from app.tokenizer import tokenize
+from app.usage import UsageRecorder
+
+
+def entries(r, key):
+    return [fields for _, fields in r.xrange(key)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def chunks(*texts):
+    for text in texts:
+        yield {"choices": [{"delta": {"content": text}}]}
+    yield {"choices": [{"delta": {}}]}
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+def test_deltas_are_flushed_per_interval(fake_redis):
+    r = fake_redis
+    clock = Clock()
+    stream = SummaryStream(r, "stream:range_summary:1", flush_interval_sec=0.1, ttl_sec=60, clock=clock)
+    stream.start()
+    stream.append("今日")
+    stream.append("は")
+    clock.now = 0.1
+    stream.append("晴れ")
+    stream.append("でした")
+    stream.finish()
+    assert entries(r, "stream:range_summary:1") == [
+        {"type": "start"},
+        {"type": "delta", "text": "今日は晴れ"},
+        {"type": "delta", "text": "でした"},
+        {"type": "done"},
+    ]
+    assert 0 < r.ttl("stream:range_summary:1") <= 60
+
+
+def test_disabled_stream_is_noop(monkeypatch, fake_redis):
+    monkeypatch.delenv("SUMMARY_STREAMING", raising=False)
+    r = fake_redis
+    with summary_stream(r, stream_key("range_summary", 1)) as stream:
+        assert stream is None
+    assert r.keys() == []
+
+
+def test_chat_completion_streams_inside_scope(monkeypatch, fake_redis):
+    monkeypatch.setenv("SUMMARY_STREAMING", "1")
+    monkeypatch.setenv("SUMMARY_STREAM_FLUSH_MS", "0")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return chunks("要約", "です")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    recorder = UsageRecorder()
+    monkeypatch.setattr("app.usage.RECORDER", recorder)
+    r = fake_redis
+    key = stream_key("custom_summary", 5)
+    with summary_stream(r, key):
+        text = chat_completion([{"role": "user", "content": "今日は晴れでした"}])
+
+    assert text == "要約です"
+    assert calls[0]["stream"] is True
+    assert [e["type"] for e in entries(r, key)] == ["start", "delta", "delta", "done"]
+    assert "".join(e.get("text", "") for e in entries(r, key)) == "要約です"
+
+    # ストリーミング応答は使用量を返さないので推定値として記録する
+    db = Mock()
+    recorder.flush(db)
+    (row,) = db.cursor.return_value.executemany.call_args[0][1]
+    assert row[6] == len(tokenize("今日は晴れでした")) > 0
+    assert row[7] == 2
+    assert row[11] == 1
+
+
+def test_failure_closes_stream_with_error(monkeypatch, fake_redis):
+    monkeypatch.setenv("SUMMARY_STREAMING", "1")
+    r = fake_redis
+    key = stream_key("range_summary", 2)
+    with pytest.raises(RuntimeError):
+        with summary_stream(r, key) as stream:
+            stream.append("途中")
+            raise RuntimeError("db down")
+    assert entries(r, key)[-2:] == [{"type": "delta", "text": "途中"}, {"type": "error", "reason": "RuntimeError"}]
+
+
+def test_stream_error_mid_way_is_not_marked_done(monkeypatch, fake_redis):
+    monkeypatch.setenv("SUMMARY_STREAMING", "1")
+    monkeypatch.setenv("SUMMARY_STREAM_FLUSH_MS", "0")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    def create(**kwargs):
+        yield {"choices": [{"delta": {"content": "途中"}}]}
+        raise ConnectionResetError("reset")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    r = fake_redis
+    key = stream_key("custom_summary", 6)
+    with pytest.raises(ConnectionResetError), summary_stream(r, key):
+        chat_completion([{"role": "user", "content": "x"}])
+
+    assert [e["type"] for e in entries(r, key)] == ["start", "delta", "error"]
+    assert entries(r, key)[-1] == {"type": "error", "reason": "ConnectionResetError"}
@@ -0,0 +1,49 @@
+"""
+Tokenizer Tests
+"""
+
+from app.tokenizer import tokenize, clear_cache
+from app.tagger import Tagger
+from app.speech_analyzer import analyze_speech
+
+
+def test_japanese_text_is_segmented():
+    tokens = tokenize('今日は会議で新しいプロジェクトについて話し合いました。')
+    assert tokens[:5] == ('今日', 'は', '会議', 'で', '新しい')
+    assert 'プロジェクト' in tokens
+    assert '話し' in tokens
+
+
+def test_punctuation_and_case_are_normalized():
+    assert tokenize('Today I had a MEETING!') == ('today', 'i', 'had', 'a', 'meeting')
+    assert tokenize('ＡＢＣ、ｶﾀｶﾅ') == ('abc', 'カタカナ')
+    assert tokenize('') == ()
+    assert tokenize(None) == ()
+
+
+def test_longest_match_prefers_dictionary_words():
+    assert tokenize('今日はとても良い日でした') == ('今日', 'は', 'とても', '良い', '日', 'でした')
+
+
+def test_ngram_fallback():
+    assert tokenize('今日は会議室', mode='ngram') == ('今日', 'は', '会議', '議室')
+
+
+def test_results_are_memoized():
+    clear_cache()
+    text = '同じ文字起こしを何度もトークン化する'
+    assert tokenize(text) is tokenize(text)
+
+
+def test_speech_rate_counts_japanese_words():
+    text = '今日は会議で新しいプロジェクトについて話し合いました。'
+    result = analyze_speech(text, duration_seconds=60)
+    assert result['speech_rate'] == len(tokenize(text))
+    assert result['speech_rate'] > 1
+
+
+def test_tagger_matches_tokens_and_compounds():
+    tagger = Tagger()
+    assert tagger.extract_tags('定例会議室で打ち合わせ') == ['#仕事']
+    assert tagger.extract_tags('いい天気だった') == ['#天気']
+    assert tagger.extract_tags('') == []
@@ -0,0 +1,123 @@
+"""
+Usage Accounting Tests
+"""
+
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from app.metrics import job_timer, stage_timer, REGISTRY
+from app.usage import (
+    UsageRecorder, usage_context, bind_user, track_call, extract_usage, estimate_cost
+)
+
+
+def test_extract_usage_handles_sdk_shapes():
+    assert extract_usage({'usage': {'prompt_tokens': 10, 'completion_tokens': 5}}) == (10, 5)
+    assert extract_usage(SimpleNamespace(usage=SimpleNamespace(prompt_tokens=3, completion_tokens=4))) == (3, 4)
+    assert extract_usage({'text': 'no usage'}) == (0, 0)
+
+
+def test_estimate_cost():
+    assert estimate_cost('chat', 'gpt-4o-mini', 1_000_000, 1_000_000) == pytest.approx(0.75)
+    assert estimate_cost('stt', 'whisper-1', audio_seconds=120) == pytest.approx(0.012)
+    assert estimate_cost('chat', 'unknown-model', 10, 10) is None
+
+
+def test_records_job_stage_and_user_context():
+    recorder = UsageRecorder()
+
+    with usage_context(job_id=42), job_timer('process_entry'):
+        bind_user(7)
+        with stage_timer('summary'):
+            with track_call('chat', 'gpt-4o-mini', recorder=recorder) as call:
+                call.response = {'usage': {'prompt_tokens': 1200, 'completion_tokens': 300}}
+
+    db = Mock()
+    assert recorder.flush(db) == 1
+    (row,) = db.cursor.return_value.executemany.call_args[0][1]
+    assert row[:8] == ('process_entry', 42, 7, 'summary', 'chat', 'gpt-4o-mini', 1200, 300)
+    assert row[10] == pytest.approx((1200 * 0.15 + 300 * 0.60) / 1_000_000)
+    assert row[11] == 0
+    assert REGISTRY.counter_value('worker_llm_tokens_total', job='process_entry', stage='summary',
+                                  model='gpt-4o-mini', kind='prompt') >= 1200
+
+
+def test_failed_call_is_recorded_without_tokens():
+    recorder = UsageRecorder()
+    with pytest.raises(RuntimeError):
+        with track_call('stt', 'whisper-1', request_bytes=2048, recorder=recorder):
+            raise RuntimeError('timeout')
+
+    db = Mock()
+    recorder.flush(db)
+    (row,) = db.cursor.return_value.executemany.call_args[0][1]
+    assert row[3:9] == ('stt', 'stt', 'whisper-1', 0, 0, 2048)
+
+
+def test_flush_batches_by_size_and_age():
+    now = [0.0]
+    recorder = UsageRecorder(max_rows=3, max_age_sec=10, clock=lambda: now[0])
+    db = Mock()
+
+    recorder.record('chat', 'gpt-4o-mini', 1, 1)
+    assert recorder.maybe_flush(db) == 0
+    recorder.record('chat', 'gpt-4o-mini', 1, 1)
+    recorder.record('chat', 'gpt-4o-mini', 1, 1)
+    assert recorder.maybe_flush(db) == 3
+    assert db.cursor.return_value.executemany.call_count == 1
+
+    recorder.record('chat', 'gpt-4o-mini', 1, 1)
+    now[0] = 11
+    assert recorder.maybe_flush(db) == 1
+
+
+def test_failed_flush_keeps_rows():
+    recorder = UsageRecorder()
+    recorder.record('chat', 'gpt-4o-mini', 1, 1)
+    db = Mock()
+    db.cursor.return_value.executemany.side_effect = RuntimeError('db down')
+
+    assert recorder.flush(db) == 0
+    assert recorder.pending() == 1
+
+
+def test_buffer_is_capped_when_flushes_keep_failing():
+    recorder = UsageRecorder(max_buffer=3)
+    db = Mock()
+    db.cursor.return_value.executemany.side_effect = RuntimeError('db down')
+    for tokens in range(5):
+        recorder.record('chat', 'gpt-4o-mini', tokens, 0)
+        recorder.flush(db)
+
+    assert recorder.pending() == 3
+    db.cursor.return_value.executemany.side_effect = None
+    recorder.flush(db)
+    # 古い行から捨てる
+    rows = db.cursor.return_value.executemany.call_args[0][1]
+    assert [row[6] for row in rows] == [2, 3, 4]
+
+
+def test_stt_records_audio_seconds_for_cost(monkeypatch, tmp_path):
+    import openai
+    from app.circuit import reset_breakers
+    from app.providers_openai import stt_openai
+
+    reset_breakers()
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setattr(openai.Audio, 'transcribe', lambda **kwargs: {'text': 'こんにちは', 'duration': 90.0})
+    recorder = UsageRecorder()
+    monkeypatch.setattr('app.usage.RECORDER', recorder)
+    audio = tmp_path / 'a.flac'
+    audio.write_bytes(b'x' * 10)
+
+    assert stt_openai(str(audio)) == 'こんにちは'
+    assert stt_openai(str(audio), audio_seconds=30.0) == 'こんにちは'
+
+    db = Mock()
+    recorder.flush(db)
+    first, second = db.cursor.return_value.executemany.call_args[0][1]
+    # 指定がなければ verbose_json の duration を使う
+    assert first[10] == pytest.approx(0.006 * 90 / 60)
+    assert second[10] == pytest.approx(0.006 * 30 / 60)
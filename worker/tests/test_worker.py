@@ -0,0 +1,60 @@
+"""
+旧ワーカー（worker.py）のメインループのテスト
+"""
+
+import importlib
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.dispatch import QUEUE_KEY, enqueue_job, pending_key
+
+
+@pytest.fixture
+def legacy_worker(monkeypatch, fake_redis):
+    """接続先・クライアントをモックにして worker.py を読み込む（読み込み時に Redis・MySQL へ接続するため）"""
+    import mysql.connector
+    import openai
+    import redis
+
+    for name in ("REDIS_URL", "MYSQL_HOST", "MYSQL_USER", "MYSQL_PASSWORD", "MYSQL_DB", "S3_ACCESS_KEY",
+                 "S3_SECRET_KEY", "S3_BUCKET"):
+        monkeypatch.setenv(name, "test")
+    monkeypatch.setenv("S3_ENDPOINT", "http://minio:9000")
+    monkeypatch.setattr(redis, "from_url", lambda *a, **kw: fake_redis)
+    monkeypatch.setattr(mysql.connector, "connect", lambda **kw: MagicMock())
+    monkeypatch.setattr(openai, "OpenAI", MagicMock())
+    sys.modules.pop("worker", None)
+    module = importlib.import_module("worker")
+    yield module
+    sys.modules.pop("worker", None)
+
+
+def test_legacy_loop_claims_coalesced_ref(legacy_worker, fake_redis, mocker):
+    process_entry = mocker.patch.object(legacy_worker, "process_entry")
+    enqueue_job(fake_redis, {"type": "PROCESS_ENTRY", "entryId": 12})
+    enqueue_job(fake_redis, {"type": "PROCESS_ENTRY", "entryId": 12})
+    assert fake_redis.llen(QUEUE_KEY) == 1
+
+    legacy_worker.run_once()
+    process_entry.assert_called_once_with(12)
+    assert fake_redis.hlen(pending_key()) == 0
+    assert fake_redis.llen(QUEUE_KEY) == 0
+
+
+def test_legacy_stale_fenced_update_is_abandoned(legacy_worker, mocker, capsys):
+    cur = legacy_worker.db.cursor.return_value
+    cur.fetchone.return_value = {"id": 5, "audio_url": "http://minio:9000/test/audio/5.m4a",
+                                 "transcript_text": None, "summary_text": None}
+    cur.rowcount = 0
+    mocker.patch.object(legacy_worker, "stt", return_value="えーっと 今日は晴れ")
+    mocker.patch.object(legacy_worker, "summarize", return_value="晴れ")
+    legacy_worker.minio = MagicMock()
+
+    legacy_worker.process_entry(5)
+    assert "entry 5 abandoned" in capsys.readouterr().out
+
+    with pytest.raises(legacy_worker.LeaseLostError):
+        with legacy_worker.locks.lease("lock:entry:5") as lease:
+            legacy_worker._process_entry(5, lease)
@@ -1,9 +1,13 @@
-import os, json, time, re, io
+import os, time, re, io
 import redis
 import mysql.connector
 from minio import Minio
 from openai import OpenAI
 
+from app.dispatch import pop_job
+from app.locks import LeaseLostError, LockManager
+from app.retry import poll_timeout, promote_due, schedule_retry
+
 r = redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
 
 def connect_mysql():
@@ -41,9 +45,8 @@ minio = Minio(
 
 openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), timeout=90.0, max_retries=0)
 
-def lock(key: str, ttl_sec: int = 600) -> bool:
-    # NXでロック、落ちても自動解除
-    return bool(r.set(key, "1", nx=True, ex=ttl_sec))
+# リース方式のロック（保持中はハートビートで延長、落ちても TTL で自動解除）
+locks = LockManager(r)
 
 def clean_transcript_ja(text: str) -> str:
     fillers = [r"あー+", r"えー+", r"えっと+", r"えーっと+", r"うーん+", r"んー+", r"そのー+", r"なんか"]
@@ -79,9 +82,16 @@ def parse_audio_url(url: str):
     return S3_BUCKET, key
 
 def process_entry(entry_id: int):
-    if not lock(f"lock:entry:{entry_id}", 600):
-        return
+    with locks.lease(f"lock:entry:{entry_id}") as lease:
+        if lease is None:
+            return
+        try:
+            _process_entry(entry_id, lease)
+        except LeaseLostError as e:
+            # 他のWorkerが処理を引き継いでいるので、このWorkerの結果は捨てる
+            print(f"[worker] entry {entry_id} abandoned: {e}", flush=True)
 
+def _process_entry(entry_id: int, lease):
     cur = db.cursor(dictionary=True)
     cur.execute("SELECT id, audio_url, transcript_text, summary_text FROM entries WHERE id=%s", (entry_id,))
     e = cur.fetchone()
@@ -100,10 +110,15 @@ def process_entry(entry_id: int):
     cleaned = clean_transcript_ja(raw)
     summ = summarize(cleaned) if cleaned else None
 
+    # フェンシング: より新しいリースで書き込み済みなら上書きしない
+    lease.check()
     cur.execute(
-        "UPDATE entries SET transcript_text=%s, summary_text=%s WHERE id=%s",
-        (cleaned, summ, entry_id)
+        "UPDATE entries SET transcript_text=%s, summary_text=%s, lock_token=%s "
+        "WHERE id=%s AND (lock_token IS NULL OR lock_token <= %s)",
+        (cleaned, summ, lease.token, entry_id, lease.token)
     )
+    if cur.rowcount == 0:
+        raise LeaseLostError(f"entry {entry_id} was written with a newer lease (token={lease.token})")
 
 def set_failed(cur, summary_id: int, code: str, msg: str):
     cur.execute(
@@ -112,9 +127,12 @@ def set_failed(cur, summary_id: int, code: str, msg: str):
     )
 
 def process_range_summary(summary_id: int):
-    if not lock(f"lock:summary:{summary_id}", 1200):
-        return
+    with locks.lease(f"lock:summary:{summary_id}") as lease:
+        if lease is None:
+            return
+        _process_range_summary(summary_id)
 
+def _process_range_summary(summary_id: int):
     cur = db.cursor(dictionary=True)
 
     # ここで“処理権限”を奪い合う：queuedの時だけprocessingにする
@@ -153,23 +171,26 @@ def process_range_summary(summary_id: int):
         set_failed(cur, summary_id, type(e).__name__, f"{type(e).__name__}:{e}")
         raise
 
+def run_once():
+    promote_due(r)
+    # 集約されたジョブは参照だけが積まれているので、ペイロードを取得してから実行する
+    job = pop_job(r, poll_timeout(r))
+    if job is None:
+        return
+    t = job.get("type")
+    try:
+        if t == "PROCESS_ENTRY":
+            process_entry(int(job["entryId"]))
+        elif t == "PROCESS_RANGE_SUMMARY":
+            process_range_summary(int(job["summaryId"]))
+    except Exception as e:
+        error_class, delay = schedule_retry(r, job, e)
+        print(f"[worker] job failed type={t} class={error_class} retry_in={delay} err={type(e).__name__}:{e}", flush=True)
+
 def main():
     print("[worker] started", flush=True)
     while True:
-        popped = r.brpop("jobs:default", timeout=30)
-        if not popped:
-            continue
-        _, payload = popped
-        job = json.loads(payload)
-        t = job.get("type")
-        try:
-            if t == "PROCESS_ENTRY":
-                process_entry(int(job["entryId"]))
-            elif t == "PROCESS_RANGE_SUMMARY":
-                process_range_summary(int(job["summaryId"]))
-        except Exception as e:
-            print(f"[worker] job failed type={t} err={type(e).__name__}:{e}", flush=True)
-            time.sleep(1)
+        run_once()
 
 if __name__ == "__main__":
     main()